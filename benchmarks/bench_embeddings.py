@@ -0,0 +1,157 @@
+"""
+嵌入后端基准测试。
+
+在合成语料的文档块上比较 PyTorch 与 ONNX Runtime（fp32 / int8）嵌入后端：
+- 文档嵌入吞吐（chunks/s）与单条查询嵌入耗时
+- 与 PyTorch 嵌入的余弦相似度（最小值 / 平均值）
+- 以 PyTorch 嵌入的检索结果为基准的 recall@k
+
+需要真实的嵌入模型（首次运行时下载，或通过 --model-dir 指定本地目录）与 onnxruntime、onnx：
+
+    python -m benchmarks.bench_embeddings --docs 200 --output embeddings.json
+"""
+import sys
+import json
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from blog_rag.config import DEFAULT_CONFIG
+from blog_rag.rag_modules import DataPreparationModule
+from blog_rag.rag_modules.doc_store import iter_texts
+from blog_rag.rag_modules.onnx_embeddings import OnnxOptions, available_cpus, cosine_parity, load_onnx_embeddings
+
+from .bench_pipeline import compare, measure
+from .corpus import generate_corpus, sample_queries
+
+logger = logging.getLogger(__name__)
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, ref_queries: np.ndarray,
+                cand_queries: np.ndarray, k: int) -> float:
+    '''以参考嵌入的精确 top-k 为基准，计算候选嵌入检索结果的平均召回率'''
+    k = min(k, len(reference))
+    ref_top = np.argsort(-(ref_queries @ reference.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ candidate.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top.tolist(), cand_top.tolist())]))
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from huggingface_hub import snapshot_download
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_dir = args.model_dir or Path(snapshot_download(
+        args.model,
+        cache_dir=Path(DEFAULT_CONFIG.index_dir).parent / "models",
+        endpoint="https://hf-mirror.com",
+    ))
+    reference = HuggingFaceEmbeddings(model_name=str(model_dir), model_kwargs={"device": "cpu"},
+                                      encode_kwargs={"normalize_embeddings": True})
+    backends: Dict[str, Embeddings] = {"torch": reference}
+
+    stages: Dict[str, Dict[str, Any]] = {}
+    quality: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(prefix="rag-embeddings-") as tmp:
+        tmp_dir = Path(tmp)
+        for variant, quantize in (("onnx_fp32", False), ("onnx_int8", True)):
+            options = OnnxOptions(quantize=quantize, threads=args.threads, batch_size=args.batch_size,
+                                  parity_threshold=0.0)
+            backends[variant] = load_onnx_embeddings(model_dir, tmp_dir / "onnx", lambda: reference,
+                                                     options=options)
+
+        md_dir = generate_corpus(tmp_dir / "markdown", args.docs, sections=args.sections, seed=args.seed)
+        data = DataPreparationModule(md_dir, tmp_dir / "cache", workers=1)
+        data.generate_markdown()
+        texts = list(iter_texts(data._markdown_split()))
+        queries = sample_queries(args.queries, args.seed)
+
+        vectors: Dict[str, np.ndarray] = {}
+        query_vectors: Dict[str, np.ndarray] = {}
+        for name, embeddings in backends.items():
+            embeddings.embed_documents(texts[:args.batch_size])  # 预热
+            stages[f"{name}_documents"] = measure(lambda: embeddings.embed_documents(texts), args.repeat,
+                                                  items=len(texts))
+            stages[f"{name}_query"] = measure(lambda: [embeddings.embed_query(q) for q in queries], args.repeat,
+                                              items=len(queries))
+            vectors[name] = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+            query_vectors[name] = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+
+        for name in backends:
+            if name == "torch":
+                continue
+            quality[name] = {
+                **cosine_parity(reference, backends[name], texts[:args.parity_texts]),
+                f"recall@{args.top_k}": recall_at_k(vectors["torch"], vectors[name], query_vectors["torch"],
+                                                     query_vectors[name], args.top_k),
+            }
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model": str(args.model_dir or args.model),
+            "cpus": available_cpus(),
+            "threads": args.threads or available_cpus(),
+            "docs": args.docs,
+            "chunks": len(texts),
+            "seed": args.seed,
+        },
+        "stages": stages,
+        "quality": quality,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="嵌入后端基准测试")
+    parser.add_argument("--model", default=DEFAULT_CONFIG.embedding_model, help="嵌入模型标识")
+    parser.add_argument("--model-dir", type=Path, help="本地模型目录，指定时不下载模型")
+    parser.add_argument("--docs", type=int, default=100, help="合成文章数")
+    parser.add_argument("--sections", type=int, default=4, help="每篇文章的二级标题数")
+    parser.add_argument("--queries", type=int, default=50, help="查询数")
+    parser.add_argument("--top-k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX 后端的线程数，0 表示使用全部可用 CPU")
+    parser.add_argument("--batch-size", type=int, default=32, help="ONNX 后端每次推理的文本数")
+    parser.add_argument("--parity-texts", type=int, default=200, help="计算余弦相似度的文档块数")
+    parser.add_argument("--repeat", type=int, default=1, help="各阶段的重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="结果 JSON 的输出路径，省略时输出到标准输出")
+    parser.add_argument("--baseline", type=Path, help="基线结果 JSON，存在回退时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的中位耗时增幅")
+    args = parser.parse_args(argv)
+
+    # 导入 blog_rag 时已配置 INFO 级别日志，基准测试期间只保留警告
+    logging.getLogger("blog_rag").setLevel(logging.WARNING)
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    torch_rate = result["stages"]["torch_documents"]["items_per_s"]
+    for name, stats in result["stages"].items():
+        speedup = ""
+        if name.endswith("_documents") and torch_rate:
+            speedup = f"  {stats['items_per_s'] / torch_rate:5.2f}x"
+        print(f"{name:>20}: median {stats['median_ms']:10.3f}ms{speedup}", file=sys.stderr)
+    for name, values in result["quality"].items():
+        print(f"{name:>20}: " + "  ".join(f"{k} {v:.4f}" for k, v in values.items() if k != "texts"),
+              file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            logger.error(f"性能回退 {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
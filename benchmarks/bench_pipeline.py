@@ -0,0 +1,219 @@
+"""
+RAG 流水线分阶段基准测试。
+
+在合成语料上分别计时各阶段（Markdown 解析、切分、嵌入、FAISS 构建/保存/加载、BM25 构建、
+混合检索、结果融合、上下文拼接），默认使用确定性的假嵌入模型，结果以 JSON 输出，
+可与基线结果比较以发现性能回退：
+
+    python -m benchmarks.bench_pipeline --docs 500 --output bench.json
+    python -m benchmarks.bench_pipeline --docs 500 --baseline bench.json --tolerance 0.25
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from blog_rag.rag_modules import (
+    DataPreparationModule,
+    GenerationIntegrationModule,
+    IndexConstructionModule,
+    RetrievalOptimizationModule,
+)
+from blog_rag.rag_modules.bm25_index import BM25Index
+from blog_rag.rag_modules.cache import LRUCache
+from blog_rag.rag_modules.doc_store import iter_texts
+from blog_rag.rag_modules.fusion import FusionOptions, fuse
+
+from .corpus import generate_corpus, sample_queries
+
+logger = logging.getLogger(__name__)
+
+
+class LookupEmbeddings(Embeddings):
+    """按文本查表的嵌入模型：复用嵌入阶段的结果，使索引构建阶段只计量 FAISS 本身的开销"""
+    def __init__(self, base: Embeddings) -> None:
+        self.base = base
+        self.table: Dict[str, List[float]] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [t for t in texts if t not in self.table]
+        if missing:
+            self.table.update(zip(missing, self.base.embed_documents(missing)))
+        return [self.table[t] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+
+def measure(fn: Callable[[], Any], repeat: int, items: int | None = None) -> Dict[str, Any]:
+    '''执行 fn repeat 次，返回耗时统计（毫秒）；items 为单次处理的条目数，用于计算吞吐'''
+    durations: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return summarize(durations, items)
+
+
+def summarize(durations: List[float], items: int | None = None) -> Dict[str, Any]:
+    ordered = sorted(durations)
+    median = statistics.median(ordered)
+    stats: Dict[str, Any] = {
+        "n": len(ordered),
+        "min_ms": ordered[0],
+        "median_ms": median,
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "mean_ms": statistics.fmean(ordered),
+    }
+    if items:
+        stats["items"] = items
+        stats["items_per_s"] = items / (median / 1000) if median > 0 else None
+    return stats
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    stages: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        tmp_dir = Path(tmp)
+        md_dir = generate_corpus(tmp_dir / "markdown", args.docs, sections=args.sections, seed=args.seed)
+
+        data = DataPreparationModule(md_dir, tmp_dir / "cache", workers=1)
+        stages["generate_markdown"] = measure(data.generate_markdown, args.repeat, items=args.docs)
+        chunks = data._markdown_split()
+        stages["markdown_split"] = measure(data._markdown_split, args.repeat, items=args.docs)
+        data.chunks = chunks
+        texts = list(iter_texts(chunks))
+
+        base = DeterministicFakeEmbedding(size=args.dim)
+        stages["embedding"] = measure(lambda: base.embed_documents(texts), 1, items=len(texts))
+        embeddings = LookupEmbeddings(base)
+        embeddings.embed_documents(texts)
+
+        index = IndexConstructionModule(
+            model_name="bench-fake",
+            index_save_path=tmp_dir / "index",
+            index_type=args.index_type,
+            batch_size=256,
+        )
+        index.embeddings = embeddings  # type: ignore[assignment]
+        stages["faiss_build"] = measure(lambda: index.build_vector_index(chunks), args.repeat, items=len(chunks))
+        vectorstore = index.vectorstore
+        assert vectorstore is not None
+        stages["faiss_save"] = measure(lambda: index.save_vector_index(vectorstore), args.repeat)
+        stages["faiss_load"] = measure(index.load_vector_index, args.repeat)
+
+        stages["bm25_build"] = measure(lambda: BM25Index.build(iter_texts(chunks)), args.repeat, items=len(chunks))
+        bm25_index = BM25Index.build(iter_texts(chunks))
+
+        retrieval = RetrievalOptimizationModule(
+            vectorstore=index.vectorstore,
+            chunks=chunks,
+            bm25_index=bm25_index,
+            # 禁用查询向量缓存，使每次检索都包含查询嵌入
+            query_cache=LRUCache(max_entries=0),
+        )
+        # 预热：首次检索包含线程池创建、FAISS/BM25 数据页载入等一次性开销，不计入统计
+        for query in sample_queries(args.warmup, args.seed + 1):
+            retrieval.hybrid_search(query, top_k=args.top_k)
+        search_durations: List[float] = []
+        for query in sample_queries(args.queries, args.seed):
+            start = time.perf_counter()
+            retrieval.hybrid_search(query, top_k=args.top_k)
+            search_durations.append((time.perf_counter() - start) * 1000)
+        stages["hybrid_search"] = summarize(search_durations)
+        retrieval.close()
+
+        depth = min(args.fusion_depth, len(chunks))
+        legs = [
+            (np.random.default_rng(args.seed + i).permutation(len(chunks))[:depth].astype(np.int64),
+             np.linspace(1.0, 0.0, depth, dtype=np.float32))
+            for i in range(2)
+        ]
+        fusion = FusionOptions()
+        stages["fusion"] = measure(lambda: fuse(legs, [1.0, 1.0], args.top_k, fusion), args.repeat * 20, items=2 * depth)
+
+        generation = GenerationIntegrationModule(api_key="bench")
+        context = chunks[:args.top_k]
+        stages["build_context"] = measure(
+            lambda: generation._build_context(context, max_length=args.context_length), args.repeat * 20
+        )
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "docs": args.docs,
+            "chunks": len(chunks),
+            "dim": args.dim,
+            "index_type": args.index_type,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    '''返回中位耗时超过基线 (1 + tolerance) 倍的阶段说明'''
+    regressions: List[str] = []
+    for name, stats in result["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        ratio = stats["median_ms"] / base["median_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {base['median_ms']:.3f}ms -> {stats['median_ms']:.3f}ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="RAG 流水线分阶段基准测试")
+    parser.add_argument("--docs", type=int, default=200, help="合成文章数")
+    parser.add_argument("--sections", type=int, default=4, help="每篇文章的二级标题数")
+    parser.add_argument("--dim", type=int, default=512, help="假嵌入模型的向量维度")
+    parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf", "ivfpq", "sq8"])
+    parser.add_argument("--queries", type=int, default=50, help="混合检索的查询数")
+    parser.add_argument("--warmup", type=int, default=5, help="混合检索计时前的预热查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--fusion-depth", type=int, default=1000, help="融合阶段每路的候选数")
+    parser.add_argument("--context-length", type=int, default=4000, help="上下文拼接的最大字符数")
+    parser.add_argument("--repeat", type=int, default=3, help="各阶段的重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="结果 JSON 的输出路径，省略时输出到标准输出")
+    parser.add_argument("--baseline", type=Path, help="基线结果 JSON，存在回退时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的中位耗时增幅")
+    args = parser.parse_args(argv)
+
+    # 导入 blog_rag 时已配置 INFO 级别日志，基准测试期间只保留警告
+    logging.getLogger("blog_rag").setLevel(logging.WARNING)
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    for name, stats in result["stages"].items():
+        print(f"{name:>18}: median {stats['median_ms']:9.3f}ms  p95 {stats['p95_ms']:9.3f}ms", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            logger.error(f"性能回退 {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+服务启动基准测试。
+
+每次测量都在全新的子进程中执行，计时：
+- 各入口模块（blog_rag、api.app）与延迟导入的重量级模块的导入耗时
+- 从已保存的文档存储恢复元数据（load_metadata）的耗时
+- 进程启动后到元数据接口可以提供服务的总耗时（导入 api.app + load_metadata）
+
+    python -m benchmarks.bench_startup --docs 500 --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import blog_rag
+from blog_rag.rag_modules import DataPreparationModule
+
+from .bench_pipeline import compare, summarize
+from .corpus import generate_corpus
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = Path(blog_rag.__file__).resolve().parents[1]
+
+# 子进程中执行的计时脚本：setup 不计时，stmt 的耗时（毫秒）输出到标准输出
+_TIMER = """
+import time
+{setup}
+start = time.perf_counter()
+{stmt}
+print((time.perf_counter() - start) * 1000)
+"""
+
+# 名称 -> (不计时的前置语句, 计时的导入语句)；延迟导入的模块在导入 blog_rag 之后计时，只计量其自身新增的开销
+_IMPORTS = {
+    "import_blog_rag": ("", "import blog_rag"),
+    "import_api": ("", "import api.app"),
+    "import_data_preparation": ("import blog_rag", "import blog_rag.rag_modules.data_preparation"),
+    "import_index_construction": ("import blog_rag", "import blog_rag.rag_modules.index_construction"),
+    "import_retrieval_optimization": ("import blog_rag", "import blog_rag.rag_modules.retrieval_optimization"),
+    "import_generation_integration": ("import blog_rag", "import blog_rag.rag_modules.generation_integration"),
+}
+
+
+def run_child(stmt: str, setup: str, env: Dict[str, str]) -> float:
+    code = _TIMER.format(setup=setup, stmt=stmt)
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_child(stmt: str, repeat: int, env: Dict[str, str], setup: str = "") -> Dict[str, Any]:
+    return summarize([run_child(stmt, setup, env) for _ in range(repeat)])
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_DIR), os.environ.get("PYTHONPATH")])),
+        "API_KEY": os.environ.get("API_KEY", "bench"),
+    }
+    stages: Dict[str, Dict[str, Any]] = {}
+    for name, (setup, stmt) in _IMPORTS.items():
+        stages[name] = measure_child(stmt, args.repeat, env, setup)
+
+    with tempfile.TemporaryDirectory(prefix="rag-startup-") as tmp:
+        tmp_dir = Path(tmp)
+        md_dir = generate_corpus(tmp_dir / "markdown", args.docs, sections=args.sections, seed=args.seed)
+        DataPreparationModule(md_dir, tmp_dir / "cache", workers=1).renew_data()
+        make_rag = (
+            "from blog_rag import BlogRAGSystem\n"
+            "from blog_rag.config import BlogRAGConfig\n"
+            f"rag = BlogRAGSystem(config=BlogRAGConfig(markdown_dir={str(md_dir)!r}, "
+            f"cache_dir={str(tmp_dir / 'cache')!r}, index_dir={str(tmp_dir / 'index')!r}, "
+            "query_batch_window_ms=0), auto_start=False)"
+        )
+        stages["load_metadata"] = measure_child("assert rag.load_metadata()", args.repeat, env, make_rag)
+        stages["time_to_metadata"] = measure_child(
+            f"import api.app\n{make_rag}\nassert rag.load_metadata()", args.repeat, env
+        )
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "docs": args.docs,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="服务启动基准测试")
+    parser.add_argument("--docs", type=int, default=200, help="合成文章数")
+    parser.add_argument("--sections", type=int, default=4, help="每篇文章的二级标题数")
+    parser.add_argument("--repeat", type=int, default=5, help="各项测量的子进程次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="结果 JSON 的输出路径，省略时输出到标准输出")
+    parser.add_argument("--baseline", type=Path, help="基线结果 JSON，存在回退时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的中位耗时增幅")
+    args = parser.parse_args(argv)
+
+    # 导入 blog_rag 时已配置 INFO 级别日志，基准测试期间只保留警告
+    logging.getLogger("blog_rag").setLevel(logging.WARNING)
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    for name, stats in result["stages"].items():
+        print(f"{name:>30}: median {stats['median_ms']:9.3f}ms  p95 {stats['p95_ms']:9.3f}ms", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            logger.error(f"启动性能回退 {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import random
+from pathlib import Path
+from typing import List
+
+_CJK_WORDS = [
+    "注意力", "机制", "向量", "检索", "模型", "训练", "推理", "梯度", "损失函数", "正则化",
+    "卷积", "网络", "数据集", "优化器", "学习率", "嵌入", "分词", "索引", "缓存", "并发",
+]
+_EN_WORDS = [
+    "attention", "transformer", "dropout", "embedding", "gradient", "optimizer", "tensor",
+    "latency", "throughput", "index", "query", "cache", "batch", "kernel", "pipeline",
+]
+_CATEGORIES = ["tech", "notes", "paper", "life"]
+_TAGS = ["llm", "cv", "nlp", "rag", "python", "cuda", "faiss", "math"]
+
+
+def _sentence(rng: random.Random) -> str:
+    words: List[str] = []
+    for _ in range(rng.randint(6, 14)):
+        words.append(rng.choice(_EN_WORDS) if rng.random() < 0.3 else rng.choice(_CJK_WORDS))
+    return "".join(w if not w.isascii() else f" {w} " for w in words).strip() + "。"
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return "".join(_sentence(rng) for _ in range(sentences))
+
+
+def render_post(rng: random.Random, index: int, sections: int, paragraph_sentences: int) -> str:
+    '''生成一篇带 front matter、多级标题、中英文混排正文与代码块的文章'''
+    categories = rng.sample(_CATEGORIES, rng.randint(1, 2))
+    tags = rng.sample(_TAGS, rng.randint(1, 3))
+    lines = [
+        "---",
+        f"title: 合成文章 {index} | {rng.choice(_EN_WORDS)}",
+        f"description: {_sentence(rng)}",
+        f"pubDate: 2025 {rng.randint(1, 12):02d} {rng.randint(1, 28):02d}",
+        "categories:",
+        *(f"  - {c}" for c in categories),
+        "tags:",
+        *(f"  - {t}" for t in tags),
+        "---",
+        "",
+        f"# 合成文章 {index}",
+        "",
+        _paragraph(rng, paragraph_sentences),
+    ]
+    for s in range(sections):
+        lines += ["", f"## 第 {s + 1} 节 {rng.choice(_CJK_WORDS)}", "", _paragraph(rng, paragraph_sentences)]
+        if rng.random() < 0.5:
+            lines += ["", f"### {rng.choice(_EN_WORDS)} 细节", "", _paragraph(rng, paragraph_sentences)]
+        if rng.random() < 0.3:
+            lines += ["", "```python", *(f"x{i} = {rng.choice(_EN_WORDS)!r}" for i in range(8)), "```"]
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(
+        directory: str | Path,
+        n_docs: int,
+        sections: int = 4,
+        paragraph_sentences: int = 6,
+        seed: int = 0,
+    ) -> Path:
+    '''在 directory 下生成 n_docs 篇合成 Markdown 文章（分布在若干子目录中），相同参数生成的语料完全相同'''
+    directory = Path(directory)
+    rng = random.Random(seed)
+    for i in range(n_docs):
+        path = directory / f"dir{i % 8}" / f"post{i:05d}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(render_post(rng, i, sections, paragraph_sentences), encoding="utf-8")
+    return directory
+
+
+def sample_queries(n: int, seed: int = 0) -> List[str]:
+    '''从语料词表中抽取中英文混合查询'''
+    rng = random.Random(seed)
+    return [f"{rng.choice(_CJK_WORDS)} {rng.choice(_EN_WORDS)}" if i % 2 else rng.choice(_CJK_WORDS) + rng.choice(_CJK_WORDS)
+            for i in range(n)]
@@ -1,42 +1,56 @@
+import re
+import json
 import uuid
 import logging
+import hashlib
 import asyncio
-from fastapi import FastAPI, APIRouter, Depends, Body, Request
+import time
+from dataclasses import asdict, replace
+from fastapi import FastAPI, APIRouter, Depends, Body, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request as StarletteRequest
 from starlette import status
 
-from blog_rag import BlogRAGSystem
+from blog_rag import BlogRAGSystem, SearchOverloadedError, ServiceNotReadyError
+from blog_rag.rag_modules import metrics
 from api.schemas import ApiResponse, ok, fail
 
 logger = logging.getLogger(__name__)
 
+# If-None-Match 中的实体标签：可选的弱标记 W/ 与双引号内的不透明值
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?"([^"]*)"')
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Blog RAG System (deferred build)...")
 
-    # 创建 RAG 系统但不在构造时自动启动耗时操作
+    # 创建 RAG 系统但不在构造时自动启动耗时操作；只同步恢复已保存的元数据，
+    # 嵌入模型、向量索引与生成模块在后台加载，加载期间 /meta、/docs 即可提供服务，就绪状态见 /readyz
     rag = BlogRAGSystem(auto_start=False)
-    rag.initialize_modules()
+    await asyncio.to_thread(rag.load_metadata)
     app.state.rag = rag
+    app.state.rag_startup_task = rag.start_initialize(watch=rag.config.watch)
     try:
         yield
     finally:
-        # 在关闭时尝试优雅取消后台构建任务
-        task = getattr(app.state, "rag_build_task", None)
-        if task and not task.done():
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                logger.info("后台索引构建任务已取消")
+        # 在关闭时尝试优雅取消后台加载与构建任务
+        for name in ("rag_startup_task", "rag_build_task"):
+            task = getattr(app.state, name, None)
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    logger.info(f"后台任务 {name} 已取消")
         # 在此释放其他资源（如需要）
+        rag.close()
         logger.info("Blog RAG System shutdown complete.")
 
 
@@ -49,7 +63,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 统一依赖：从 state 读取 RAG，若未初始化则惰性创建（测试/生产均可用）
+# 统一依赖：从 state 读取 RAG，若未初始化则惰性创建（测试/生产均可用）；不等待后台加载，供元数据类接口使用
 async def get_rag_dep(request: Request) -> BlogRAGSystem:
     rag = getattr(request.app.state, "rag", None)
     if rag is None:
@@ -57,17 +71,41 @@ async def get_rag_dep(request: Request) -> BlogRAGSystem:
         rag = BlogRAGSystem(auto_start=False)
         await asyncio.to_thread(rag.initialize_modules)
         request.app.state.rag = rag
-        return rag
+    return rag
+
 
-    # 如果有正在进行的构建任务，等待其完成以保证检索可用
-    build_task = getattr(request.app.state, "rag_build_task", None)
-    if build_task and not build_task.done():
-        logger.info("等待后台索引构建完成...")
+async def _wait_for_task(request: Request, name: str) -> None:
+    task = getattr(request.app.state, name, None)
+    if task and not task.done():
+        logger.info(f"等待后台任务 {name} 完成...")
         try:
-            await build_task
+            # shield：请求被取消时不连带取消共享的后台任务
+            await asyncio.shield(task)
         except Exception as e:
-            logger.warning("后台索引构建任务失败: %s", e)
+            logger.warning("后台任务 %s 失败: %s", name, e)
+
+
+# 需要已初始化模块的接口（如重建）：等待后台加载结束，无论是否成功
+async def get_started_rag_dep(request: Request, rag: BlogRAGSystem = Depends(get_rag_dep)) -> BlogRAGSystem:
+    await _wait_for_task(request, "rag_startup_task")
+    return rag
+
+
+# 检索类接口：检索模块就绪后立即可用（不等待生成模块等后续初始化），后台重建完成后会原子切换；
+# 尚无任何索引时等待后台加载与首次构建，仍未就绪则返回 503
+async def get_ready_rag_dep(request: Request, rag: BlogRAGSystem = Depends(get_rag_dep)) -> BlogRAGSystem:
+    for name in ("rag_startup_task", "rag_build_task"):
+        if rag.retrieval_module is None:
+            await _wait_for_task(request, name)
+    if rag.retrieval_module is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="not ready",
+                            headers={"Retry-After": "5"})
+    return rag
+
 
+# 问答接口：生成模块在检索就绪之后才初始化，需等待后台初始化结束再判断其是否可用
+async def get_answer_rag_dep(request: Request, rag: BlogRAGSystem = Depends(get_ready_rag_dep)) -> BlogRAGSystem:
+    await _wait_for_task(request, "rag_startup_task")
     return rag
 
 
@@ -84,20 +122,39 @@ class MarkdownVO(BaseModel):
 class FilterDTO(BaseModel):
     categories: Optional[List[str]] = None
     tags: Optional[List[str]] = None
+    match: Literal["any", "all"] = "any"
+
+class FusionDTO(BaseModel):
+    method: Optional[Literal["rrf", "linear"]] = None
+    vectorWeight: Optional[float] = Field(default=None, ge=0)
+    bm25Weight: Optional[float] = Field(default=None, ge=0)
+    depth: Optional[int] = Field(default=None, ge=1, le=1000)  # 每路检索的候选数
 
 class SearchDTO(BaseModel):
     query: str
-    topK: int = 10
-    page: int = 1
-    size: int = 10
+    topK: Optional[int] = Field(default=None, ge=1)  # 限制结果总数；省略时按排序深度分页
+    page: int = Field(default=1, ge=1)
+    size: int = Field(default=10, ge=1, le=100)
+    cursor: Optional[str] = None  # 上一页返回的游标，携带时直接从缓存的排序列表切片
     filters: Optional[FilterDTO] = None
+    fusion: Optional[FusionDTO] = None
     highlight: bool = False
 
+class AnswerDTO(BaseModel):
+    query: str
+    topK: Optional[int] = Field(default=None, ge=1, le=50)
+    filters: Optional[FilterDTO] = None
+
+class ReindexDTO(BaseModel):
+    incremental: Optional[bool] = None
+
 class PageResult(BaseModel):
     items: List[ChunkVO]
     total: int
     page: int
     size: int
+    cursor: Optional[str] = None
+    hasMore: bool = False
 
 
 # 版本化路由
@@ -114,20 +171,90 @@ def v1_tags(rag: BlogRAGSystem = Depends(get_rag_dep)):
     tags = list(rag.data_module.tags) if rag.data_module else []
     return ok(data={"items": tags, "total": len(tags)})
 
+def build_filters(payload: Optional[FilterDTO]) -> Tuple[Optional[Dict[str, Any]], str]:
+    '''将请求中的过滤条件转换为检索参数 (filters, match)，未指定分类与标签时不过滤'''
+    if not payload or not (payload.categories or payload.tags):
+        return None, "any"
+    filters: Dict[str, Any] = {}
+    if payload.categories:
+        filters["categories"] = payload.categories
+    if payload.tags:
+        filters["tags"] = payload.tags
+    return filters, payload.match
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def search_etag(payload: SearchDTO, corpus_version: str) -> str:
+    '''同一语料版本下相同请求的结果不变，ETag 由请求体与语料版本计算，无需序列化结果'''
+    digest = hashlib.md5(f"{corpus_version}\n{payload.model_dump_json()}".encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''按 If-None-Match 的语法（"*" 或逗号分隔的实体标签列表）判断是否匹配，采用弱比较（忽略 W/ 前缀）'''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = _ENTITY_TAG_RE.fullmatch(etag)
+    return opaque is not None and opaque.group(1) in _ENTITY_TAG_RE.findall(if_none_match)
+
 @api_v1.post("/search", response_model=ApiResponse[PageResult])
-def v1_search(payload: SearchDTO = Body(...), rag: BlogRAGSystem = Depends(get_rag_dep)):
-    q = payload.query
-    k = payload.topK or payload.size or 10
-    filters: Optional[Dict[str, Any]] = None
-    if payload.filters and (payload.filters.categories or payload.filters.tags):
-        filters = {}
-        if payload.filters.categories:
-            filters["categories"] = {"$gte": payload.filters.categories}
-        if payload.filters.tags:
-            filters["tags"] = {"$gte": payload.filters.tags}
-    chunks = rag.query_chunks(q, filters, k)
-    items = [ChunkVO(content=c.content, metadata=c.metadata) for c in chunks]
-    return ok(data=PageResult(items=items, total=len(items), page=payload.page, size=payload.size))
+async def v1_search(request: Request, response: Response, payload: SearchDTO = Body(...),
+                    rag: BlogRAGSystem = Depends(get_ready_rag_dep)):
+    # 先校验分页范围，错误响应不携带 ETag 与缓存头
+    if payload.page * payload.size > rag.config.search_max_depth:
+        return fail(code=40002, message=f"page out of range (page * size <= {rag.config.search_max_depth})")
+    # 在检索前读取语料版本：检索期间发生切换时 ETag 偏旧，只会导致下次多返回一次完整结果
+    etag = search_etag(payload, rag.corpus_version)
+    max_age = rag.config.search_cache_max_age
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={max_age}" if max_age else "private, no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    filters, match = build_filters(payload.filters)
+    fusion = None
+    if payload.fusion is not None:
+        # 未指定的字段沿用配置中的默认值
+        overrides = {
+            "method": payload.fusion.method,
+            "vector_weight": payload.fusion.vectorWeight,
+            "bm25_weight": payload.fusion.bm25Weight,
+            "depth": payload.fusion.depth,
+        }
+        fusion = replace(rag.default_fusion, **{k: v for k, v in overrides.items() if v is not None})
+    result = await rag.asearch_page(payload.query, filters, payload.page, payload.size, match,
+                                    top_k=payload.topK, cursor=payload.cursor, fusion=fusion)
+    # 只有成功的结果才可被缓存与重新验证
+    response.headers.update(headers)
+    items = [ChunkVO(content=c.content, metadata=c.metadata) for c in result.items]
+    return ok(data=PageResult(items=items, total=result.total, page=payload.page, size=payload.size,
+                              cursor=result.cursor, hasMore=result.has_more))
+
+@api_v1.post("/answer")
+async def v1_answer(payload: AnswerDTO = Body(...), rag: BlogRAGSystem = Depends(get_answer_rag_dep)):
+    '''检索相关文档块并以 SSE 流式返回回答：sources -> token* -> done，出错时以 error 事件结束'''
+    if rag.generation_module is None:
+        # 在打开事件流之前返回，客户端可以按状态码区分"生成不可用"与流中途出错
+        body = fail(code=50302, message="generation unavailable", data={"error": rag.generation_error})
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body.model_dump())
+    filters, match = build_filters(payload.filters)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in rag.astream_answer(payload.query, filters, payload.topK, match):
+                yield sse_event(event, data)
+        except SearchOverloadedError:
+            yield sse_event("error", {"code": 50300, "message": "service overloaded"})
+        except Exception as e:
+            logger.error("流式生成回答失败: %s", e)
+            yield sse_event("error", {"code": 50000, "message": "internal error"})
+
+    # 禁用代理缓冲，保证增量及时送达客户端
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @api_v1.get("/docs/{doc_id}", response_model=ApiResponse[MarkdownVO])
 def v1_get_doc(doc_id: str, rag: BlogRAGSystem = Depends(get_rag_dep)):
@@ -136,13 +263,59 @@ def v1_get_doc(doc_id: str, rag: BlogRAGSystem = Depends(get_rag_dep)):
         return fail(message="Document not found")
     return ok(data=MarkdownVO(content=md.content, metadata=md.metadata, path=str(md.path)))
 
+@api_v1.post("/reindex", response_model=ApiResponse[Dict[str, Any]])
+async def v1_reindex(request: Request, payload: ReindexDTO = Body(default=ReindexDTO()),
+                     rag: BlogRAGSystem = Depends(get_started_rag_dep)):
+    try:
+        request.app.state.rag_build_task = rag.start_reindex(payload.incremental)
+    except RuntimeError:
+        # 已有重建任务或文件变更的在线更新正在进行
+        return fail(code=40900, message="reindex already running", data=asdict(rag.reindex_status))
+    return ok(data=asdict(rag.reindex_status), message="reindex started")
+
+@api_v1.get("/reindex/status", response_model=ApiResponse[Dict[str, Any]])
+def v1_reindex_status(rag: BlogRAGSystem = Depends(get_rag_dep)):
+    return ok(data={**asdict(rag.reindex_status), "current_version": rag.index_version})
+
 # 注册 v1 路由
 app.include_router(api_v1)
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    # 不触发惰性创建：RAG 系统尚未初始化时只输出请求级指标
+    rag: Optional[BlogRAGSystem] = getattr(request.app.state, "rag", None)
+    body = metrics.REGISTRY.render(rag.collect_metrics() if rag is not None else ())
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/healthz", response_model=ApiResponse[Dict[str, Any]], include_in_schema=False)
+def liveness_probe():
+    # 存活探针：进程可以响应即可，不等待模型加载
+    return ok(data={"alive": True})
+
+@app.get("/readyz", response_model=ApiResponse[Dict[str, Any]], include_in_schema=False)
+def readiness_probe(request: Request):
+    # 就绪探针：检索索引加载完成前返回 503，负载均衡在此期间不转发流量
+    rag: Optional[BlogRAGSystem] = getattr(request.app.state, "rag", None)
+    data = rag.readiness() if rag is not None else {"ready": False}
+    if data["ready"]:
+        return ok(data=data)
+    body = fail(code=50301, message="not ready", data=data)
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body.model_dump())
+
 @app.middleware("http")
 async def add_trace_id(request: StarletteRequest, call_next):
     request.state.trace_id = uuid.uuid4().hex
-    resp = await call_next(request)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        resp = await call_next(request)
+        status_code = resp.status_code
+    finally:
+        # 以路由模板而非原始路径作为标签，避免 /doc/{doc_id} 之类的路径造成标签基数膨胀
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUESTS.labels(request.method, path, status_code).inc()
+        metrics.HTTP_LATENCY.labels(request.method, path).observe(time.perf_counter() - start)
     resp.headers["X-Request-ID"] = request.state.trace_id
     return resp
 
@@ -152,6 +325,30 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
                              data={"errors": exc.errors()})
     return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content=body.model_dump())
 
+@app.exception_handler(SearchOverloadedError)
+async def overloaded_exception_handler(request: Request, exc: SearchOverloadedError):
+    body = ApiResponse[dict](success=False, code=50300, message="service overloaded",
+                             data=None)
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body.model_dump(),
+                        headers={"Retry-After": "1"})
+
+def _not_ready_response(headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    body = ApiResponse[dict](success=False, code=50301, message="not ready", data=None)
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body.model_dump(),
+                        headers=headers or {"Retry-After": "5"})
+
+@app.exception_handler(ServiceNotReadyError)
+async def not_ready_exception_handler(request: Request, exc: ServiceNotReadyError):
+    return _not_ready_response()
+
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    # 统一包装为 ApiResponse；503 只由检索未就绪产生（过载由 SearchOverloadedError 单独处理）
+    if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+        return _not_ready_response(exc.headers)
+    body = ApiResponse[dict](success=False, code=exc.status_code * 100, message=str(exc.detail), data=None)
+    return JSONResponse(status_code=exc.status_code, content=body.model_dump(), headers=exc.headers)
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     body = ApiResponse[dict](success=False, code=50000, message="internal error",
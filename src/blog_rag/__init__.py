@@ -1,3 +1,3 @@
-from .main import BlogRAGSystem
+from .main import BlogRAGSystem, SearchOverloadedError, ServiceNotReadyError
 
-__all__ = ["BlogRAGSystem"]
\ No newline at end of file
+__all__ = ["BlogRAGSystem", "SearchOverloadedError", "ServiceNotReadyError"]
\ No newline at end of file
@@ -2,7 +2,7 @@ import os
 from pathlib import Path
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, Literal
 import json
 
 
@@ -12,21 +12,77 @@ class BlogRAGConfig(BaseSettings):
     """应用配置
     """
     renew: bool = Field(default=False, description="是否重新构建知识向量索引")
+    incremental: bool = Field(default=False, description="重建索引时是否仅处理新增/修改/删除的文件")
     index_dir: Path = Field(default=ROOT_DIR / "resources" / "vector_index", description="向量索引目录")
     markdown_dir: Path = Field(default=ROOT_DIR / "resources" / "markdown", description="Markdown 文件目录")
     cache_dir: Path = Field(default=ROOT_DIR / "resources" / "cache", description="切分数据的保存路径")
+    keep_snapshots: int = Field(default=2, ge=1, description="保留的索引快照版本数（含当前版本）")
+    ingest_workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1, description="解析与切分 Markdown 的进程数，1 表示串行")
+    ingest_batch_size: int = Field(default=256, ge=1, description="切分流水线每批送入嵌入的文档块数")
+    chunk_max_tokens: int = Field(default=480, ge=0, description="文档块的最大 token 数（估算值），超出的节按块/句二次切分，0 表示不切分")
+    chunk_overlap_tokens: int = Field(default=64, ge=0, description="二次切分时相邻文档块的重叠 token 数")
+    chunk_min_tokens: int = Field(default=32, ge=0, description="少于该 token 数的节与相邻节合并，0 表示不合并")
+    watch: bool = Field(default=False, description="是否监听 Markdown 目录，将文件变更实时应用到在线索引")
+    watch_debounce: float = Field(default=1.0, gt=0, description="文件变更事件的防抖时间（秒）")
+    watch_poll_interval: float = Field(default=2.0, gt=0, description="未安装 watchfiles 时的轮询间隔（秒）")
+    live_delta_max_chunks: int = Field(default=2000, ge=0, description="文件变更累计产生的在线增量文档块数（删除 + 新增）超过该值时，在后台以增量方式重建快照")
 
     # 模型配置
     embedding_model: str = Field(default="BAAI/bge-small-zh-v1.5", description="嵌入模型标识")
     llm_model: str = Field(default="deepseek-chat", description="生成模型标识")
     api_key: Optional[str] = Field(default=None, description="DeepSeek API 密钥")
+    llm_base_url: Optional[str] = Field(default=None, description="兼容 OpenAI 协议的生成服务地址，为空时使用 DeepSeek 官方地址")
+    index_type: Literal["flat", "hnsw", "ivf", "ivfpq", "sq8"] = Field(default="flat", description="向量索引类型：flat 精确检索，hnsw/ivf/ivfpq/sq8 为近似或量化索引")
+    hnsw_m: int = Field(default=32, ge=4, description="HNSW 每个节点的邻居数")
+    hnsw_ef_search: int = Field(default=64, ge=1, description="HNSW 查询时的候选队列长度")
+    ivf_nlist: int = Field(default=0, ge=0, description="IVF 聚类中心数，0 表示按 4*sqrt(n) 自动确定")
+    ivf_nprobe: int = Field(default=16, ge=1, description="IVF 查询时访问的聚类数")
+    pq_m: int = Field(default=16, ge=1, description="IVF-PQ 的子量化器个数，需整除向量维度")
+    pq_nbits: int = Field(default=8, ge=1, le=16, description="IVF-PQ 每个子量化器的编码位数")
+    embedding_cache_size: int = Field(default=200_000, ge=0, description="嵌入向量磁盘缓存的最大条目数，0 表示禁用")
+    embedding_batch_size: int = Field(default=64, ge=1, description="构建索引时每批嵌入的文档块数")
+    checkpoint_interval: int = Field(default=1024, ge=1, description="构建索引时每嵌入多少个文档块确认一次检查点")
+    embedding_backend: Literal["torch", "onnx"] = Field(default="torch", description="嵌入后端：torch 为 PyTorch，onnx 为导出后的 ONNX Runtime 模型（需安装可选依赖 onnx：uv sync --extra onnx）")
+    onnx_quantize: bool = Field(default=True, description="ONNX 后端是否使用 int8 动态量化模型")
+    onnx_threads: int = Field(default=0, ge=0, description="ONNX 后端单次推理的线程数，0 表示使用全部可用 CPU")
+    onnx_batch_size: int = Field(default=32, ge=1, description="ONNX 后端每次推理的文本数")
+    embedding_parity_threshold: float = Field(default=0.99, gt=0, le=1, description="ONNX 嵌入与 PyTorch 嵌入的最小余弦相似度，低于该值时回退为 PyTorch 后端")
 
     # 检索配置
     top_k: int = Field(default=10, ge=1, description="检索返回的默认top_k")
+    search_workers: int = Field(default_factory=lambda: os.cpu_count() or 4, ge=1, description="异步检索专用线程池大小")
+    search_queue_size: int = Field(default=64, ge=0, description="检索请求的最大排队数，超出时拒绝请求")
+    retrieval_workers: int = Field(default=8, ge=1, description="并行执行向量与BM25检索的线程数")
+    retrieval_leg_timeout: Optional[float] = Field(default=2.0, gt=0, description="单路检索超时时间（秒），超时后降级为另一路结果")
+    bm25_tokenizer: Literal["cjk_bigram", "jieba", "whitespace"] = Field(default="cjk_bigram", description="BM25 分词器（jieba 需额外安装）")
+    fusion_method: Literal["rrf", "linear"] = Field(default="rrf", description="向量与BM25结果的融合方式：rrf 按名次倒数，linear 按归一化分数线性加权")
+    fusion_vector_weight: float = Field(default=1.0, ge=0, description="融合时向量检索的权重")
+    fusion_bm25_weight: float = Field(default=1.0, ge=0, description="融合时BM25检索的权重")
+    rrf_k: int = Field(default=60, ge=1, description="RRF 平滑参数")
+    retrieval_depth: int = Field(default=50, ge=1, description="每路检索召回的候选数（不小于 top_k）")
+    rerank_enabled: bool = Field(default=False, description="是否启用交叉编码器重排阶段")
+    rerank_model: str = Field(default="BAAI/bge-reranker-base", description="重排模型标识或本地模型目录")
+    rerank_top_n: int = Field(default=20, ge=1, description="参与重排的融合结果数")
+    rerank_batch_size: int = Field(default=16, ge=1, description="重排每批打分的文档块数")
+    rerank_budget_ms: float = Field(default=200.0, ge=0, description="重排阶段的时间预算（毫秒），超出时只重排已打分的部分，0 表示不限制")
+    rerank_cache_size: int = Field(default=10_000, ge=0, description="(查询, 文档块) 重排分数缓存的最大条目数，0 表示禁用")
+    query_cache_size: int = Field(default=1024, ge=0, description="查询向量缓存的最大条目数，0 表示禁用")
+    query_cache_ttl: float = Field(default=3600.0, gt=0, description="查询向量缓存的过期时间（秒）")
+    result_cache_size: int = Field(default=2048, ge=0, description="检索结果缓存的最大条目数，0 表示禁用；索引切换后自动失效")
+    search_cache_max_age: int = Field(default=0, ge=0, description="检索响应 Cache-Control 的 max-age（秒），0 表示客户端每次需携带 ETag 重新验证")
+    search_rank_depth: int = Field(default=100, ge=1, description="分页检索首次请求计算的排序列表深度")
+    search_max_depth: int = Field(default=1000, ge=1, description="分页检索允许的最大排序深度（page * size 上限）")
+    cursor_cache_size: int = Field(default=1024, ge=0, description="分页游标缓存的最大条目数，0 表示禁用游标")
+    cursor_ttl: float = Field(default=600.0, gt=0, description="分页游标的有效期（秒），过期后按原查询重新检索")
+    query_batch_window_ms: float = Field(default=2.0, ge=0, description="查询向量微批的收集窗口（毫秒），0 表示禁用微批")
+    query_batch_size: int = Field(default=32, ge=1, description="查询向量微批的最大批量")
+    query_batch_timeout: float = Field(default=10.0, gt=0, description="等待查询向量微批结果的超时时间（秒）")
 
     # 生成配置
     temperature: float = Field(default=0.1, ge=0.0, le=1.0, description="温度参数")
     max_tokens: int = Field(default=2048, ge=1, description="最大生成长度")
+    answer_top_k: int = Field(default=5, ge=1, description="生成回答时检索的文档块数")
+    answer_context_length: int = Field(default=4000, ge=1, description="生成回答时上下文的最大字符数")
 
     model_config = SettingsConfigDict(
         env_file=".env"
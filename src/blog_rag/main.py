@@ -1,9 +1,37 @@
+from __future__ import annotations
+
+import os
+import time
+import hashlib
+import shutil
+import asyncio
 import logging
-from typing import Any, Dict, List
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Hashable, Iterable, List, Sequence, Set, Tuple
 from pathlib import Path
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
 from blog_rag.config import BlogRAGConfig, DEFAULT_CONFIG
-from blog_rag.rag_modules import *
+from blog_rag.rag_modules.cache import LRUCache
+from blog_rag.rag_modules.query_batcher import QueryEmbeddingBatcher, embed_queries
+from blog_rag.rag_modules.bm25_index import BM25Index
+from blog_rag.rag_modules.chunking import ChunkingOptions
+from blog_rag.rag_modules.doc_store import DocumentStore, iter_texts, metadata_column
+from blog_rag.rag_modules.file_watcher import MarkdownWatcher
+from blog_rag.rag_modules.fusion import FusionOptions
+from blog_rag.rag_modules.onnx_embeddings import OnnxOptions
+from blog_rag.rag_modules.rerank import CrossEncoderScorer, Reranker
+from blog_rag.rag_modules import metrics
+
+if TYPE_CHECKING:
+    from blog_rag.rag_modules import (
+        DataPreparationModule,
+        GenerationIntegrationModule,
+        IndexConstructionModule,
+        RetrievalOptimizationModule,
+    )
 
 
 logging.basicConfig(
@@ -13,6 +41,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class SearchOverloadedError(RuntimeError):
+    """检索请求排队已满"""
+
+
+class ServiceNotReadyError(RuntimeError):
+    """检索索引尚未加载或构建完成"""
+
+
 @dataclass
 class BasicInfo:
     content: str
@@ -26,6 +62,34 @@ class MarkdownInfo(BasicInfo):
     path: Path
     pass
 
+@dataclass
+class SearchPage:
+    items: List[ChunkInfo]
+    total: int
+    cursor: str | None = None
+    has_more: bool = False
+
+@dataclass
+class _RankedList:
+    '''游标对应的排序结果：请求标识、计算时的深度与排序后的全部文档块'''
+    request: Tuple[Hashable, ...]
+    depth: int
+    items: List[ChunkInfo]
+
+    @property
+    def exhausted(self) -> bool:
+        return len(self.items) < self.depth
+
+@dataclass
+class ReindexStatus:
+    state: str = "idle"  # idle / pending / running / succeeded / failed
+    stage: str = ""
+    progress: float = 0.0
+    version: str | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+
 
 class BlogRAGSystem:
     def __init__(
@@ -47,8 +111,73 @@ class BlogRAGSystem:
         self.config = config or DEFAULT_CONFIG
         self.data_module = data_module
         self.index_module = index_module
-        self.retrieval_module = retrieval_module
         self.generation_module = generation_module
+        # 检索结果缓存，键中包含语料代次，检索模块每次切换后旧结果自动失效
+        self.corpus_generation = 0
+        self.result_cache: LRUCache[List[ChunkInfo]] = LRUCache(max_entries=self.config.result_cache_size)
+        # 分页游标 -> 首次请求计算的深排序列表；游标固定语料版本，索引切换后翻页结果仍保持一致
+        self.cursor_cache: LRUCache[_RankedList] = LRUCache(
+            max_entries=self.config.cursor_cache_size,
+            ttl=self.config.cursor_ttl,
+        )
+        self.retrieval_module = retrieval_module
+        # 当前生效的索引快照版本；重建在新的版本目录中进行，完成后整体切换
+        self.index_version: str | None = None
+        self.reindex_status = ReindexStatus()
+        self._reindex_lock = threading.Lock()
+        # 文件监听产生的待应用变更；重建进行中时先排队，释放重建锁后统一应用
+        self._pending_paths: Set[Path] = set()
+        self._pending_lock = threading.Lock()
+        # 上一次切换时被替换的数据/索引模块：进行中的查询可能仍在读取其文档存储，下一次切换时才关闭
+        self._retired_modules: List[Any] = []
+        # 后台初始化（加载嵌入模型与索引）失败时的错误信息
+        self.startup_error: str | None = None
+        # 生成模块初始化失败时的错误信息；生成模块独立于检索，失败只影响问答
+        self.generation_error: str | None = None
+        self.watcher: MarkdownWatcher | None = None
+        self.default_fusion = FusionOptions(
+            method=self.config.fusion_method,
+            vector_weight=self.config.fusion_vector_weight,
+            bm25_weight=self.config.fusion_bm25_weight,
+            rrf_k=self.config.rrf_k,
+            depth=self.config.retrieval_depth,
+        )
+        # 重排模型与分数缓存在索引重建之间共享（chunk_id 由内容决定，缓存不会因重建失效）
+        self.reranker: Reranker | None = None
+        if self.config.rerank_enabled:
+            self.reranker = Reranker(
+                CrossEncoderScorer(self.config.rerank_model, Path(self.config.index_dir).parent / "models"),
+                top_n=self.config.rerank_top_n,
+                batch_size=self.config.rerank_batch_size,
+                budget=self.config.rerank_budget_ms / 1000 if self.config.rerank_budget_ms else None,
+                cache=LRUCache(max_entries=self.config.rerank_cache_size),
+            )
+        # 查询向量缓存在索引重建之间共享
+        self.query_cache: LRUCache[List[float]] = LRUCache(
+            max_entries=self.config.query_cache_size,
+            ttl=self.config.query_cache_ttl,
+        )
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=self.config.retrieval_workers,
+            thread_name_prefix="retrieval",
+        )
+        # 并发查询的向量在微批处理器中合并编码
+        self.query_batcher: QueryEmbeddingBatcher | None = None
+        if self.config.query_batch_window_ms > 0:
+            self.query_batcher = QueryEmbeddingBatcher(
+                self._embed_query_batch,
+                window=self.config.query_batch_window_ms / 1000,
+                max_batch=self.config.query_batch_size,
+                timeout=self.config.query_batch_timeout,
+            )
+        # 异步检索专用线程池，配合信号量限制排队长度以实现背压
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=self.config.search_workers,
+            thread_name_prefix="search",
+        )
+        self._search_slots = threading.BoundedSemaphore(
+            self.config.search_workers + self.config.search_queue_size
+        )
 
         logger.info("BlogRAGSystem 创建，auto_start=%s", auto_start)
 
@@ -56,53 +185,199 @@ class BlogRAGSystem:
             self.initialize_modules()
             self.build_knowledge_index()
 
+    @property
+    def retrieval_module(self) -> RetrievalOptimizationModule | None:
+        return self._retrieval_module
+
+    @retrieval_module.setter
+    def retrieval_module(self, module: RetrievalOptimizationModule | None) -> None:
+        previous = getattr(self, "_retrieval_module", None)
+        # 先切换引用再递增代次（查询按相反顺序先读代次再读模块）：读到新代次的查询必然使用新模块，
+        # 旧模块的结果只会写入旧代次的缓存键，随后被清空或不再命中
+        self._retrieval_module = module
+        self.corpus_generation += 1
+        self.result_cache.clear()
+        # 被替换的模块若持有私有线程池则关闭（系统创建的模块共享 retrieval_executor，不受影响）
+        if previous is not None and previous is not module:
+            close = getattr(previous, "close", None)
+            if close is not None:
+                close()
+
+    @property
+    def corpus_version(self) -> str:
+        '''标识当前检索语料的版本：快照版本 + 在线切换代次'''
+        return f"{self.index_version or 'legacy'}.{self.corpus_generation}"
+
     def initialize_modules(self):
         '''初始化各个模块（若调用者已注入则复用）'''
         logger.info("正在初始化RAG系统...")
+        self.index_version = self._current_snapshot()
+        snapshot_dir = self.snapshots_dir / self.index_version if self.index_version else None
 
         # 1. 数据准备模块
         if self.data_module is None:
             logger.info("正在初始化数据准备模块...")
-            self.data_module = DataPreparationModule(
-                markdown_dir=self.config.markdown_dir,
-                cache_dir=self.config.cache_dir
-            )
+            self.load_metadata()
         else:
-            logger.info("使用注入的数据准备模块。")
+            logger.info("使用已创建的数据准备模块。")
 
         # 2. 索引构建模块
         if self.index_module is None:
             logger.info("正在初始化索引构建模块...")
-            self.index_module = IndexConstructionModule(
-                model_name=self.config.embedding_model,
-                index_save_path=self.config.index_dir
-            )
+            self.index_module = self._make_index_module(snapshot_dir)
         else:
             logger.info("使用注入的索引构建模块。")
 
-        # 3. 生成集成模块
-        if self.generation_module is None:
-            logger.info("正在初始化生成集成模块...")
-            self.generation_module = GenerationIntegrationModule(
-                model_name=self.config.llm_model,
-                api_key=self.config.api_key,
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens,
-            )
-        else:
-            logger.info("使用注入的生成模块。")
+        # 重排模型在检索就绪前加载并预热，首个查询不承担模型加载耗时，且时间预算从第一批起即可生效
+        if self.reranker is not None:
+            logger.info("正在预热重排模型...")
+            try:
+                self.reranker.warmup()
+            except Exception as e:
+                logger.error(f"重排模型预热失败，将在首次查询时重试加载: {e}")
 
-        # 4. 检索优化模块
+        # 3. 检索优化模块：加载完成即可提供检索服务，不等待生成模块
         if self.retrieval_module is None:
             logger.info("正在初始化检索优化模块...")
             self.init_retrieval_module()
         else:
             logger.info("使用注入的检索优化模块。")
 
+        # 4. 生成集成模块：初始化失败只使问答接口不可用，检索不受影响
+        if self.generation_module is None:
+            logger.info("正在初始化生成集成模块...")
+            try:
+                self.generation_module = self._make_generation_module()
+                self.generation_error = None
+            except Exception as e:
+                logger.error(f"生成集成模块初始化失败，问答接口不可用: {e}")
+                self.generation_error = str(e)
+        else:
+            logger.info("使用注入的生成模块。")
+
         logger.info("模块初始化完成")
 
+    def _make_generation_module(self) -> GenerationIntegrationModule:
+        from blog_rag.rag_modules.generation_integration import GenerationIntegrationModule
+        return GenerationIntegrationModule(
+            model_name=self.config.llm_model,
+            api_key=self.config.api_key,
+            temperature=self.config.temperature,
+            max_tokens=self.config.max_tokens,
+            base_url=self.config.llm_base_url,
+        )
+
+    def load_metadata(self) -> bool:
+        '''
+        创建数据准备模块并从当前快照的文档存储恢复分类、标签与文档索引，不加载任何模型，
+        使元数据与全文接口在嵌入模型和索引加载完成前即可提供服务。返回是否恢复到已保存的文档。
+        '''
+        if self.data_module is not None:
+            return bool(self.data_module.documents)
+        self.index_version = self._current_snapshot()
+        snapshot_dir = self.snapshots_dir / self.index_version if self.index_version else None
+        data_module = self._make_data_module(snapshot_dir)
+        loaded = data_module.load_metadata()
+        self.data_module = data_module
+        return loaded
+
+    def start_initialize(self, watch: bool = False) -> "asyncio.Task[bool]":
+        '''在后台线程中执行 initialize_modules，需在事件循环中调用；完成后按需启动文件监听，返回是否就绪'''
+        async def run() -> bool:
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.initialize_modules)
+            except Exception as e:
+                logger.error(f"后台初始化失败: {e}")
+                self.startup_error = str(e)
+                return False
+            logger.info(f"后台初始化完成，耗时 {time.perf_counter() - start:.1f}s，就绪: {self.ready}")
+            if watch:
+                self.start_watcher()
+            return self.ready
+        return asyncio.create_task(run())
+
+    @property
+    def ready(self) -> bool:
+        '''是否已有可用的检索索引'''
+        return self.retrieval_module is not None
+
+    def readiness(self) -> Dict[str, Any]:
+        index_module = self.index_module
+        return {
+            "ready": self.ready,
+            "metadata": self.data_module is not None,
+            "embeddings": index_module is not None and index_module.embeddings is not None,
+            "generation": self.generation_module is not None,
+            "generation_error": self.generation_error,
+            "index_version": self.index_version,
+            "error": self.startup_error,
+        }
+
+    def _make_data_module(self, store_dir: Path | None = None) -> DataPreparationModule:
+        from blog_rag.rag_modules.data_preparation import DataPreparationModule
+        return DataPreparationModule(
+            markdown_dir=self.config.markdown_dir,
+            cache_dir=self.config.cache_dir,
+            store_dir=store_dir,
+            workers=self.config.ingest_workers,
+            batch_size=self.config.ingest_batch_size,
+            chunking=ChunkingOptions(
+                max_tokens=self.config.chunk_max_tokens,
+                overlap_tokens=self.config.chunk_overlap_tokens,
+                min_tokens=self.config.chunk_min_tokens,
+            ),
+        )
+
+    def _make_index_module(self, index_dir: Path | None = None) -> IndexConstructionModule:
+        from blog_rag.rag_modules.index_construction import IndexConstructionModule
+        return IndexConstructionModule(
+            model_name=self.config.embedding_model,
+            index_save_path=index_dir or self.config.index_dir,
+            cache_dir=self.config.cache_dir,
+            embedding_cache_size=self.config.embedding_cache_size,
+            index_type=self.config.index_type,
+            index_params={
+                "hnsw_m": self.config.hnsw_m,
+                "hnsw_ef_search": self.config.hnsw_ef_search,
+                "ivf_nlist": self.config.ivf_nlist,
+                "ivf_nprobe": self.config.ivf_nprobe,
+                "pq_m": self.config.pq_m,
+                "pq_nbits": self.config.pq_nbits,
+            },
+            model_cache_dir=Path(self.config.index_dir).parent / "models",
+            batch_size=self.config.embedding_batch_size,
+            checkpoint_dir=Path(self.config.cache_dir) / "build_checkpoint",
+            # 检查点按语料目录与切分配置区分，其他语料或配置的构建既不复用也不覆盖它
+            checkpoint_key=(
+                f"{Path(self.config.markdown_dir).resolve()}|{self.config.chunk_max_tokens}|"
+                f"{self.config.chunk_overlap_tokens}|{self.config.chunk_min_tokens}"
+            ),
+            checkpoint_interval=self.config.checkpoint_interval,
+            embedding_backend=self.config.embedding_backend,
+            onnx_options=OnnxOptions(
+                quantize=self.config.onnx_quantize,
+                threads=self.config.onnx_threads,
+                batch_size=self.config.onnx_batch_size,
+                parity_threshold=self.config.embedding_parity_threshold,
+            ),
+        )
+
+    @property
+    def snapshots_dir(self) -> Path:
+        return Path(self.config.index_dir) / "snapshots"
+
+    def _current_snapshot(self) -> str | None:
+        '''读取 CURRENT 指针指向的快照版本；尚未生成过快照时返回 None（沿用旧的单目录布局）'''
+        try:
+            version = (Path(self.config.index_dir) / "CURRENT").read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return version if version and (self.snapshots_dir / version).is_dir() else None
+
     def load_knowledge_index(self) -> bool:
         '''加载知识向量索引，返回是否成功'''
+        from blog_rag.rag_modules.retrieval_optimization import StaleVectorIndexError
         try:
             assert self.index_module is not None
             assert self.data_module is not None
@@ -113,34 +388,334 @@ class BlogRAGSystem:
                 logger.info("成功加载已保存的向量索引!")
             else:
                 raise RuntimeError("未找到已保存的向量索引，无法加载知识索引。")
-            self.retrieval_module = RetrievalOptimizationModule(
-                vectorstore=vectorstore,
-                chunks=chunks
+            self.retrieval_module = self._make_retrieval_module(
+                vectorstore, chunks, self._load_or_build_bm25(chunks, self.data_module.store_dir / "bm25")
             )
             return True
+        except StaleVectorIndexError as e:
+            # 旧版本构建的索引无法与文档块对应时，向量检索会静默失效，强制全量重建
+            logger.warning(f"{e}，将全量重建向量索引。")
+            return self.build_knowledge_index(incremental=False)
         except Exception as e:
             logger.error(f"构建知识向量索引失败: {e}")
             return False
 
-    def build_knowledge_index(self) -> bool:
-        '''加载知识向量索引，返回是否成功'''
+    def build_knowledge_index(self, incremental: bool | None = None) -> bool:
+        '''构建知识向量索引并切换为当前快照，返回是否成功'''
         try:
-            assert self.index_module is not None
-            assert self.data_module is not None
-            logger.info("正在加载和处理文档...")
-            _, chunks = self.data_module.renew_data()
-            vectorstore = self.index_module.build_vector_index(chunks)
-            logger.info("正在保存向量索引...")
-            self.index_module.save_vector_index(vectorstore)
-            self.retrieval_module = RetrievalOptimizationModule(
-                vectorstore=vectorstore,
-                chunks=chunks
-            )
+            self.reindex(incremental)
             return True
         except Exception as e:
             logger.error(f"构建知识向量索引失败: {e}")
             return False
 
+    def reindex(self, incremental: bool | None = None) -> str:
+        '''
+        在新的版本目录中构建完整的检索快照（文档块、向量索引、BM25 索引），
+        完成后原子地更新 CURRENT 指针并切换在线引用；构建期间检索继续使用旧快照。
+        Args:
+            incremental: 是否增量构建，默认取配置项 incremental
+        Returns:
+            新快照的版本号
+        '''
+        if not self._reindex_lock.acquire(blocking=False):
+            raise RuntimeError("已有索引重建任务正在运行。")
+        try:
+            return self._reindex_locked(incremental)
+        finally:
+            self._release_reindex_lock()
+
+    def _reindex_locked(self, incremental: bool | None) -> str:
+        '''reindex 的实现，调用方需已持有 _reindex_lock'''
+        incremental = self.config.incremental if incremental is None else incremental
+        # 版本号按生成时间排序，用于确定待清理的旧快照
+        version = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        snapshot_dir = self.snapshots_dir / version
+        self.reindex_status = ReindexStatus(state="running", version=version, started_at=time.time())
+        started = time.perf_counter()
+        try:
+            data_module = self._make_data_module(snapshot_dir)
+            index_module = self._make_index_module(snapshot_dir)
+            index_module.embeddings = self._shared_embeddings()
+            index_module.embedding_id = self.index_module.embedding_id  # type: ignore[union-attr]
+
+            vectorstore = self._update_snapshot(data_module, index_module) if incremental else None
+            if vectorstore is None:
+                # 解析切分在进程池中进行，每产出一批文档块即送入嵌入，同时写入快照的文档存储
+                self._report_progress("切分文档并嵌入", 0.1)
+                vectorstore = index_module.build_vector_index(
+                    data_module.stream_chunks(), on_progress=self._report_embedding_progress
+                )
+            self._report_progress("保存向量索引", 0.7)
+            index_module.save_vector_index(vectorstore)
+            self._report_progress("构建 BM25 索引", 0.8)
+            retrieval_module = self._make_retrieval_module(
+                vectorstore, data_module.chunks, self._load_or_build_bm25(data_module.chunks, snapshot_dir / "bm25")
+            )
+
+            self._report_progress("切换快照", 0.95)
+            self._publish_snapshot(version)
+            index_module.discard_checkpoint()
+            # 引用赋值是原子的：进行中的检索继续使用其持有的旧模块，新请求使用新快照
+            previous_data, previous_index = self.data_module, self.index_module
+            self.data_module = data_module
+            self.index_module = index_module
+            self.retrieval_module = retrieval_module
+            self.index_version = version
+            self._retire_modules(previous_data, previous_index)
+            self._prune_snapshots()
+        except BaseException as e:
+            self.reindex_status.state = "failed"
+            self.reindex_status.error = str(e)
+            self.reindex_status.finished_at = time.time()
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            metrics.REINDEX_DURATION.labels(
+                "incremental" if incremental else "full", "failed").observe(time.perf_counter() - started)
+            raise
+        metrics.REINDEX_DURATION.labels(
+            "incremental" if incremental else "full", "succeeded").observe(time.perf_counter() - started)
+        self.reindex_status.state = "succeeded"
+        self.reindex_status.progress = 1.0
+        self.reindex_status.finished_at = time.time()
+        logger.info(f"索引快照 {version} 已生效。")
+        return version
+
+    def start_reindex(self, incremental: bool | None = None) -> "asyncio.Task[str | None]":
+        '''
+        在后台线程中执行 reindex，需在事件循环中调用；已有任务（包括文件变更的在线更新）运行时抛出 RuntimeError。
+        先取得重建锁再把状态置为 pending，锁由后台线程在重建结束后释放。
+        '''
+        if not self._reindex_lock.acquire(blocking=False):
+            raise RuntimeError("已有索引重建任务正在运行。")
+        self.reindex_status = ReindexStatus(state="pending")
+        started = threading.Event()
+
+        def work() -> str:
+            started.set()
+            try:
+                return self._reindex_locked(incremental)
+            finally:
+                self._release_reindex_lock()
+
+        async def run() -> str | None:
+            try:
+                return await asyncio.to_thread(work)
+            except asyncio.CancelledError:
+                # 线程尚未开始时任务被取消，由此处释放锁并复位状态
+                if not started.is_set():
+                    self._reindex_lock.release()
+                    self.reindex_status = ReindexStatus()
+                raise
+            except Exception as e:
+                logger.error(f"后台索引重建失败: {e}")
+                return None
+        return asyncio.create_task(run())
+
+    @property
+    def reindex_running(self) -> bool:
+        return self.reindex_status.state in ("pending", "running")
+
+    def _report_progress(self, stage: str, progress: float) -> None:
+        self.reindex_status.stage = stage
+        self.reindex_status.progress = progress
+        logger.info(f"索引重建 [{progress:.0%}]: {stage}...")
+
+    def _report_embedding_progress(self, chunks: int, rate: float) -> None:
+        # 总数未知，进度只更新阶段描述
+        self.reindex_status.stage = f"切分文档并嵌入（已处理 {chunks} 个文档块，{rate:.1f} chunks/s）"
+
+    def _shared_embeddings(self) -> Any:
+        '''新快照复用在线模块已加载的嵌入模型'''
+        assert self.index_module is not None
+        if self.index_module.embeddings is None:
+            self.index_module.setup_embeddings()
+        return self.index_module.embeddings
+
+    def _update_snapshot(self, data_module: DataPreparationModule, index_module: IndexConstructionModule) -> Any:
+        '''以当前快照为基础增量构建新快照，仅重新嵌入新增/修改的文件；无法增量更新时返回 None'''
+        previous_data, previous_index = self.data_module, self.index_module
+        manifest = previous_data.load_manifest() if previous_data is not None else {}
+        if not manifest or previous_index is None:
+            logger.info("未找到文件清单，执行全量构建。")
+            return None
+        # 从磁盘读取一份独立副本进行修改，在线索引不受影响
+        vectorstore = index_module.load_vector_index(source_dir=previous_index.index_save_path)
+        if vectorstore is None:
+            logger.info("未找到已保存的向量索引，执行全量构建。")
+            return None
+        if not index_module.supports_incremental:
+            logger.info("当前索引类型不支持删除向量，执行全量构建（未变化的文档块将命中嵌入缓存）。")
+            return None
+        assert previous_data is not None
+        self._report_progress("增量更新文档", 0.1)
+        old_chunks = DocumentStore.load(previous_data.store_dir / "chunks")
+        try:
+            new_chunks, stale_ids = data_module.renew_data_incremental(manifest, old_chunks or [])
+        finally:
+            if old_chunks is not None:
+                old_chunks.close()
+        self._report_progress("增量更新向量索引", 0.3)
+        index_module.delete_chunks(stale_ids)
+        index_module.add_chunks(new_chunks)
+        return index_module.vectorstore
+
+    def _retire_modules(self, *modules: Any) -> None:
+        '''关闭更早一次切换时替换下来的数据/索引模块，释放内存映射以便清理其快照目录'''
+        retired, self._retired_modules = self._retired_modules, []
+        for module in retired:
+            self._close_module(module)
+        current = (self.data_module, self.index_module)
+        self._retired_modules = [
+            module for module in modules if module is not None and all(module is not c for c in current)
+        ]
+
+    @staticmethod
+    def _close_module(module: Any) -> None:
+        close = getattr(module, "close", None)
+        if close is not None:
+            close()
+
+    def _publish_snapshot(self, version: str) -> None:
+        '''先写临时文件再 os.replace，保证 CURRENT 指针始终完整地指向某个版本'''
+        pointer = Path(self.config.index_dir) / "CURRENT"
+        tmp_pointer = pointer.with_name("CURRENT.tmp")
+        tmp_pointer.write_text(version, encoding="utf-8")
+        os.replace(tmp_pointer, pointer)
+
+    def _prune_snapshots(self) -> None:
+        '''删除超出保留数量的旧快照（版本号按时间排序），当前版本始终保留'''
+        versions = sorted(p.name for p in self.snapshots_dir.iterdir() if p.is_dir())
+        for version in versions[:-self.config.keep_snapshots]:
+            if version != self.index_version:
+                logger.info(f"正在删除旧索引快照: {version}")
+                shutil.rmtree(self.snapshots_dir / version, ignore_errors=True)
+
+    def _make_retrieval_module(
+            self,
+            vectorstore: Any,
+            chunks: Sequence[Any],
+            bm25_index: BM25Index,
+        ) -> RetrievalOptimizationModule:
+        from blog_rag.rag_modules.retrieval_optimization import RetrievalOptimizationModule
+        return RetrievalOptimizationModule(
+            vectorstore=vectorstore,
+            chunks=chunks,
+            query_cache=self.query_cache,
+            executor=self.retrieval_executor,
+            leg_timeout=self.config.retrieval_leg_timeout,
+            query_batcher=self.query_batcher,
+            bm25_index=bm25_index,
+            fusion=self.default_fusion,
+            reranker=self.reranker,
+        )
+
+    def _load_or_build_bm25(self, chunks: Sequence[Any], bm25_dir: Path) -> BM25Index:
+        '''优先以内存映射方式加载持久化的 BM25 倒排索引，与文档块不一致时重建并保存'''
+        fingerprint = self._bm25_fingerprint(chunks)
+        bm25_index = BM25Index.load(bm25_dir, fingerprint)
+        if bm25_index is None:
+            bm25_index = BM25Index.build(
+                iter_texts(chunks),
+                tokenizer=self.config.bm25_tokenizer,
+                fingerprint=fingerprint,
+            )
+            bm25_index.save(bm25_dir)
+        return bm25_index
+
+    def _bm25_fingerprint(self, chunks: Sequence[Any]) -> str:
+        return BM25Index.compute_fingerprint(metadata_column(chunks, "chunk_id"), self.config.bm25_tokenizer)
+
+    def apply_file_changes(self, paths: Iterable[str | Path]) -> bool:
+        '''
+        将指定 Markdown 文件的新增、修改或删除直接应用到在线索引：只重新解析、切分和嵌入这些文件，
+        快照中的旧文档块标记为删除、新文档块放入检索模块的在线增量段，然后原子切换检索模块；
+        数据模块的文档索引、分类与标签在切换成功后才更新。代价只与变更文件和增量段的大小相关。
+        变更只保存在内存中，下一次 reindex 时写入新的快照。
+        Returns:
+            是否有文件变更被应用
+        '''
+        self._reindex_lock.acquire()
+        try:
+            return self._apply_file_changes_locked(paths)
+        finally:
+            self._release_reindex_lock()
+
+    def _apply_file_changes_locked(self, paths: Iterable[str | Path]) -> bool:
+        '''apply_file_changes 的实现，调用方需已持有 _reindex_lock'''
+        started = time.perf_counter()
+        data_module, retrieval_module = self.data_module, self.retrieval_module
+        if data_module is None or retrieval_module is None:
+            logger.info("在线索引尚未就绪，文件变更将在索引构建时读取。")
+            return False
+        changes = data_module.stage_files(paths)
+        if not changes.documents:
+            return False
+        updated = retrieval_module.apply_file_changes(changes.documents.keys(), changes.chunks)
+        self.retrieval_module = updated
+        data_module.commit_files(changes)
+        metrics.REINDEX_DURATION.labels("files", "succeeded").observe(time.perf_counter() - started)
+        logger.info(
+            f"已将 {len(changes.documents)} 个文件的变更应用到在线索引: 新增 {len(changes.chunks)} 个文档块，"
+            f"在线增量段累计 {updated.delta.size} 个文档块。"
+        )
+        return True
+
+    def _release_reindex_lock(self) -> None:
+        '''释放重建锁，并应用持锁期间排队的文件变更'''
+        self._reindex_lock.release()
+        self._apply_pending_changes()
+
+    def _apply_pending_changes(self) -> None:
+        '''
+        应用排队的文件变更。重建锁被占用时直接返回，变更留在队列中，由持锁方释放锁后再次调用；
+        处理期间又有变更入队时继续处理，直到队列为空。
+        '''
+        while True:
+            with self._pending_lock:
+                if not self._pending_paths:
+                    return
+            if not self._reindex_lock.acquire(blocking=False):
+                return
+            try:
+                with self._pending_lock:
+                    paths, self._pending_paths = self._pending_paths, set()
+                self._apply_file_changes_locked(paths)
+                self._compact_if_needed()
+            except Exception as e:
+                logger.error(f"应用文件变更失败，这些文件将在下一次重建索引时更新: {e}")
+            finally:
+                self._reindex_lock.release()
+
+    def _compact_if_needed(self) -> None:
+        '''在线增量段超过 live_delta_max_chunks 时以增量方式重建快照，将其合并；调用方需已持有 _reindex_lock'''
+        delta = getattr(self.retrieval_module, "delta", None)
+        if delta is None or delta.size <= self.config.live_delta_max_chunks:
+            return
+        logger.info(f"在线增量段累计 {delta.size} 个文档块，重建快照以合并增量。")
+        self._reindex_locked(incremental=True)
+
+    def _on_markdown_change(self, paths: Iterable[Path]) -> None:
+        # 先入队再尝试应用：重建进行中时变更不会丢失，由重建结束后统一应用
+        with self._pending_lock:
+            self._pending_paths.update(Path(p) for p in paths)
+        self._apply_pending_changes()
+
+    def start_watcher(self) -> None:
+        '''监听 Markdown 目录，文件变更在防抖后自动应用到在线索引'''
+        if self.watcher is not None:
+            return
+        self.watcher = MarkdownWatcher(
+            self.config.markdown_dir,
+            self._on_markdown_change,
+            debounce=self.config.watch_debounce,
+            poll_interval=self.config.watch_poll_interval,
+        )
+        self.watcher.start()
+
+    def _embed_query_batch(self, queries: List[str]) -> List[List[float]]:
+        assert self.index_module is not None and self.index_module.embeddings is not None
+        return embed_queries(self.index_module.embeddings, queries)
+
     def init_retrieval_module(self) -> bool:
         logger.info("初始化检索优化")
         # 检查路径，早期错误更明确，避免在构造时 exit()
@@ -164,33 +739,342 @@ class BlogRAGSystem:
         else:
             return self.load_knowledge_index()
 
+    @staticmethod
+    def _request_key(
+            query: str,
+            filters: Dict[str, Any] | None,
+            match: str,
+            fusion: FusionOptions | None = None,
+        ) -> Tuple[Hashable, ...]:
+        '''规范化查询（合并空白）与过滤条件（去重排序、忽略空字段），使等价请求得到相同的键'''
+        normalized_filters = tuple(sorted(
+            (field, tuple(sorted(set(values))))
+            for field, values in (filters or {}).items() if values
+        ))
+        return (" ".join(query.split()), normalized_filters, match if normalized_filters else "any", fusion)
+
+    @classmethod
+    def _result_cache_key(
+            cls,
+            query: str,
+            filters: Dict[str, Any] | None,
+            top_k: int,
+            match: str,
+            generation: int,
+            fusion: FusionOptions | None = None,
+        ) -> Tuple[Hashable, ...]:
+        return (*cls._request_key(query, filters, match, fusion), top_k, generation)
+
+    def cached_query_chunks(
+            self,
+            query: str,
+            filters: Dict[str, Any] | None,
+            top_k: int,
+            match: str = "any",
+            fusion: FusionOptions | None = None,
+        ) -> List[ChunkInfo] | None:
+        '''只查询检索结果缓存，未命中时返回 None'''
+        return self._cached_results(
+            self._result_cache_key(query, filters, top_k, match, self.corpus_generation, fusion)
+        )
+
+    def _cached_results(self, key: Tuple[Hashable, ...]) -> List[ChunkInfo] | None:
+        start = time.perf_counter()
+        cached = self.result_cache.get(key)
+        if cached is None:
+            return None
+        metrics.SEARCH_CACHE_HIT.observe(time.perf_counter() - start)
+        return list(cached)
+
     def query_chunks(
             self, 
             query: str, 
             filters: Dict[str, Any] | None,
-            top_k: int
+            top_k: int,
+            match: str = "any",
+            fusion: FusionOptions | None = None,
+        ) -> List[ChunkInfo]:
+        '''
+        检索文档块。
+        filters 形如 {"categories": [...], "tags": [...]}，match 指定同一字段内取值满足任一(any)或全部(all)，
+        fusion 覆盖本次检索的融合方式、权重与每路候选数
+        '''
+        # 先读取代次再读取检索模块：即使两次读取之间发生切换，结果也只会写入已失效的旧代次键
+        key = self._result_cache_key(query, filters, top_k, match, self.corpus_generation, fusion)
+        cached = self._cached_results(key)
+        if cached is not None:
+            return cached
+        return self._search_uncached(key, query, filters, top_k, match, fusion)
+
+    def _search_uncached(
+            self,
+            key: Tuple[Hashable, ...],
+            query: str,
+            filters: Dict[str, Any] | None,
+            top_k: int,
+            match: str,
+            fusion: FusionOptions | None,
         ) -> List[ChunkInfo]:
-        assert self.retrieval_module is not None
+        start = time.perf_counter()
+        # 整个查询只读取一次引用，期间发生的快照切换不影响本次结果
+        retrieval_module = self.retrieval_module
+        if retrieval_module is None:
+            raise ServiceNotReadyError("检索索引尚未加载或构建完成。")
         logger.info("正在执行查询...")
+        extra: Dict[str, Any] = {"fusion": fusion} if fusion is not None else {}
         if filters is None:
-            relevant_chunks = self.retrieval_module.hybrid_search(
-                query, top_k
+            relevant_chunks = retrieval_module.hybrid_search(
+                query, top_k, **extra
             )
         else:
-            relevant_chunks = self.retrieval_module.metadata_filtered_search(
-                query, filters, top_k
+            relevant_chunks = retrieval_module.metadata_filtered_search(
+                query, filters, top_k, match, **extra  # type: ignore[arg-type]
             )
         logger.info(f"检索到 {len(relevant_chunks)} 个相关文档块。")
-        
-        return [
-            ChunkInfo(content=doc.page_content, metadata=doc.metadata)
-            for doc in relevant_chunks
+
+        with metrics.STAGE_SERIALIZATION.time():
+            results = [
+                ChunkInfo(content=doc.page_content, metadata=doc.metadata)
+                for doc in relevant_chunks
+            ]
+        self.result_cache.put(key, results)
+        metrics.SEARCH_CACHE_MISS.observe(time.perf_counter() - start)
+        return list(results)
+
+    async def aquery_chunks(
+            self,
+            query: str,
+            filters: Dict[str, Any] | None,
+            top_k: int,
+            match: str = "any",
+            fusion: FusionOptions | None = None,
+        ) -> List[ChunkInfo]:
+        '''在专用线程池中执行检索，排队已满时抛出 SearchOverloadedError；命中结果缓存时直接返回'''
+        key = self._result_cache_key(query, filters, top_k, match, self.corpus_generation, fusion)
+        cached = self._cached_results(key)
+        if cached is not None:
+            return cached
+        if not self._search_slots.acquire(blocking=False):
+            raise SearchOverloadedError("检索请求过多，请稍后重试。")
+        try:
+            future = self.search_executor.submit(self._search_uncached, key, query, filters, top_k, match, fusion)
+        except BaseException:
+            self._search_slots.release()
+            raise
+        # 在任务真正结束（或未开始即被取消）时才释放名额
+        future.add_done_callback(lambda _: self._search_slots.release())
+        return await asyncio.wrap_future(future)
+
+    def _rank_depth(self, page: int, size: int, top_k: int | None) -> int:
+        '''
+        首次请求计算 search_rank_depth 条，使后续翻页直接命中游标；翻页超出已计算的深度时深度成倍增长，
+        逐页深翻的累计检索代价与最终深度成正比。指定 top_k 时只计算到 top_k。
+        '''
+        if top_k is not None:
+            return min(top_k, self.config.search_max_depth)
+        depth = self.config.search_rank_depth
+        while depth < page * size:
+            depth *= 2
+        return min(depth, self.config.search_max_depth)
+
+    def _cursor_ranked_list(
+            self,
+            cursor: str | None,
+            request: Tuple[Hashable, ...],
+            needed: int,
+        ) -> _RankedList | None:
+        '''游标有效、属于同一请求且已计算的深度足以覆盖所需页时返回对应的排序列表'''
+        if not cursor:
+            return None
+        ranked = self.cursor_cache.get(cursor)
+        if ranked is None or ranked.request != request:
+            return None
+        if len(ranked.items) < needed and not ranked.exhausted:
+            return None
+        return ranked
+
+    def _resume_page(
+            self,
+            request: Tuple[Hashable, ...],
+            page: int,
+            size: int,
+            top_k: int | None,
+            cursor: str | None,
+        ) -> Tuple[_RankedList, str] | None:
+        '''携带的游标可以直接切片时返回 (排序列表, 游标)，否则返回 None，由调用方按 _rank_depth 重新检索'''
+        needed = page * size if top_k is None else min(page * size, top_k)
+        ranked = self._cursor_ranked_list(cursor, request, needed)
+        if ranked is None or cursor is None:
+            return None
+        return ranked, cursor
+
+    def _store_ranked_list(
+            self,
+            request: Tuple[Hashable, ...],
+            depth: int,
+            items: List[ChunkInfo],
+        ) -> Tuple[_RankedList, str]:
+        ranked = _RankedList(request=request, depth=depth, items=items)
+        cursor = hashlib.md5(repr((request, depth, self.corpus_version)).encode("utf-8")).hexdigest()
+        self.cursor_cache.put(cursor, ranked)
+        return ranked, cursor
+
+    def _slice_page(self, ranked: _RankedList, cursor: str, page: int, size: int, top_k: int | None) -> SearchPage:
+        visible = ranked.items if top_k is None else ranked.items[:top_k]
+        end = page * size
+        # 列表未取尽且未达到深度上限时，更深的翻页会按更大的深度重新检索
+        more_upstream = not ranked.exhausted and top_k is None and ranked.depth < self.config.search_max_depth
+        return SearchPage(
+            items=visible[end - size:end],
+            total=len(visible),
+            cursor=cursor,
+            has_more=end < len(visible) or more_upstream,
+        )
+
+    def search_page(
+            self,
+            query: str,
+            filters: Dict[str, Any] | None,
+            page: int,
+            size: int,
+            match: str = "any",
+            top_k: int | None = None,
+            cursor: str | None = None,
+            fusion: FusionOptions | None = None,
+        ) -> SearchPage:
+        '''
+        分页检索：首次请求计算深排序列表并保存在游标下，携带游标的后续翻页直接切片，代价与页大小相关。
+        游标失效（过期、属于其他查询或深度不足）时按本次请求重新检索并返回新游标。
+        '''
+        request = self._request_key(query, filters, match, fusion)
+        resumed = self._resume_page(request, page, size, top_k, cursor)
+        if resumed is None:
+            depth = self._rank_depth(page, size, top_k)
+            resumed = self._store_ranked_list(request, depth, self.query_chunks(query, filters, depth, match, fusion))
+        return self._slice_page(*resumed, page, size, top_k)
+
+    async def asearch_page(
+            self,
+            query: str,
+            filters: Dict[str, Any] | None,
+            page: int,
+            size: int,
+            match: str = "any",
+            top_k: int | None = None,
+            cursor: str | None = None,
+            fusion: FusionOptions | None = None,
+        ) -> SearchPage:
+        '''search_page 的异步版本，需要重新检索时经由 aquery_chunks 排队'''
+        request = self._request_key(query, filters, match, fusion)
+        resumed = self._resume_page(request, page, size, top_k, cursor)
+        if resumed is None:
+            depth = self._rank_depth(page, size, top_k)
+            resumed = self._store_ranked_list(
+                request, depth, await self.aquery_chunks(query, filters, depth, match, fusion))
+        return self._slice_page(*resumed, page, size, top_k)
+
+    async def astream_answer(
+            self,
+            question: str,
+            filters: Dict[str, Any] | None = None,
+            top_k: int | None = None,
+            match: str = "any",
+        ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        '''
+        检索相关文档块并流式生成回答，依次产出 (事件, 数据)：
+        - sources: 检索到的文档块元数据与检索耗时
+        - token: 模型返回的文本增量
+        - done: 检索耗时、首字延迟（TTFT）、总耗时与增量数
+        '''
+        generation_module = self.generation_module
+        if generation_module is None:
+            raise RuntimeError("生成模块未初始化，请检查 LLM API 密钥配置。")
+        start = time.perf_counter()
+        chunks = await self.aquery_chunks(question, filters, top_k or self.config.answer_top_k, match)
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        yield "sources", {"items": [c.metadata for c in chunks], "retrievalMs": retrieval_ms}
+
+        context = [Document(page_content=c.content, metadata=c.metadata) for c in chunks]
+        first_token_ms: float | None = None
+        n_tokens = 0
+        async for text in generation_module.astream_basic_answer(
+                question, context, max_length=self.config.answer_context_length):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+                metrics.ANSWER_TTFT.observe(first_token_ms / 1000)
+            n_tokens += 1
+            yield "token", {"text": text}
+        total_ms = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"回答生成完成: 检索 {retrieval_ms:.0f}ms, 首字 {first_token_ms or total_ms:.0f}ms, "
+            f"总耗时 {total_ms:.0f}ms, 共 {n_tokens} 段。"
+        )
+        yield "done", {
+            "retrievalMs": retrieval_ms,
+            "ttftMs": first_token_ms,
+            "totalMs": total_ms,
+            "tokens": n_tokens,
+        }
+
+    def collect_metrics(self) -> List[metrics.FAMILY]:
+        '''采集时计算的进程内状态：各缓存命中情况、当前索引规模、最近一次构建的吞吐与重建状态'''
+        caches: Dict[str, LRUCache[Any]] = {
+            "query_embedding": self.query_cache,
+            "result": self.result_cache,
+            "cursor": self.cursor_cache,
+        }
+        if self.reranker is not None:
+            caches["rerank"] = self.reranker.cache
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        families: List[metrics.FAMILY] = [
+            metrics.counter_family("blog_rag_cache_hits", "缓存命中次数",
+                                   (({"cache": n}, s["hits"]) for n, s in stats.items())),
+            metrics.counter_family("blog_rag_cache_misses", "缓存未命中次数",
+                                   (({"cache": n}, s["misses"]) for n, s in stats.items())),
+            metrics.gauge_family("blog_rag_cache_hit_ratio", "缓存命中率",
+                                 (({"cache": n}, s["hit_ratio"]) for n, s in stats.items())),
+            metrics.gauge_family("blog_rag_cache_entries", "缓存条目数",
+                                 (({"cache": n}, s["entries"]) for n, s in stats.items())),
+            metrics.gauge_family("blog_rag_reindex_running", "是否有索引重建任务正在运行",
+                                 [({}, float(self.reindex_running))]),
         ]
+        from blog_rag.rag_modules.retrieval_optimization import RetrievalOptimizationModule
+
+        retrieval_module = self.retrieval_module
+        if isinstance(retrieval_module, RetrievalOptimizationModule):
+            index_size = [({"kind": "chunks"}, retrieval_module.n_chunks),
+                          ({"kind": "vectors"}, retrieval_module.vectorstore.index.ntotal),
+                          ({"kind": "live_delta"}, retrieval_module.delta.size)]
+            if retrieval_module.bm25_index is not None:
+                index_size.append(({"kind": "bm25_terms"}, len(retrieval_module.bm25_index.vocab)))
+            families.append(metrics.gauge_family("blog_rag_index_size", "当前在线索引的规模", index_size))
+        build_stats = self.index_module.build_stats if self.index_module is not None else None
+        if build_stats:
+            families.append(metrics.gauge_family(
+                "blog_rag_last_build_chunks_per_second", "最近一次构建的嵌入吞吐",
+                [({}, build_stats["chunks_per_second"])],
+            ))
+        return families
+
+    def close(self) -> None:
+        '''释放线程池等资源'''
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.search_executor.shutdown(wait=False, cancel_futures=True)
+        self.retrieval_executor.shutdown(wait=False, cancel_futures=True)
+        close_retrieval = getattr(self.retrieval_module, "close", None)
+        if close_retrieval is not None:
+            close_retrieval()
+        if self.query_batcher is not None:
+            self.query_batcher.close()
+        for module in [*self._retired_modules, self.data_module, self.index_module]:
+            if module is not None:
+                self._close_module(module)
 
     def query_markdown(self, id: str) -> MarkdownInfo | None:
         assert self.data_module is not None
         logger.info(f"正在查询Markdown文档，ID: {id}...")
-        path, doc = self.data_module.id2markdown.get(id, (None, None))
+        path, doc = self.data_module.get_markdown(id) or (None, None)
         if path and doc:
             return MarkdownInfo(
                 content=doc.page_content,
@@ -1,11 +1,33 @@
-from .data_preparation import DataPreparationModule
-from .index_construction import IndexConstructionModule
-from .retrieval_optimization import RetrievalOptimizationModule
-from .generation_integration import GenerationIntegrationModule
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .data_preparation import DataPreparationModule
+    from .index_construction import IndexConstructionModule
+    from .retrieval_optimization import RetrievalOptimizationModule
+    from .generation_integration import GenerationIntegrationModule
+
+# 各模块依赖 langchain、FAISS、HuggingFace 等重量级库，首次访问时才导入，
+# 使 API 进程与多进程切分的子进程在不需要时不必承担导入开销
+_LAZY_MODULES = {
+    "DataPreparationModule": ".data_preparation",
+    "IndexConstructionModule": ".index_construction",
+    "RetrievalOptimizationModule": ".retrieval_optimization",
+    "GenerationIntegrationModule": ".generation_integration",
+}
 
 __all__ = [
     "DataPreparationModule",
     "IndexConstructionModule",
     "RetrievalOptimizationModule",
     "GenerationIntegrationModule",
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import logging
+from functools import lru_cache
+from hashlib import md5
+from pathlib import Path
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER = Callable[[str], List[str]]
+
+# 连续的中日韩统一表意文字，或由字母数字组成的词
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9_]+")
+_SUFFIXES = ("ational", "ations", "ation", "ness", "ings", "ing", "edly", "ed", "ies", "es", "ly", "s")
+
+
+def _stem(word: str) -> str:
+    '''轻量英文词干提取：去除常见后缀'''
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def _is_cjk(run: str) -> bool:
+    return not run[0].isascii()
+
+
+def cjk_bigram_tokenize(text: str) -> List[str]:
+    '''中文按字二元组切分（单字片段保留单字），英文小写并提取词干'''
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text):
+        if _is_cjk(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(_stem(run.lower()))
+    return tokens
+
+
+def jieba_tokenize(text: str) -> List[str]:
+    '''中文使用 jieba 搜索引擎模式分词，英文小写并提取词干'''
+    import jieba  # 可选依赖
+
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text):
+        if _is_cjk(run):
+            tokens.extend(jieba.cut_for_search(run))
+        else:
+            tokens.append(_stem(run.lower()))
+    return tokens
+
+
+def whitespace_tokenize(text: str) -> List[str]:
+    return text.split()
+
+
+TOKENIZERS: Dict[str, TOKENIZER] = {
+    "cjk_bigram": cjk_bigram_tokenize,
+    "jieba": jieba_tokenize,
+    "whitespace": whitespace_tokenize,
+}
+
+
+@lru_cache(maxsize=None)
+def resolve_tokenizer(name: str) -> str:
+    '''返回实际使用的分词器名称：jieba 未安装时回退为 cjk_bigram（每个进程只警告一次）'''
+    if name not in TOKENIZERS:
+        raise ValueError(f"不支持的分词器: {name}")
+    if name == "jieba":
+        try:
+            import jieba  # noqa: F401
+        except ImportError:
+            logger.warning("未安装 jieba，BM25 回退为 cjk_bigram 分词；安装 jieba 后索引将按 jieba 分词重建。")
+            return "cjk_bigram"
+    return name
+
+
+def get_tokenizer(name: str) -> TOKENIZER:
+    return TOKENIZERS[resolve_tokenizer(name)]
+
+
+class BM25Index:
+    """BM25 倒排索引 - 按词项存储倒排列表（文档号数组 + 词频数组），查询只遍历命中词项的倒排列表"""
+    def __init__(
+            self,
+            vocab: Dict[str, int],
+            offsets: np.ndarray,
+            doc_ids: np.ndarray,
+            tfs: np.ndarray,
+            doc_lens: np.ndarray,
+            tokenizer: str = "cjk_bigram",
+            fingerprint: str = "",
+            k1: float = 1.5,
+            b: float = 0.75,
+        ) -> None:
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        # 记录实际使用的分词器，而非配置中请求的分词器
+        self.tokenizer_name = resolve_tokenizer(tokenizer)
+        self.tokenize = get_tokenizer(tokenizer)
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lens)
+        self.avgdl = float(doc_lens.mean()) if self.n_docs else 0.0
+        # 文档长度归一化项 k1 * (1 - b + b * dl / avgdl)，查询时直接使用
+        self.doc_norms = self._norms(doc_lens)
+
+    def _norms(self, doc_lens: np.ndarray) -> np.ndarray:
+        if not self.avgdl:
+            return np.full(len(doc_lens), self.k1, dtype=np.float32)
+        return (self.k1 * (1 - self.b + self.b * doc_lens / self.avgdl)).astype(np.float32)
+
+    @staticmethod
+    def compute_fingerprint(doc_keys: Iterable[str], tokenizer: str) -> str:
+        '''由文档标识序列与实际使用的分词器计算指纹，用于校验持久化索引是否与当前文档块一致'''
+        digest = md5(resolve_tokenizer(tokenizer).encode("utf-8"))
+        for key in doc_keys:
+            digest.update(key.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    @classmethod
+    def build(
+            cls,
+            texts: Iterable[str],
+            tokenizer: str = "cjk_bigram",
+            fingerprint: str = "",
+            k1: float = 1.5,
+            b: float = 0.75,
+        ) -> "BM25Index":
+        tokenize = get_tokenizer(tokenizer)
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_lens: List[int] = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_id, tf))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        flat = [pair for plist in postings for pair in plist]
+        doc_ids = np.fromiter((d for d, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((tf for _, tf in flat), dtype=np.float32, count=len(flat))
+        logger.info(f"BM25 倒排索引构建完成: {len(doc_lens)} 个文档, {len(vocab)} 个词项。")
+        return cls(vocab, offsets, doc_ids, tfs, np.asarray(doc_lens, dtype=np.float32),
+                   tokenizer=tokenizer, fingerprint=fingerprint, k1=k1, b=b)
+
+    def save(self, directory: str | Path) -> None:
+        '''
+        各文件先写入临时文件再 os.replace，目录中原有的文件可能仍被在线索引内存映射，不能原地覆盖。
+        保存期间先删除 meta.json，最后再写入，作为索引完整的标志。
+        '''
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "meta.json").unlink(missing_ok=True)
+        for name, array in (("offsets", self.offsets), ("doc_ids", self.doc_ids),
+                            ("tfs", self.tfs), ("doc_lens", self.doc_lens)):
+            tmp_path = directory / f"{name}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, directory / f"{name}.npy")
+        self._write_json(directory / "vocab.json", self.vocab)
+        self._write_json(directory / "meta.json", {
+            "tokenizer": self.tokenizer_name,
+            "fingerprint": self.fingerprint,
+            "k1": self.k1,
+            "b": self.b,
+        })
+        logger.info(f"BM25 倒排索引已保存到: {directory}")
+
+    @staticmethod
+    def _write_json(path: Path, data: object) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str | Path, fingerprint: Optional[str] = None) -> Optional["BM25Index"]:
+        '''以内存映射方式加载倒排索引；索引不存在或指纹不一致时返回 None'''
+        directory = Path(directory)
+        try:
+            with open(directory / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if fingerprint is not None and meta["fingerprint"] != fingerprint:
+                logger.info("BM25 倒排索引与当前文档块不一致，需要重建。")
+                return None
+            if resolve_tokenizer(meta["tokenizer"]) != meta["tokenizer"]:
+                logger.info(f"BM25 倒排索引使用的分词器 {meta['tokenizer']} 不可用，需要重建。")
+                return None
+            with open(directory / "vocab.json", "r", encoding="utf-8") as f:
+                vocab = json.load(f)
+            index = cls(
+                vocab,
+                np.load(directory / "offsets.npy", mmap_mode="r"),
+                np.load(directory / "doc_ids.npy", mmap_mode="r"),
+                np.load(directory / "tfs.npy", mmap_mode="r"),
+                np.load(directory / "doc_lens.npy", mmap_mode="r"),
+                tokenizer=meta["tokenizer"],
+                fingerprint=meta["fingerprint"],
+                k1=meta["k1"],
+                b=meta["b"],
+            )
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"加载 BM25 倒排索引失败: {e}")
+            return None
+        logger.info(f"已从 {directory} 加载 BM25 倒排索引。")
+        return index
+
+    def sparse_scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        只在查询词项倒排列表的并集上累加分数，返回 (升序文档号, 分数)；
+        代价与命中的倒排列表长度成正比，与语料规模无关
+        '''
+        hits: List[np.ndarray] = []
+        contributions: List[np.ndarray] = []
+        for term, qtf in Counter(self.tokenize(query)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            ids = self.doc_ids[start:end]
+            tfs = self.tfs[start:end]
+            df = end - start
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            hits.append(ids)
+            contributions.append(qtf * idf * tfs * (self.k1 + 1) / (tfs + self.doc_norms[ids]))
+        if not hits:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs, inverse = np.unique(np.concatenate(hits), return_inverse=True)
+        scores = np.zeros(len(docs), dtype=np.float32)
+        np.add.at(scores, inverse, np.concatenate(contributions).astype(np.float32))
+        return docs.astype(np.int64), scores
+
+    def get_scores(self, query: str) -> np.ndarray:
+        '''全部文档的稠密分数数组（未命中的文档为零分），用于调试与测试；排序请使用 top_k'''
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        docs, doc_scores = self.sparse_scores(query)
+        scores[docs] = doc_scores
+        return scores
+
+    def score_documents(self, query: str, term_counts: Sequence[Dict[str, int]], doc_lens: np.ndarray) -> np.ndarray:
+        '''
+        为索引之外的文档打分（在线增量段使用）：词频取自 term_counts，文档频率与平均长度沿用本索引，
+        分数与 get_scores 的结果可以直接比较。
+        '''
+        scores = np.zeros(len(term_counts), dtype=np.float32)
+        if not term_counts:
+            return scores
+        norms = self._norms(np.asarray(doc_lens, dtype=np.float32))
+        for term, qtf in Counter(self.tokenize(query)).items():
+            tfs = np.fromiter((counts.get(term, 0) for counts in term_counts), dtype=np.float32,
+                              count=len(term_counts))
+            if not tfs.any():
+                continue
+            term_id = self.vocab.get(term)
+            df = int(self.offsets[term_id + 1] - self.offsets[term_id]) if term_id is not None else 0
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            scores += qtf * idf * tfs * (self.k1 + 1) / (tfs + norms)
+        return scores
+
+    def top_k(
+            self,
+            query: str,
+            k: int,
+            candidates: Optional[np.ndarray] = None,
+            exclude: Optional[np.ndarray] = None,
+        ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        返回得分最高的 k 个文档号与分数数组，不含零分文档；candidates 不为空时只在其中选取，
+        exclude 中的文档不参与排序
+        '''
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs, scores = self.sparse_scores(query)
+        keep = scores > 0
+        if exclude is not None and len(exclude):
+            keep &= ~np.isin(docs, exclude)
+        if candidates is not None:
+            keep &= np.isin(docs, candidates)
+        docs, scores = docs[keep], scores[keep]
+        if len(docs) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order], scores[order]
+
+    def search(
+            self,
+            query: str,
+            k: int,
+            candidates: Optional[np.ndarray] = None,
+        ) -> List[Tuple[int, float]]:
+        '''返回得分最高的 k 个 (文档号, 分数)，不含零分文档；candidates 不为空时只在其中选取'''
+        ids, scores = self.top_k(query, k, candidates)
+        return [(int(i), float(score)) for i, score in zip(ids, scores)]
@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+import logging
+from pathlib import Path
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VectorCheckpoint:
+    """
+    索引构建检查点 - 按构建顺序追加保存文档块ID与嵌入向量：
+    - vectors.f32: 逐行追加的 float32 向量
+    - ids.txt: 与向量逐行对应的 chunk_id
+    - progress.json: 已确认写入的行数、维度与模型，写入后的数据才视为有效
+    构建中断后再次构建时，与检查点前缀一致的文档块直接复用已保存的向量。
+    """
+    def __init__(self, directory: str | Path, model_name: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self._vectors_path = self.directory / "vectors.f32"
+        self._ids_path = self.directory / "ids.txt"
+        self._progress_path = self.directory / "progress.json"
+        self.dim: int | None = None
+        self.ids: List[str] = []
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _load(self) -> None:
+        try:
+            with open(self._progress_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+            if progress["model"] != self.model_name:
+                logger.info("检查点来自其他嵌入模型，已忽略。")
+                self.truncate(0)
+                return
+            count, self.dim = int(progress["count"]), int(progress["dim"])
+            with open(self._ids_path, "r", encoding="utf-8") as f:
+                self.ids = f.read().splitlines()[:count]
+            if len(self.ids) < count or self._vectors_path.stat().st_size < count * self.dim * 4:
+                raise ValueError("检查点文件不完整")
+            self.truncate(count)
+            if count:
+                logger.info(f"已加载索引构建检查点，共 {count} 个向量。")
+        except FileNotFoundError:
+            self.truncate(0)
+        except Exception as e:
+            logger.error(f"加载索引构建检查点失败，将重新开始: {e}")
+            self.truncate(0)
+
+    def truncate(self, count: int) -> None:
+        '''丢弃第 count 行之后的数据（包括未确认的部分）'''
+        self.ids = self.ids[:count]
+        if count == 0:
+            self.dim = None
+        row_bytes = (self.dim or 0) * 4
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(count * row_bytes)
+        with open(self._ids_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{chunk_id}\n" for chunk_id in self.ids)
+        self.commit()
+
+    def append(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        if not len(ids):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        with open(self._vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._ids_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{chunk_id}\n" for chunk_id in ids)
+        self.ids.extend(ids)
+
+    def commit(self) -> None:
+        '''确认当前已追加的全部数据'''
+        tmp_path = self._progress_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim or 0, "count": len(self.ids)}, f)
+        os.replace(tmp_path, self._progress_path)
+
+    def vectors(self) -> np.ndarray:
+        '''以内存映射方式读取全部向量'''
+        if not self.ids or self.dim is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
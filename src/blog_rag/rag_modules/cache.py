@@ -0,0 +1,55 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """线程安全的 LRU 缓存，支持条目上限、过期时间与命中统计"""
+    def __init__(self, max_entries: int, ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, Tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,220 @@
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+CHUNKS = List[Document]
+
+# 中日韩文字与全角标点逐字计数，英文单词与数字按长度折算，其余非空白字符各计一个
+_TOKEN_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]|[A-Za-z]+|\d+|\S")
+_FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+# 句末标点：中文标点后直接断开，英文标点需后跟空白
+_SENTENCE_RE = re.compile(r"(?<=[。！？；])|(?<=[.!?;])\s+")
+
+
+@dataclass(frozen=True)
+class ChunkingOptions:
+    """二次切分参数（单位为估算的 token 数）；max_tokens 为 0 时不做二次切分"""
+    max_tokens: int = 480
+    overlap_tokens: int = 64
+    min_tokens: int = 32
+
+
+def estimate_tokens(text: str) -> int:
+    '''
+    估算 BERT 类中文模型（如 bge-small-zh）的 token 数：中文按字、英文单词按约 4 个字母一个子词计算。
+    估算值略偏大，以保证切分后的文档块不超过模型的最大输入长度。
+    '''
+    count = 0
+    for token in _TOKEN_RE.findall(text):
+        if token[0].isascii() and token[0].isalnum():
+            count += (len(token) + 3) // 4
+        else:
+            count += 1
+    return count
+
+
+def _blocks(text: str) -> List[Tuple[str, str]]:
+    '''把一节正文拆为 (类型, 文本) 块：code/math/table 为不可拆分的整体，text 为普通段落'''
+    lines = text.split("\n")
+    blocks: List[Tuple[str, str]] = []
+    paragraph: List[str] = []
+
+    def flush() -> None:
+        if paragraph:
+            blocks.append(("text", "\n".join(paragraph)))
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        fence = _FENCE_RE.match(line)
+        if fence:
+            flush()
+            j = i + 1
+            while j < len(lines) and not lines[j].strip().startswith(fence.group(1)):
+                j += 1
+            blocks.append(("code", "\n".join(lines[i:j + 1])))
+            i = j + 1
+        elif stripped.startswith("$$"):
+            flush()
+            j = i
+            if stripped == "$$" or not stripped.endswith("$$"):
+                j = i + 1
+                while j < len(lines) and "$$" not in lines[j]:
+                    j += 1
+            blocks.append(("math", "\n".join(lines[i:j + 1])))
+            i = j + 1
+        elif stripped.startswith("|"):
+            flush()
+            j = i
+            while j < len(lines) and lines[j].strip().startswith("|"):
+                j += 1
+            blocks.append(("table", "\n".join(lines[i:j])))
+            i = j
+        elif not stripped:
+            flush()
+            i += 1
+        else:
+            paragraph.append(line)
+            i += 1
+    flush()
+    return blocks
+
+
+def _split_lines(lines: List[str], max_tokens: int, head: List[str], tail: List[str]) -> List[str]:
+    '''按行切分过长的代码块/表格，每段重复 head（如代码围栏、表头）与 tail'''
+    budget = max(max_tokens - estimate_tokens("\n".join(head + tail)), 1)
+    pieces: List[str] = []
+    current: List[str] = []
+    tokens = 0
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if current and tokens + line_tokens > budget:
+            pieces.append("\n".join(head + current + tail))
+            current, tokens = [], 0
+        current.append(line)
+        tokens += line_tokens
+    if current:
+        pieces.append("\n".join(head + current + tail))
+    return pieces
+
+
+def _split_sentence(sentence: str, max_tokens: int) -> List[str]:
+    '''在 token 边界处截断过长的单句，每段逐个累加 token 数，保证不超过 max_tokens；单个超长的英文单词/数字按字符切开'''
+    pieces: List[str] = []
+    start = tokens = 0
+    for match in _TOKEN_RE.finditer(sentence):
+        count = estimate_tokens(match.group())
+        if tokens and tokens + count > max_tokens:
+            pieces.append(sentence[start:match.start()])
+            start, tokens = match.start(), 0
+        while count > max_tokens:
+            # 英文单词/数字每 4 个字符计一个 token
+            pieces.append(sentence[start:start + 4 * max_tokens])
+            start += 4 * max_tokens
+            count = estimate_tokens(sentence[start:match.end()])
+        tokens += count
+    pieces.append(sentence[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+
+def _split_text(text: str, max_tokens: int) -> List[str]:
+    '''按句切分过长的段落，单句仍然过长时在 token 边界处截断'''
+    pieces: List[str] = []
+    for sentence in filter(None, _SENTENCE_RE.split(text)):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_split_sentence(sentence, max_tokens))
+    return pieces
+
+
+def _units(text: str, max_tokens: int) -> List[str]:
+    '''把一节正文拆为不超过 max_tokens 的最小单元，代码围栏、表格与公式块内部不断开（除非单块本身过长）'''
+    units: List[str] = []
+    for kind, block in _blocks(text):
+        if estimate_tokens(block) <= max_tokens:
+            units.append(block)
+        elif kind == "code":
+            lines = block.split("\n")
+            closed = len(lines) > 1 and _FENCE_RE.match(lines[-1]) is not None
+            body = lines[1:-1] if closed else lines[1:]
+            fence = _FENCE_RE.match(lines[0])
+            units.extend(_split_lines(body, max_tokens, lines[:1], [fence.group(1) if fence else "```"]))
+        elif kind == "table":
+            lines = block.split("\n")
+            units.extend(_split_lines(lines[2:], max_tokens, lines[:2], []))
+        elif kind == "math":
+            body = block.strip()[2:]
+            if body.endswith("$$"):
+                body = body[:-2]
+            units.extend(_split_lines(body.strip("\n").split("\n"), max_tokens, ["$$"], ["$$"]))
+        else:
+            units.extend(_split_text(block, max_tokens))
+    return units
+
+
+def split_section(text: str, options: ChunkingOptions) -> List[str]:
+    '''
+    把超过 max_tokens 的一节按块/句切分为多个窗口，相邻窗口之间重叠不超过 overlap_tokens 的完整单元。
+    未超长的节原样返回。
+    '''
+    if not options.max_tokens or estimate_tokens(text) <= options.max_tokens:
+        return [text]
+    windows: List[str] = []
+    current: List[Tuple[str, int]] = []
+    current_tokens = 0
+    for unit in _units(text, options.max_tokens):
+        tokens = estimate_tokens(unit)
+        if current and current_tokens + tokens > options.max_tokens:
+            windows.append("\n\n".join(u for u, _ in current))
+            # 从上一个窗口末尾取不超过 overlap_tokens 的完整单元作为重叠
+            overlap: List[Tuple[str, int]] = []
+            overlap_tokens = 0
+            for item in reversed(current):
+                if overlap_tokens + item[1] > options.overlap_tokens:
+                    break
+                overlap.insert(0, item)
+                overlap_tokens += item[1]
+            if len(overlap) == len(current) or overlap_tokens + tokens > options.max_tokens:
+                overlap, overlap_tokens = [], 0
+            current, current_tokens = overlap, overlap_tokens
+        current.append((unit, tokens))
+        current_tokens += tokens
+    if current:
+        windows.append("\n\n".join(u for u, _ in current))
+    return windows
+
+
+def merge_small_sections(sections: CHUNKS, options: ChunkingOptions) -> CHUNKS:
+    '''
+    把少于 min_tokens 的节并入其后一节（最后一节并入前一节），合并后不超过 max_tokens。
+    合并后的节沿用其中第一节的元数据（标题层级），与正文开头的标题保持一致。
+    '''
+    if not options.min_tokens:
+        return sections
+    limit = options.max_tokens or float("inf")
+    merged: CHUNKS = []
+    carry: Document | None = None
+    for section in sections:
+        if carry is not None:
+            combined = f"{carry.page_content}\n\n{section.page_content}"
+            if estimate_tokens(combined) <= limit:
+                section = Document(page_content=combined, metadata=carry.metadata)
+            else:
+                merged.append(carry)
+            carry = None
+        if estimate_tokens(section.page_content) < options.min_tokens:
+            carry = section
+        else:
+            merged.append(section)
+    if carry is not None:
+        if merged and estimate_tokens(f"{merged[-1].page_content}\n\n{carry.page_content}") <= limit:
+            last = merged[-1]
+            merged[-1] = Document(page_content=f"{last.page_content}\n\n{carry.page_content}", metadata=last.metadata)
+        else:
+            merged.append(carry)
+    return merged
@@ -1,107 +1,362 @@
 import re
-import pickle
+import json
 import logging
 import operator
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from hashlib import md5
 from pathlib import Path
-from uuid import uuid4
-from typing import Tuple, Dict, List, Set, Any
+from typing import Tuple, Deque, Dict, Iterable, Iterator, List, Set, Any, Sequence
+
+import yaml
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from langchain_core.documents import Document
 
+from .doc_store import DocumentStore, DocumentStoreWriter, metadata_column, migrate_pickle
+from .chunking import ChunkingOptions, estimate_tokens, merge_small_sections, split_section
+
 logger = logging.getLogger(__name__)
 
 CHUNKS = List[Document]
 MARKDOWNS = List[Document]
+# 文件清单：相对路径 -> {"hash": 内容哈希, "mtime": 修改时间, "chunk_ids": 文档块ID列表}
+MANIFEST = Dict[str, Dict[str, Any]]
+
+# 匹配从文首开始的 front matter 区块
+_FRONT_MATTER_RE = re.compile(r"^---\s*\n(.*?)\n---\s*\n?", re.DOTALL)
+# 切分层级
+_HEADERS_TO_SPLIT_ON = [
+    ("#", "h1"),
+    ("##", "h2"),
+    ("###", "h3"),
+    ("####", "h4"),
+]
+
+
+@lru_cache(maxsize=1)
+def _markdown_splitter() -> MarkdownHeaderTextSplitter:
+    return MarkdownHeaderTextSplitter(
+        headers_to_split_on=_HEADERS_TO_SPLIT_ON,
+        strip_headers=False, # 保留标题以便上下文理解
+    )
+
+
+def read_markdown_file(markdown_dir: Path, md_file: Path) -> Document:
+    content = md_file.read_text(encoding="utf-8")
+    relative_path = md_file.relative_to(markdown_dir).as_posix()
+    file_id = md5(relative_path.encode("utf-8")).hexdigest()
+
+    # 创建 Document 对象并附加元数据
+    return Document(
+        page_content=content,
+        metadata={
+            "path": relative_path,
+            "file_id": file_id,
+            "doc_type": "markdown"
+        }
+    )
+
+
+def parse_front_matter(doc: Document) -> None:
+    '''解析 YAML front matter 并合并到文档元数据'''
+    content = doc.page_content
+    meta = doc.metadata
+
+    if not content.startswith("---"):
+        logger.warning(f"文档 {meta.get('path', '未知')} 缺少 front matter，跳过元数据解析。")
+        return
+
+    m = _FRONT_MATTER_RE.match(content)
+    if m is None:
+        logger.warning(f"文档 {meta.get('path', '未知')} front matter 格式不正确，跳过元数据解析。")
+        return
+
+    try:
+        inline_meta = yaml.safe_load(m.group(1)) or {}
+        if not isinstance(inline_meta, dict):
+            inline_meta = {}
+    except Exception:
+        inline_meta = {}
+    doc.metadata.update(inline_meta)
+
+
+def split_markdown(doc: Document, options: ChunkingOptions = ChunkingOptions()) -> CHUNKS:
+    '''
+    按标题层级切分单篇文档，再按 token 数二次切分过长的节、合并过短的相邻节；
+    文档块继承父文档元数据并获得确定性的 chunk_id
+    '''
+    sections = _markdown_splitter().split_text(doc.page_content)
+    md_chunks = merge_small_sections([
+        Document(page_content=piece, metadata=dict(section.metadata))
+        for section in sections
+        for piece in split_section(section.page_content, options)
+    ], options)
+    logger.debug(f"文档 {doc.metadata.get('path', '未知')} 被切分为 {len(md_chunks)} 个块。")
+
+    # 为每个块建立与父文档的联系
+    seen: Dict[str, int] = {}
+    for i, chunk in enumerate(md_chunks):
+        child_id = chunk_id(doc.metadata.get("file_id", ""), chunk, seen)
+        chunk.metadata.update(doc.metadata)  # 继承父文档元数据
+
+        chunk.metadata.update({
+            "chunk_id": child_id,
+            "parent_id": doc.metadata.get("file_id"),
+            "chunk_index": i,
+            "chunk_size": len(chunk.page_content),
+            "chunk_tokens": estimate_tokens(chunk.page_content),
+        })
+    return md_chunks
+
+
+def chunk_id(file_id: str, chunk: Document, seen: Dict[str, int]) -> str:
+    '''
+    由 (file_id, 标题路径, 块内容哈希) 生成确定性的文档块ID，
+    内容不变的文档块在多次构建间保持相同ID。
+    seen 记录同一文件内已出现的键，用于区分标题与内容完全相同的重复块。
+    '''
+    header_path = " > ".join(
+        chunk.metadata[h] for h in ("h1", "h2", "h3", "h4") if h in chunk.metadata
+    )
+    content_hash = md5(chunk.page_content.encode("utf-8")).hexdigest()
+    key = f"{file_id}\x00{header_path}\x00{content_hash}"
+    occurrence = seen.get(key, 0)
+    seen[key] = occurrence + 1
+    if occurrence:
+        key += f"\x00{occurrence}"
+    return md5(key.encode("utf-8")).hexdigest()
+
+
+def load_markdown_file(
+        markdown_dir: Path,
+        md_file: Path,
+        split: bool = True,
+        options: ChunkingOptions = ChunkingOptions(),
+    ) -> Tuple[Document, CHUNKS]:
+    '''读取、解析并（可选）切分单个文件；在进程池中执行，须为模块级函数'''
+    doc = read_markdown_file(markdown_dir, md_file)
+    parse_front_matter(doc)
+    return doc, split_markdown(doc, options) if split else []
+
+
+@dataclass
+class FileChanges:
+    '''重新解析的文件变更：相对路径 -> 新文档（文件已删除时为 None），以及这些文件的新文档块'''
+    documents: Dict[str, Document | None]
+    chunks: CHUNKS
+
 
 class DataPreparationModule:
-    categories: Set[Any] = set()
-    tags: Set[Any] = set()
-    id2markdown: Dict[str, Tuple[Path, Document]] = dict()
+    # 子进程启动需重新导入依赖，文件数少于该值时串行处理更快
+    parallel_min_files = 64
 
-    def __init__(self, markdown_dir: str | Path, cache_dir: str | Path):
+    def __init__(
+            self,
+            markdown_dir: str | Path,
+            cache_dir: str | Path,
+            store_dir: str | Path | None = None,
+            workers: int = 1,
+            batch_size: int = 256,
+            chunking: ChunkingOptions | None = None,
+        ):
         self.markdown_dir = Path(markdown_dir).resolve()
         self.cache_dir = Path(cache_dir).resolve()
+        # 解析与切分的进程数（1 表示在当前进程内串行处理），以及流式输出的文档块批量
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunking = chunking or ChunkingOptions()
+        # 文档、文档块与文件清单的保存目录，默认与缓存目录相同；索引快照各自使用独立目录
+        self.store_dir = Path(store_dir).resolve() if store_dir is not None else self.cache_dir
+        self.categories: Set[Any] = set()
+        self.tags: Set[Any] = set()
+        self._category_counts: Counter[Any] = Counter()
+        self._tag_counts: Counter[Any] = Counter()
+        self.id2markdown: Dict[str, Tuple[Path, Document]] = {}
+        # 从文档存储恢复时 file_id -> 行号，Document 在被查询时才构造
+        self._markdown_rows: Dict[str, int] = {}
         self.documents: MARKDOWNS = [] # 存储加载的 Markdown 文档列表
         self.chunks: CHUNKS = []      # 存储切分后的文档块列表
 
     def generate_markdown(self) -> MARKDOWNS:
+        '''读取并解析全部文件（不切分）'''
         logger.info(f"正在从 {self.markdown_dir} 加载 Markdown 文件...")
-        documents: MARKDOWNS = []
-        for md_file in self.markdown_dir.rglob("*.md"):
-            content = md_file.read_text(encoding="utf-8")
-            relative_path = md_file.relative_to(self.markdown_dir).as_posix()
-            file_id = md5(relative_path.encode("utf-8")).hexdigest()
-
-            # 创建 Document 对象并附加元数据
-            doc = Document(
-                page_content=content,
-                metadata={
-                    "path": relative_path,
-                    "file_id": file_id,
-                    "doc_type": "markdown"
-                }
+        self.documents = [doc for doc, _ in self._load_files(self._markdown_files(), split=False)]
+        for doc in self.documents:
+            self.id2markdown[doc.metadata["file_id"]] = (self.markdown_dir / doc.metadata["path"], doc)
+        self._collect_categories_and_tags()
+        return self.documents
+
+    def stream_chunks(self, batch_size: int | None = None) -> Iterator[CHUNKS]:
+        '''
+        流水线式读取、解析并切分全部文件，按批产出文档块，供下游（如嵌入）边切分边消费。
+        文档与文档块在产出的同时追加写入 store_dir 下的文档存储，已产出的批次不在本模块中保留，
+        内存占用只与批量和在途文件数相关；产出顺序与文件顺序一致。
+        迭代结束后文件清单已保存，documents/chunks 为以内存映射方式打开的文档存储。
+        '''
+        batch_size = batch_size or self.batch_size
+        logger.info(f"正在从 {self.markdown_dir} 加载并切分 Markdown 文件（{self.workers} 个进程）...")
+        manifest: MANIFEST = {}
+        pending: Deque[Document] = deque()
+        with DocumentStoreWriter(self.store_dir / "markdowns") as documents, \
+                DocumentStoreWriter(self.store_dir / "chunks") as chunks:
+            for doc, doc_chunks in self._load_files(self._markdown_files(), split=True):
+                documents.add(doc)
+                chunks.extend(doc_chunks)
+                manifest[doc.metadata["path"]] = self._manifest_entry(doc, doc_chunks)
+                pending.extend(doc_chunks)
+                while len(pending) >= batch_size:
+                    yield [pending.popleft() for _ in range(batch_size)]
+            if pending:
+                yield list(pending)
+            n_documents, n_chunks = len(documents), len(chunks)
+        self.save_manifest(manifest)
+        self._reload_stores()
+        logger.info(f"切分完成!共 {n_documents} 个文件, {n_chunks} 个文档块。")
+
+    def _markdown_files(self) -> List[Path]:
+        return sorted(self.markdown_dir.rglob("*.md"))
+
+    def _load_files(self, files: List[Path], split: bool) -> Iterator[Tuple[Document, CHUNKS]]:
+        '''按文件顺序产出 (文档, 文档块)；文件较多时分发到进程池，在途任务数受限'''
+        if self.workers <= 1 or len(files) < max(self.parallel_min_files, 2 * self.workers):
+            results: Iterable[Tuple[Document, CHUNKS]] = (
+                load_markdown_file(self.markdown_dir, md_file, split, self.chunking) for md_file in files
             )
-            documents.append(doc)
-            self.id2markdown[file_id] = (md_file, doc)
-        for doc in documents:
-            self._update_metadata(doc)
-            if "categories" in doc.metadata:
-                if isinstance(doc.metadata["categories"], list):
-                    self.categories.update(doc.metadata["categories"])
-                else:
-                    logger.warning(f"文档 {doc.metadata.get('path', '未知')} 的 categories 不是列表类型。")
-            if "tags" in doc.metadata:
-                if isinstance(doc.metadata["tags"], list):
-                    self.tags.update(doc.metadata["tags"])
-                else:
-                    logger.warning(f"文档 {doc.metadata.get('path', '未知')} 的 tags 不是列表类型。")
-        self.documents = documents
-        return documents
+        else:
+            results = self._load_files_parallel(files, split)
+        yield from results
 
-    def load_markdowns(self) -> MARKDOWNS:
-        markdown_path = self.cache_dir / "markdowns.pkl"
-        logger.info(f"正在从 {markdown_path} 加载 Markdown 文档……")
-        try:
-            with open(markdown_path, "rb") as f:
-                self.documents = pickle.load(f)
-        except Exception as e:
-            logger.error(f"加载 Markdown 文档失败: {e}")
-            self.documents = []
-        finally:
-            logger.info(f"已加载 {len(self.documents)} 个 Markdown 文档。")
-            return self.documents
+    def _load_files_parallel(self, files: List[Path], split: bool) -> Iterator[Tuple[Document, CHUNKS]]:
+        max_in_flight = self.workers * 4
+        # 使用 spawn 启动子进程，避免在已加载模型、存在多线程的进程中 fork
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            in_flight: Deque[Future] = deque()
+            for md_file in files:
+                in_flight.append(pool.submit(load_markdown_file, self.markdown_dir, md_file, split, self.chunking))
+                if len(in_flight) >= max_in_flight:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
 
-    def save_markdowns(self) -> None:
-        markdown_path = self.cache_dir / "markdowns.pkl"
-        logger.info(f"正在保存加载的 Markdown 文档到 {markdown_path}...")
-        with open(markdown_path, "wb") as f:
-            pickle.dump(self.documents, f)
+    def _collect_categories_and_tags(self) -> None:
+        # 按列读取元数据，不构造 Document；记录每个取值出现的文档数，文件变更时据此增量更新
+        category_counts: Counter[Any] = Counter()
+        tag_counts: Counter[Any] = Counter()
+        columns = zip(
+            metadata_column(self.documents, "path"),
+            metadata_column(self.documents, "categories"),
+            metadata_column(self.documents, "tags"),
+        )
+        for path, doc_categories, doc_tags in columns:
+            category_counts.update(self._list_value(path, "categories", doc_categories))
+            tag_counts.update(self._list_value(path, "tags", doc_tags))
+        self._set_categories_and_tags(category_counts, tag_counts)
 
-    def _update_metadata(self, doc: Document) -> None:
-        content = doc.page_content
-        meta = doc.metadata
+    def _set_categories_and_tags(self, category_counts: Counter[Any], tag_counts: Counter[Any]) -> None:
+        # 构造新的集合后整体替换，避免并发读取时集合在迭代中被修改
+        self._category_counts, self._tag_counts = category_counts, tag_counts
+        self.categories, self.tags = set(category_counts), set(tag_counts)
 
-        if not content.startswith("---"):
-            logger.warning(f"文档 {meta.get('path', '未知')} 缺少 front matter，跳过元数据解析。")
-            return
+    @classmethod
+    def _list_field(cls, doc: Document, key: str) -> Set[Any]:
+        return cls._list_value(doc.metadata.get("path"), key, doc.metadata.get(key))
 
-        # 匹配从文首开始的 front matter 区块
-        m = re.match(r"^---\s*\n(.*?)\n---\s*\n?", content, re.DOTALL)
-        if m is None:
-            logger.warning(f"文档 {meta.get('path', '未知')} front matter 格式不正确，跳过元数据解析。")
-            return
+    @staticmethod
+    def _list_value(path: str | None, key: str, value: Any) -> Set[Any]:
+        '''分类/标签字段的取值集合；字段不是列表时记录警告并忽略'''
+        if value is None:
+            return set()
+        if not isinstance(value, list):
+            logger.warning(f"文档 {path or '未知'} 的 {key} 不是列表类型。")
+            return set()
+        return set(value)
 
-        fm_text = m.group(1)
+    def load_metadata(self) -> bool:
+        '''
+        从已保存的文档存储恢复分类、标签与文档索引，不重新解析 Markdown 文件，也不构造 Document；
+        返回是否存在已保存的文档。
+        '''
+        documents = self.load_markdowns()
+        self._markdown_rows = {
+            file_id: row for row, file_id in enumerate(metadata_column(documents, "file_id")) if file_id
+        }
+        self._collect_categories_and_tags()
+        return len(documents) > 0
 
-        try:
-            import yaml  # 可选依赖
-            inline_meta = yaml.safe_load(fm_text) or {}
-            if not isinstance(meta, dict):
-                inline_meta = {}
-        except Exception:
-            inline_meta = {}
-        doc.metadata.update(inline_meta)
+    def get_markdown(self, file_id: str) -> Tuple[Path, Document] | None:
+        '''按文档 ID 查找 (文件路径, 文档)，未解析过的文档从文档存储中读取'''
+        entry = self.id2markdown.get(file_id)
+        row = self._markdown_rows.get(file_id)
+        if entry is None and row is not None and isinstance(self.documents, DocumentStore):
+            doc = self.documents[row]
+            entry = (self.markdown_dir / doc.metadata["path"], doc)
+        return entry
+
+    def stage_files(self, paths: Iterable[str | Path]) -> FileChanges:
+        '''
+        重新解析并切分指定的文件（新增、修改或已删除），不修改本模块的任何状态；
+        在线索引切换成功后再调用 commit_files 提交。
+        Args:
+            paths: 文件路径，绝对路径或相对于 markdown_dir 的路径
+        '''
+        documents: Dict[str, Document | None] = {}
+        for path in paths:
+            md_file = (self.markdown_dir / path).resolve()
+            if md_file.suffix != ".md" or not md_file.is_relative_to(self.markdown_dir):
+                continue
+            relative_path = md_file.relative_to(self.markdown_dir).as_posix()
+            if md_file.is_file():
+                doc = read_markdown_file(self.markdown_dir, md_file)
+                self._update_metadata(doc)
+                documents[relative_path] = doc
+            else:
+                documents[relative_path] = None
+        chunks = self._markdown_split([doc for doc in documents.values() if doc is not None])
+        if documents:
+            logger.info(f"已重新解析 {len(documents)} 个文件，生成 {len(chunks)} 个文档块。")
+        return FileChanges(documents, chunks)
+
+    def commit_files(self, changes: FileChanges) -> None:
+        '''
+        提交 stage_files 的结果：更新文档索引、分类与标签，代价只与变更文件数相关。
+        documents/chunks 仍为快照中的内容（文档存储不会被读入内存），变更由下一次重建写入新快照。
+        '''
+        category_counts, tag_counts = Counter(self._category_counts), Counter(self._tag_counts)
+        for path, doc in changes.documents.items():
+            file_id = md5(path.encode("utf-8")).hexdigest()
+            old = self.get_markdown(file_id)
+            if old is not None:
+                category_counts.subtract(self._list_field(old[1], "categories"))
+                tag_counts.subtract(self._list_field(old[1], "tags"))
+            self._markdown_rows.pop(file_id, None)
+            if doc is None:
+                self.id2markdown.pop(file_id, None)
+                continue
+            self.id2markdown[file_id] = (self.markdown_dir / path, doc)
+            category_counts.update(self._list_field(doc, "categories"))
+            tag_counts.update(self._list_field(doc, "tags"))
+        self._set_categories_and_tags(+category_counts, +tag_counts)
+
+    def load_markdowns(self) -> Sequence[Document]:
+        markdown_path = self.store_dir / "markdowns"
+        logger.info(f"正在从 {markdown_path} 加载 Markdown 文档……")
+        store = self._load_store(markdown_path, "markdowns.pkl")
+        self._close_store(self.documents)
+        self.documents = store if store is not None else []  # type: ignore[assignment]
+        logger.info(f"已加载 {len(self.documents)} 个 Markdown 文档。")
+        return self.documents
+
+    def save_markdowns(self) -> None:
+        markdown_path = self.store_dir / "markdowns"
+        logger.info(f"正在保存加载的 Markdown 文档到 {markdown_path}...")
+        DocumentStore.save(markdown_path, self.documents)
+
+    def _update_metadata(self, doc: Document) -> None:
+        parse_front_matter(doc)
 
     def get_categories_and_tags(self) -> Tuple[Set[Any], Set[Any]]:
         return self.categories, self.tags
@@ -120,63 +375,136 @@ class DataPreparationModule:
         return chunks
 
     def save_chunks(self) -> None:
-        chunks_path = self.cache_dir / "chunks.pkl"
+        chunks_path = self.store_dir / "chunks"
         logger.info(f"正在保存文档块到 {chunks_path}...")
-        with open(chunks_path, "wb") as f:
-            pickle.dump(self.chunks, f)
+        DocumentStore.save(chunks_path, self.chunks)
 
-    def load_chunks(self) -> CHUNKS:
-        chunks_path = self.cache_dir / "chunks.pkl"
+    def load_chunks(self) -> Sequence[Document]:
+        '''以内存映射方式打开文档块存储，Document 仅在被访问时构造'''
+        chunks_path = self.store_dir / "chunks"
         logger.info(f"正在从 {chunks_path} 加载文档块……")
+        store = self._load_store(chunks_path, "chunks.pkl")
+        self._close_store(self.chunks)
+        self.chunks = store if store is not None else []  # type: ignore[assignment]
+        logger.info(f"已加载 {len(self.chunks)} 个文档块。")
+        return self.chunks
+
+    def _load_store(self, directory: Path, legacy_name: str) -> DocumentStore | None:
+        '''打开文档存储；不存在时尝试转换旧版本保存在同一目录下的 pickle 缓存'''
         try:
-            with open(chunks_path, "rb") as f:
-                self.chunks = pickle.load(f)
+            return DocumentStore.load(directory) or migrate_pickle(self.store_dir / legacy_name, directory)
         except Exception as e:
-            logger.error(f"加载文档块失败: {e}")
-            self.chunks = []
-        finally:
-            logger.info(f"已加载 {len(self.chunks)} 个文档块。")
-            return self.chunks        
-
-    def renew_data(self) -> Tuple[MARKDOWNS, CHUNKS]:
-        self.generate_markdown()
-        self.save_markdowns()
-        self.chunk_markdowns()
-        self.save_chunks()
+            logger.error(f"加载文档存储 {directory} 失败: {e}")
+            return None
+
+    @staticmethod
+    def _close_store(documents: Sequence[Document]) -> None:
+        if isinstance(documents, DocumentStore):
+            documents.close()
+
+    def close(self) -> None:
+        '''关闭打开的文档存储（内存映射与文件句柄）'''
+        self._close_store(self.documents)
+        self._close_store(self.chunks)
+
+    def renew_data(self) -> Tuple[Sequence[Document], Sequence[Document]]:
+        for _ in self.stream_chunks():
+            pass
         return self.documents, self.chunks
 
-    def _markdown_split(self) -> CHUNKS:
-        # 切分层级
-        headers_to_split_on = [
-            ("#", "h1"),
-            ("##", "h2"),
-            ("###", "h3"),
-            ("####", "h4"),
+    def renew_data_incremental(
+            self,
+            manifest: MANIFEST,
+            old_chunks: Sequence[Document],
+        ) -> Tuple[CHUNKS, List[str]]:
+        '''
+        根据文件清单增量更新数据：全部文件经由与全量构建相同的进程池读取并比对内容哈希，
+        新增或内容变化的文件再经由同一进程池切分；未变化的文档块从旧文档存储逐个复制到新的文档存储。
+        Args:
+            manifest: 上一次构建保存的文件清单
+            old_chunks: 上一次构建的文档块
+        Returns:
+            Tuple[List[Document], List[str]]: 需要新增的文档块, 需要删除的文档块ID
+        '''
+        new_manifest: MANIFEST = {}
+        current_paths: Set[str] = set()
+        changed_paths: List[str] = []
+        with DocumentStoreWriter(self.store_dir / "markdowns") as documents:
+            for doc, _ in self._load_files(self._markdown_files(), split=False):
+                documents.add(doc)
+                path = doc.metadata["path"]
+                current_paths.add(path)
+                entry = manifest.get(path)
+                if entry is None or entry.get("hash") != self._content_hash(doc):
+                    changed_paths.append(path)
+                else:
+                    new_manifest[path] = {**entry, "mtime": (self.markdown_dir / path).stat().st_mtime}
+
+        new_chunks: CHUNKS = []
+        for doc, doc_chunks in self._load_files([self.markdown_dir / p for p in changed_paths], split=True):
+            new_chunks.extend(doc_chunks)
+            new_manifest[doc.metadata["path"]] = self._manifest_entry(doc, doc_chunks)
+
+        stale_paths = set(changed_paths) | (manifest.keys() - current_paths)
+        stale_ids: List[str] = [
+            chunk_id
+            for path in stale_paths if path in manifest
+            for chunk_id in manifest[path].get("chunk_ids", [])
         ]
+        stale_id_set = set(stale_ids)
+        with DocumentStoreWriter(self.store_dir / "chunks") as chunks:
+            for row, chunk_id in enumerate(metadata_column(old_chunks, "chunk_id")):
+                if chunk_id not in stale_id_set:
+                    chunks.add(old_chunks[row])
+            chunks.extend(new_chunks)
+        self.save_manifest(new_manifest)
+        self._reload_stores()
 
-        markdown_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=headers_to_split_on,
-            strip_headers=False, # 保留标题以便上下文理解
+        logger.info(
+            f"增量更新完成: 变更 {len(changed_paths)} 个文件, "
+            f"删除 {len(stale_paths) - len(changed_paths)} 个文件, "
+            f"新增 {len(new_chunks)} 个文档块, 移除 {len(stale_ids)} 个文档块。"
         )
+        return new_chunks, stale_ids
+
+    def _reload_stores(self) -> None:
+        '''以内存映射方式重新打开刚写入的文档存储，并据此恢复文档索引、分类与标签'''
+        self.id2markdown = {}
+        self.load_metadata()
+        self.load_chunks()
+
+    def load_manifest(self) -> MANIFEST:
+        manifest_path = self.store_dir / "manifest.json"
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"加载文件清单失败: {e}")
+            return {}
+
+    def save_manifest(self, manifest: MANIFEST) -> None:
+        manifest_path = self.store_dir / "manifest.json"
+        logger.info(f"正在保存文件清单到 {manifest_path}...")
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    def _manifest_entry(self, doc: Document, chunks: CHUNKS) -> Dict[str, Any]:
+        return {
+            "hash": self._content_hash(doc),
+            "mtime": (self.markdown_dir / doc.metadata["path"]).stat().st_mtime,
+            "chunk_ids": [chunk.metadata["chunk_id"] for chunk in chunks],
+        }
+
+    @staticmethod
+    def _content_hash(doc: Document) -> str:
+        return md5(doc.page_content.encode("utf-8")).hexdigest()
+
+    def _markdown_split(self, documents: MARKDOWNS | None = None) -> CHUNKS:
         chunks: CHUNKS = []
-        for doc in self.documents:
-            md_chunks = markdown_splitter.split_text(doc.page_content)
-            
-            logger.debug(f"文档 {doc.metadata.get('path', '未知')} 被切分为 {len(md_chunks)} 个块。")
-
-            # 为每个块建立与父文档的联系
-            for i, chunk in enumerate(md_chunks):
-                child_id = uuid4().hex
-                chunk.metadata.update(doc.metadata)  # 继承父文档元数据
-
-                chunk.metadata.update({
-                    "chunk_id": child_id,
-                    "parent_id": doc.metadata.get("file_id"),
-                    "chunk_index": i,
-                    "chunk_size": len(chunk.page_content)
-                })
-            chunks.extend(md_chunks)
-        
+        for doc in (self.documents if documents is None else documents):
+            chunks.extend(split_markdown(doc, self.chunking))
         return chunks
 
     def filter_doc_by_categories(self, categories: List[str]) -> MARKDOWNS:
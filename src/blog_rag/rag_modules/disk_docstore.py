@@ -0,0 +1,95 @@
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+from .doc_store import DocumentStore, DocumentStoreWriter
+
+
+class DiskDocstore(Docstore, AddableMixin):
+    """
+    FAISS 的磁盘 docstore - 正文与元数据保存在 DocumentStore 中（内存映射读取），内存中只保留 chunk_id 到行号的映射：
+    - 增量更新新增的文档保存在内存中，删除的文档记为墓碑，save() 时与磁盘上的文档合并写入新目录
+    - 序列化（FAISS.save_local 写入 index.pkl）时只保存增量部分，不含任何正文；反序列化后需调用 open() 重新打开存储目录
+    磁盘上的文档以 metadata["chunk_id"] 作为 docstore ID。
+    """
+    def __init__(self, store: DocumentStore | None = None) -> None:
+        self.store: DocumentStore | None = None
+        self._rows: Dict[str, int] = {}
+        self._added: Dict[str, Document] = {}
+        self._deleted: Set[str] = set()
+        if store is not None:
+            self._attach(store)
+
+    def _attach(self, store: DocumentStore) -> None:
+        self.store = store
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(store.column("chunk_id"))}
+
+    def open(self, directory: str | Path) -> None:
+        '''打开存储目录，反序列化后调用'''
+        self._attach(DocumentStore(directory))
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+    def __getstate__(self) -> Dict[str, object]:
+        return {"added": self._added, "deleted": self._deleted}
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__init__()  # type: ignore[misc]
+        self._added = state["added"]  # type: ignore[assignment]
+        self._deleted = state["deleted"]  # type: ignore[assignment]
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._added or (doc_id in self._rows and doc_id not in self._deleted)
+
+    def search(self, search: str) -> str | Document:
+        if search in self._added:
+            return self._added[search]
+        if search not in self:
+            return f"ID {search} not found."
+        assert self.store is not None
+        return self.store[self._rows[search]]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [doc_id for doc_id in texts if doc_id in self]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        missing = [doc_id for doc_id in ids if doc_id not in self]
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
+
+    def is_saved_at(self, directory: str | Path) -> bool:
+        '''全部文档是否都已保存在 directory 中（没有未写入的增量）'''
+        return self.store is not None and not self._added and not self._deleted \
+            and self.store.directory.resolve() == Path(directory).resolve()
+
+    @classmethod
+    def write(cls, directory: str | Path, ids: Iterable[str], source: Docstore) -> "DiskDocstore":
+        '''
+        按 ids 的顺序（即向量顺序）从 source 逐篇读取文档写入 directory，返回以该目录为底的 docstore。
+        先写入临时目录再替换，source 可以正是 directory 上的 DiskDocstore；替换前会关闭它。
+        '''
+        directory = Path(directory)
+        staging = directory.with_name(directory.name + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        with DocumentStoreWriter(staging) as writer:
+            for doc_id in ids:
+                doc = source.search(doc_id)
+                if not isinstance(doc, Document):
+                    raise ValueError(f"docstore 中缺少文档: {doc_id}")
+                writer.add(doc)
+        if isinstance(source, DiskDocstore):
+            source.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        staging.rename(directory)
+        return cls(DocumentStore(directory))
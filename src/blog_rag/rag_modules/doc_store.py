@@ -0,0 +1,241 @@
+import os
+import mmap
+import logging
+import itertools
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, overload
+
+import numpy as np
+import orjson
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class DocumentStore(Sequence[Document]):
+    """
+    紧凑的只读文档存储：
+    - texts.bin: 所有正文拼接成的一段 UTF-8 文本，以内存映射方式读取
+    - offsets.npy: 每篇正文在 texts.bin 中的字节偏移（长度 n + 1）
+    - metadata.json: 按列存储的元数据，每列记录出现该字段的行号及对应取值
+    Document 对象只在被访问时才构造。
+    持有 texts.bin 的文件句柄与内存映射，不再使用时应调用 close()（或以 with 语句使用），
+    否则在 Windows 上无法替换或删除快照中的文件。
+    """
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        # 偏移数组每篇只占 8 字节，直接读入内存，不额外占用文件句柄
+        self.offsets = np.load(self.directory / "offsets.npy")
+        with open(self.directory / "metadata.json", "rb") as f:
+            table = orjson.loads(f.read())
+        self._columns: Dict[str, Dict[str, Any]] = {
+            key: {"rows": np.asarray(column["rows"], dtype=np.int64), "values": column["values"]}
+            for key, column in table["columns"].items()
+        }
+        self._file = open(self.directory / "texts.bin", "rb")
+        size = int(self.offsets[-1])
+        self._texts = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @staticmethod
+    def save(directory: str | Path, documents: Iterable[Document]) -> None:
+        with DocumentStoreWriter(directory) as writer:
+            writer.extend(documents)
+
+    @classmethod
+    def load(cls, directory: str | Path) -> Optional["DocumentStore"]:
+        directory = Path(directory)
+        if not (directory / "metadata.json").exists():
+            return None
+        return cls(directory)
+
+    def close(self) -> None:
+        '''释放内存映射与文件句柄，可重复调用'''
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._file.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def __enter__(self) -> "DocumentStore":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def text(self, index: int) -> str:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self._texts[start:end].decode("utf-8")
+
+    def column(self, key: str) -> List[Any]:
+        '''读取整列元数据，缺失该字段的行为 None'''
+        values: List[Any] = [None] * len(self)
+        column = self._columns.get(key)
+        if column is not None:
+            for row, value in zip(column["rows"].tolist(), column["values"]):
+                values[row] = value
+        return values
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        meta: Dict[str, Any] = {}
+        for key, column in self._columns.items():
+            rows = column["rows"]
+            pos = int(np.searchsorted(rows, index))
+            if pos < len(rows) and rows[pos] == index:
+                meta[key] = column["values"][pos]
+        return meta
+
+    @overload
+    def __getitem__(self, index: int) -> Document: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[Document]: ...
+    def __getitem__(self, index: int | slice) -> Document | List[Document]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Document(page_content=self.text(index), metadata=self.metadata(index))
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class DocumentStoreWriter:
+    """
+    逐篇追加写入文档存储：正文直接写入临时文件，内存中只保留偏移与元数据列，不保留 Document。
+    close() 时依次替换 texts.bin、offsets.npy，最后写入 metadata.json；
+    以 with 语句使用时，发生异常（包括生成器被提前关闭）则丢弃已写入的临时文件，原有存储保持不变。
+    """
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._texts_tmp = self.directory / "texts.bin.tmp"
+        self._file = open(self._texts_tmp, "wb")
+        self._offsets = array("q", [0])
+        self._columns: Dict[str, Dict[str, List[Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def add(self, doc: Document) -> None:
+        row = len(self)
+        blob = doc.page_content.encode("utf-8")
+        self._file.write(blob)
+        self._offsets.append(self._offsets[-1] + len(blob))
+        for key, value in doc.metadata.items():
+            column = self._columns.setdefault(key, {"rows": [], "values": []})
+            column["rows"].append(row)
+            column["values"].append(value)
+
+    def extend(self, documents: Iterable[Document]) -> None:
+        for doc in documents:
+            self.add(doc)
+
+    def close(self) -> None:
+        self._file.close()
+        # 替换期间先删除 metadata.json，存储在写入完成前不会被视为完整
+        (self.directory / "metadata.json").unlink(missing_ok=True)
+        os.replace(self._texts_tmp, self.directory / "texts.bin")
+        tmp_offsets = self.directory / "offsets.tmp.npy"
+        np.save(tmp_offsets, np.frombuffer(self._offsets, dtype=np.int64))
+        os.replace(tmp_offsets, self.directory / "offsets.npy")
+        _atomic_write(
+            self.directory / "metadata.json",
+            orjson.dumps({"columns": self._columns}, option=orjson.OPT_NON_STR_KEYS),
+        )
+
+    def abort(self) -> None:
+        self._file.close()
+        self._texts_tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "DocumentStoreWriter":
+        return self
+
+    def __exit__(self, exc_type: type | None, *exc_info: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def migrate_pickle(pickle_path: Path, directory: Path) -> Optional[DocumentStore]:
+    '''
+    将旧版本保存的 pickle 缓存（Document 列表）一次性转换为文档存储，转换后原文件改名为 *.pkl.migrated；
+    不存在旧缓存或转换失败时返回 None。
+    '''
+    if not pickle_path.exists():
+        return None
+    import pickle
+
+    logger.info(f"检测到旧版缓存 {pickle_path}，正在转换为文档存储 {directory}...")
+    try:
+        with open(pickle_path, "rb") as f:
+            documents = pickle.load(f)
+        DocumentStore.save(directory, documents)
+    except Exception as e:
+        logger.warning(f"转换旧版缓存 {pickle_path} 失败，将重新解析 Markdown 文件: {e}")
+        return None
+    os.replace(pickle_path, pickle_path.with_name(pickle_path.name + ".migrated"))
+    logger.info(f"已转换 {len(documents)} 个文档。")
+    return DocumentStore(directory)
+
+
+class ConcatDocuments(Sequence[Document]):
+    """两段文档序列按位置拼接成的只读视图（快照文档块 + 在线增量段），不复制任何一段"""
+    def __init__(self, head: Sequence[Document], tail: Sequence[Document]) -> None:
+        self.head = head
+        self.tail = tail
+
+    def __len__(self) -> int:
+        return len(self.head) + len(self.tail)
+
+    @overload
+    def __getitem__(self, index: int) -> Document: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[Document]: ...
+    def __getitem__(self, index: int | slice) -> Document | List[Document]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        n_head = len(self.head)
+        return self.head[index] if index < n_head else self.tail[index - n_head]
+
+    def __iter__(self) -> Iterator[Document]:
+        yield from self.head
+        yield from self.tail
+
+
+def metadata_column(documents: Sequence[Document], key: str) -> List[Any]:
+    '''读取一列元数据；对 DocumentStore 不会构造 Document 对象'''
+    if isinstance(documents, DocumentStore):
+        return documents.column(key)
+    if isinstance(documents, ConcatDocuments):
+        return metadata_column(documents.head, key) + metadata_column(documents.tail, key)
+    return [doc.metadata.get(key) for doc in documents]
+
+
+def iter_texts(documents: Sequence[Document]) -> Iterator[str]:
+    '''逐个读取正文；对 DocumentStore 不会构造 Document 对象'''
+    if isinstance(documents, DocumentStore):
+        return (documents.text(i) for i in range(len(documents)))
+    if isinstance(documents, ConcatDocuments):
+        return itertools.chain(iter_texts(documents.head), iter_texts(documents.tail))
+    return (doc.page_content for doc in documents)
@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import logging
+import threading
+import time
+from hashlib import md5
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    嵌入向量磁盘缓存 - float32 内存映射矩阵 + 文本哈希到行号的索引，按 LRU 淘汰。
+    写入只更新内存中的索引，index.json 由 flush() 整体重写：maybe_flush() 只在累计写入 flush_every 条
+    或距上次落盘超过 flush_interval 秒时落盘，构建结束或关闭时由调用方调用 flush()。
+    """
+    def __init__(
+            self,
+            cache_dir: str | Path,
+            namespace: str,
+            max_entries: int,
+            flush_every: int = 50_000,
+            flush_interval: float = 60.0,
+        ) -> None:
+        self.root = Path(cache_dir) / "embeddings" / namespace
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+        self._vectors_path = self.root / "vectors.f32"
+        self._index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        # 文本哈希 -> 行号，按最近使用顺序排列（最久未使用的在前）
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        self._free_rows: List[int] = []
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._matrix: Optional[np.memmap] = None
+        self._load()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return md5(text.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self) -> None:
+        if not self._index_path.exists() or not self._vectors_path.exists():
+            return
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self._dim = int(index["dim"])
+            self._capacity = int(index["capacity"])
+            self._rows = OrderedDict((k, int(row)) for k, row in index["rows"])
+            used = set(self._rows.values())
+            self._free_rows = [row for row in range(self._capacity) if row not in used]
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r+",
+                shape=(self._capacity, self._dim)
+            )
+            logger.info(f"已加载嵌入缓存 {self.root}，共 {len(self._rows)} 条。")
+        except Exception as e:
+            logger.error(f"加载嵌入缓存失败，将重新创建: {e}")
+            self._rows.clear()
+            self._free_rows = []
+            self._dim, self._capacity, self._matrix = None, 0, None
+
+    def _grow(self, needed: int) -> None:
+        '''扩容内存映射矩阵，保证至少有 needed 个空闲行（不超过 max_entries）'''
+        assert self._dim is not None
+        if len(self._free_rows) >= needed or self._capacity >= self.max_entries:
+            return
+        new_capacity = min(
+            max(self._capacity * 2, self._capacity + needed - len(self._free_rows), 1024),
+            self.max_entries,
+        )
+        if self._matrix is not None:
+            self._matrix.flush()
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self._dim * 4)
+        self._matrix = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+",
+            shape=(new_capacity, self._dim)
+        )
+        self._free_rows.extend(range(self._capacity, new_capacity))
+        self._capacity = new_capacity
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            results: List[Optional[np.ndarray]] = []
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None or self._matrix is None:
+                    results.append(None)
+                    continue
+                self._rows.move_to_end(key)
+                results.append(np.array(self._matrix[row]))
+            return results
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not keys or self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._dim is None:
+                self._dim = len(vectors[0])
+            self._grow(len(keys))
+            assert self._matrix is not None
+            for key, vector in zip(keys, vectors):
+                row = self._rows.get(key)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        # 已达容量上限，淘汰最久未使用的条目并复用其行
+                        _, row = self._rows.popitem(last=False)
+                    self._rows[key] = row
+                else:
+                    self._rows.move_to_end(key)
+                self._matrix[row] = np.asarray(vector, dtype=np.float32)
+            self._dirty += len(keys)
+
+    def maybe_flush(self) -> None:
+        '''未落盘的写入达到条数或时间阈值时才落盘，避免每批都重写整个 index.json'''
+        if self._dirty and (
+            self._dirty >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._matrix is None or not self._dirty:
+                return
+            self._matrix.flush()
+            tmp_path = self._index_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "dim": self._dim,
+                    "capacity": self._capacity,
+                    "rows": list(self._rows.items()),
+                }, f)
+            os.replace(tmp_path, self._index_path)
+            self._dirty = 0
+            self._last_flush = time.monotonic()
+
+
+class CachedEmbeddings(Embeddings):
+    """带磁盘缓存的嵌入模型包装，命中缓存的文本不再经过模型前向计算"""
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache) -> None:
+        self.underlying = underlying
+        self.cache = cache
+
+    @staticmethod
+    def namespace(model_name: str, normalize: bool) -> str:
+        '''按模型与归一化设置区分缓存空间'''
+        slug = re.sub(r"[^\w.-]+", "_", model_name).strip("_")
+        return f"{slug}-{'norm' if normalize else 'raw'}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+        misses = [i for i, vector in enumerate(cached) if vector is None]
+        logger.info(f"嵌入缓存命中 {len(texts) - len(misses)}/{len(texts)}。")
+
+        results: List[List[float]] = [
+            vector.tolist() if vector is not None else [] for vector in cached
+        ]
+        if misses:
+            computed = self.underlying.embed_documents([texts[i] for i in misses])
+            for i, vector in zip(misses, computed):
+                results[i] = list(vector)
+            self.cache.put_many([keys[i] for i in misses], computed)
+            self.cache.maybe_flush()
+        return results
+
+    def flush(self) -> None:
+        self.cache.flush()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
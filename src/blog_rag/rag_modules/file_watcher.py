@@ -0,0 +1,99 @@
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ON_CHANGE = Callable[[Set[Path]], None]
+
+
+class MarkdownWatcher:
+    """
+    Markdown 目录监听器 - 优先使用 watchfiles（inotify 等系统通知），未安装时回退为定时轮询。
+    短时间内的多次事件经防抖合并后，以变更文件路径集合（含已删除的文件）批量回调。
+    """
+    def __init__(
+            self,
+            directory: str | Path,
+            on_change: ON_CHANGE,
+            debounce: float = 1.0,
+            poll_interval: float = 2.0,
+            force_polling: bool = False,
+        ) -> None:
+        self.directory = Path(directory).resolve()
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        run = self._run_polling
+        if not self.force_polling:
+            try:
+                import watchfiles  # noqa: F401  可选依赖
+                run = self._run_watchfiles
+            except ImportError:
+                logger.warning("未安装 watchfiles，Markdown 目录监听回退为轮询模式。")
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="markdown-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"开始监听 Markdown 目录: {self.directory}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.poll_interval, 1.0) + 1)
+            self._thread = None
+
+    def _dispatch(self, paths: Set[Path]) -> None:
+        logger.info(f"检测到 {len(paths)} 个 Markdown 文件变更。")
+        try:
+            self.on_change(paths)
+        except Exception as e:
+            logger.error(f"处理 Markdown 文件变更失败: {e}")
+
+    def _run_watchfiles(self) -> None:
+        from watchfiles import watch
+
+        for changes in watch(
+                self.directory,
+                watch_filter=lambda _, path: path.endswith(".md"),
+                debounce=int(self.debounce * 1000),
+                stop_event=self._stop,
+            ):
+            self._dispatch({Path(path) for _, path in changes})
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        files: Dict[Path, Tuple[int, int]] = {}
+        for md_file in self.directory.rglob("*.md"):
+            try:
+                stat = md_file.stat()
+            except FileNotFoundError:
+                continue
+            files[md_file] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _run_polling(self) -> None:
+        previous = self._scan()
+        pending: Set[Path] = set()
+        last_change = 0.0
+        while not self._stop.wait(min(self.poll_interval, self.debounce)):
+            current = self._scan()
+            changed = {
+                path for path in previous.keys() | current.keys()
+                if previous.get(path) != current.get(path)
+            }
+            previous = current
+            now = time.monotonic()
+            if changed:
+                pending |= changed
+                last_change = now
+            elif pending and now - last_change >= self.debounce:
+                self._dispatch(pending)
+                pending = set()
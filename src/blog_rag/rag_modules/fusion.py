@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Literal, Sequence, Tuple
+
+import numpy as np
+
+# 单路检索结果：(文档块位置数组, 分数数组)，按分数从高到低排列
+LEG = Tuple[np.ndarray, np.ndarray]
+FUSION_METHOD = Literal["rrf", "linear"]
+
+
+@dataclass(frozen=True)
+class FusionOptions:
+    """
+    多路检索融合参数：
+    - method: rrf 按名次倒数加权求和；linear 将各路分数 min-max 归一化后加权求和
+    - vector_weight / bm25_weight: 各路权重
+    - rrf_k: RRF 平滑参数
+    - depth: 每路召回的候选数，实际取 max(depth, top_k)
+    """
+    method: FUSION_METHOD = "rrf"
+    vector_weight: float = 1.0
+    bm25_weight: float = 1.0
+    rrf_k: int = 60
+    depth: int = 50
+
+    def leg_depth(self, top_k: int) -> int:
+        return max(self.depth, top_k)
+
+
+def empty_leg() -> LEG:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+
+def _top(ids: np.ndarray, scores: np.ndarray, top_k: int) -> LEG:
+    '''取分数最高的 top_k 个，分数相同时文档块位置小的在前'''
+    if len(ids) > top_k:
+        keep = np.argpartition(-scores, top_k - 1)[:top_k]
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+def merge_legs(legs: Sequence[LEG], top_k: int) -> LEG:
+    '''合并同一路检索在不同分段（快照与在线增量段）上的结果，各段分数可直接比较，取前 top_k 个'''
+    legs = [leg for leg in legs if len(leg[0])]
+    if not legs:
+        return empty_leg()
+    ids = np.concatenate([ids for ids, _ in legs]).astype(np.int64)
+    scores = np.concatenate([scores for _, scores in legs]).astype(np.float32)
+    return _top(ids, scores, top_k)
+
+
+def fuse(legs: Sequence[LEG], weights: Sequence[float], top_k: int, options: FusionOptions) -> LEG:
+    '''
+    融合多路检索结果，返回前 top_k 个 (文档块位置, 融合分数)。
+    各路结果拼接后按文档块位置聚合（np.unique + bincount），代价只与各路候选数相关，与语料规模无关。
+    '''
+    legs = [(np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float64)) for ids, scores in legs]
+    if top_k <= 0 or not any(len(ids) for ids, _ in legs):
+        return empty_leg()
+    contributions = []
+    for (ids, scores), weight in zip(legs, weights):
+        if options.method == "rrf":
+            contributions.append(weight / (options.rrf_k + np.arange(1, len(ids) + 1, dtype=np.float64)))
+        else:
+            span = scores.max() - scores.min() if len(scores) else 0.0
+            normalized = (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+            contributions.append(weight * normalized)
+    all_ids = np.concatenate([ids for ids, _ in legs])
+    unique_ids, inverse = np.unique(all_ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique_ids))
+    ids, scores = _top(unique_ids, fused, top_k)
+    return ids, scores.astype(np.float32)
@@ -1,6 +1,6 @@
 import os
 import logging
-from typing import Any, List
+from typing import Any, AsyncIterator, List
 from pydantic import SecretStr
 
 from langchain_deepseek import ChatDeepSeek
@@ -19,13 +19,19 @@ class BasicChatModel:
             api_key: str,
             temperature: float = 0.0,
             max_tokens: int = 2048,
+            base_url: str | None = None,
+            **llm_kwargs: Any,
         ) -> None:
         if 'deepseek' in model_name.lower():
+            if base_url:
+                # 兼容 OpenAI 协议的自建服务或本地桩服务
+                llm_kwargs["api_base"] = base_url
             self.llm = ChatDeepSeek(
                 model=model_name,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 api_key=SecretStr(api_key),
+                **llm_kwargs,
             )
         else:
             raise ValueError(f"不支持的模型名称: {model_name}")
@@ -49,7 +55,13 @@ class BasicChatModel:
         """生成回答"""
         response = self.llm.invoke(prompt)
         return response.text
-        
+
+    async def astream_answer(self, prompt: str) -> AsyncIterator[str]:
+        """流式生成回答，逐段产出模型返回的文本增量"""
+        async for chunk in self.llm.astream(prompt):
+            if chunk.text:
+                yield chunk.text
+
 class GenerationIntegrationModule(BasicChatModel):
     """生成集成模块 - 负责LLM集成和回答生成"""
     def __init__(
@@ -58,6 +70,8 @@ class GenerationIntegrationModule(BasicChatModel):
             model_name: str = "deepseek-chat",
             temperature: float = 0.0,
             max_tokens: int = 2048,
+            base_url: str | None = None,
+            **llm_kwargs: Any,
         ) -> None:
         if not api_key:
             raise ValueError("LLM_API_KEY 环境变量未设置。请设置您的 LLM API 密钥。")
@@ -66,13 +80,21 @@ class GenerationIntegrationModule(BasicChatModel):
             api_key=api_key,
             temperature=temperature,
             max_tokens=max_tokens,
+            base_url=base_url,
+            **llm_kwargs,
         )
 
     def generate_basic_answer(self, question: str, context: CHUNKS) -> str:
         """基于上下文生成回答"""
-        context_text = self._build_context(context)
-        chat_prompt = self.basic_prompt_template.format_prompt(context=context_text, question=question)
-        return self.generate_answer(chat_prompt.to_string())
+        return self.generate_answer(self._basic_prompt(question, context))
+
+    def astream_basic_answer(self, question: str, context: CHUNKS, max_length: int = 1000) -> AsyncIterator[str]:
+        """基于上下文流式生成回答"""
+        return self.astream_answer(self._basic_prompt(question, context, max_length))
+
+    def _basic_prompt(self, question: str, context: CHUNKS, max_length: int = 1000) -> str:
+        context_text = self._build_context(context, max_length)
+        return self.basic_prompt_template.format_prompt(context=context_text, question=question).to_string()
     
     def _build_context(self, chunks: CHUNKS, max_length: int = 1000) -> str:
         """构建上下文字符串"""
@@ -1,85 +1,478 @@
+import json
+import time
+import hashlib
+import queue
 import logging
-from typing import List
+import tempfile
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Sequence, TypeVar
 from pathlib import Path
 
+import faiss
+import numpy as np
 from huggingface_hub import snapshot_download
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
 
+from .embedding_cache import EmbeddingCache, CachedEmbeddings
+from .build_checkpoint import VectorCheckpoint
+from .disk_docstore import DiskDocstore
+from .doc_store import DocumentStore, DocumentStoreWriter
+from .onnx_embeddings import OnnxOptions, model_revision
+
 CHUNKS = List[Document]
 MARKDOWNS = List[Document]
+# 构建进度回调：(已处理文档块数, 嵌入吞吐 chunks/s)
+ON_PROGRESS = Callable[[int, float], None]
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def _rebatch(batches: Iterable[CHUNKS], batch_size: int) -> Iterator[CHUNKS]:
+    '''把任意大小的批次重新切分为固定大小（最后一批可能不足）'''
+    pending: Deque[Document] = deque()
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= batch_size:
+            yield [pending.popleft() for _ in range(batch_size)]
+    if pending:
+        yield list(pending)
+
+
+def _prefetch(iterable: Iterable[T], depth: int = 2) -> Iterator[T]:
+    '''在后台线程中预取至多 depth 个元素，使上游的读取/解析与下游的嵌入计算重叠'''
+    items: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        put(done)
+
+    thread = threading.Thread(target=produce, name="index-prefetch", daemon=True)
+    thread.start()
+    try:
+        while (item := items.get()) is not done:
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        thread.join(timeout=1)
+
+
 class IndexConstructionModule:
     """索引构建模块 - 负责向量化和索引构建"""
-    embeddings: HuggingFaceEmbeddings | None = None
+    embeddings: Embeddings | None = None
     vectorstore: FAISS | None = None
     def __init__(
             self, 
             model_name: str,
-            index_save_path: str | Path
+            index_save_path: str | Path,
+            cache_dir: str | Path | None = None,
+            embedding_cache_size: int = 0,
+            index_type: str = "flat",
+            index_params: Dict[str, int] | None = None,
+            model_cache_dir: str | Path | None = None,
+            batch_size: int = 64,
+            checkpoint_dir: str | Path | None = None,
+            checkpoint_interval: int = 1024,
+            checkpoint_key: str = "",
+            embedding_backend: str = "torch",
+            onnx_options: OnnxOptions | None = None,
         ) -> None:
         self.model_name = model_name
+        # 嵌入后端（torch/onnx）；embedding_id 标识实际使用的模型与后端，用于区分嵌入缓存与构建检查点
+        self.embedding_backend = embedding_backend
+        self.onnx_options = onnx_options or OnnxOptions()
+        self.embedding_id = model_name
         self.index_save_path = Path(index_save_path)
+        self.model_cache_dir = Path(model_cache_dir) if model_cache_dir is not None \
+            else self.index_save_path.parent / "models"
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.embedding_cache_size = embedding_cache_size
+        # 向量索引类型（flat/hnsw/ivf/ivfpq/sq8）及其参数
+        self.index_type = index_type
+        self.index_params = {
+            "hnsw_m": 32, "hnsw_ef_search": 64, "ivf_nlist": 0, "ivf_nprobe": 16, "pq_m": 16, "pq_nbits": 8,
+            **(index_params or {}),
+        }
+        self.recall_report: Dict[str, Any] | None = None
+        # 流式构建：每批嵌入的文档块数，检查点根目录（None 表示不保留检查点）及确认间隔（文档块数）；
+        # checkpoint_key 标识构建的语料与切分配置，与 embedding_id 一起决定检查点子目录
+        self.batch_size = batch_size
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir is not None else None
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_key = checkpoint_key
+        self.build_stats: Dict[str, Any] | None = None
+
+    @property
+    def checkpoint_path(self) -> Path | None:
+        '''本次构建的检查点目录，语料、切分配置或嵌入模型不同的构建互不覆盖'''
+        if self.checkpoint_dir is None:
+            return None
+        key = hashlib.sha1(f"{self.embedding_id}\n{self.checkpoint_key}".encode("utf-8")).hexdigest()[:16]
+        return self.checkpoint_dir / key
+
+    @property
+    def supports_incremental(self) -> bool:
+        '''当前索引是否支持按ID删除且删除后ID保持连续（FAISS.delete 依赖这一点），HNSW/IVF 不满足'''
+        return self.vectorstore is not None and isinstance(self.vectorstore.index, faiss.IndexFlatCodes)
 
     def setup_embeddings(self):
         logger.info(f"正在初始化嵌入模型: {self.model_name} ...")
 
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=snapshot_download(
-                self.model_name,
-                cache_dir=self.index_save_path.parent / "models",
-                endpoint="https://hf-mirror.com"  # 国内用户使用镜像加速下载
-            ),
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True}
+        normalize = True
+        model_path = snapshot_download(
+            self.model_name,
+            cache_dir=self.model_cache_dir,
+            endpoint="https://hf-mirror.com"  # 国内用户使用镜像加速下载
         )
+
+        def torch_embeddings() -> Embeddings:
+            return HuggingFaceEmbeddings(
+                model_name=model_path,
+                model_kwargs={"device": "cpu"},
+                encode_kwargs={"normalize_embeddings": normalize}
+            )
+
+        embeddings: Embeddings | None = None
+        self.embedding_id = self.model_name
+        if self.embedding_backend == "onnx":
+            embeddings = self._setup_onnx_embeddings(model_path, normalize, torch_embeddings)
+        if embeddings is None:
+            embeddings = torch_embeddings()
+        if self.cache_dir is not None and self.embedding_cache_size > 0:
+            embeddings = CachedEmbeddings(
+                embeddings,
+                EmbeddingCache(
+                    self.cache_dir,
+                    namespace=CachedEmbeddings.namespace(self.embedding_id, normalize),
+                    max_entries=self.embedding_cache_size,
+                ),
+            )
+        self.embeddings = embeddings
         logger.info("嵌入模型初始化完成。")
 
-    def build_vector_index(self, chunks: CHUNKS) -> FAISS:
-        logger.info("正在构建向量索引...")
+    def _setup_onnx_embeddings(
+            self,
+            model_path: str,
+            normalize: bool,
+            reference: Callable[[], Embeddings],
+        ) -> Embeddings | None:
+        '''加载 ONNX Runtime 嵌入模型（首次使用时导出、量化并与 PyTorch 嵌入比对），不可用时返回 None 以回退为 PyTorch 后端'''
+        try:
+            from .onnx_embeddings import load_onnx_embeddings
+
+            embeddings = load_onnx_embeddings(
+                model_path,
+                self.onnx_export_dir(model_path),
+                reference,
+                normalize=normalize,
+                options=self.onnx_options,
+            )
+        except ImportError as e:
+            logger.warning(f"未安装 ONNX Runtime 相关依赖（{e.name}），回退为 PyTorch 嵌入后端。")
+            return None
+        except Exception as e:
+            logger.error(f"ONNX 嵌入后端不可用，回退为 PyTorch 嵌入后端: {e}")
+            return None
+        self.embedding_id = f"{self.model_name}@onnx-{self.onnx_options.variant}"
+        return embeddings
+
+    def onnx_export_dir(self, model_path: str | Path) -> Path:
+        '''ONNX 导出目录：按模型标识与模型版本区分，模型更新后重新导出，而不是复用旧权重的导出结果'''
+        slug = self.model_name.replace("/", "--")
+        return self.model_cache_dir / "onnx" / f"{slug}@{model_revision(model_path)}"
+
+    def build_vector_index(
+            self,
+            chunks: Sequence[Document] | Iterable[CHUNKS],
+            on_progress: ON_PROGRESS | None = None,
+        ) -> FAISS:
+        '''
+        流式构建向量索引。chunks 可以是文档块序列（列表或文档存储，按 batch_size 切片读取），也可以是按批产出文档块的迭代器
+        （如 DataPreparationModule.stream_chunks），上游的产出在后台线程中预取，与嵌入计算重叠。
+        向量按 batch_size 分批嵌入后追加到磁盘检查点，文档块同时逐批写入磁盘 docstore，内存中只保留当前一批；
+        全部嵌入完成后再从检查点分批加入 FAISS 索引。构建中断后再次构建会复用检查点中的向量。
+        '''
+        logger.info(f"正在构建向量索引（{self.index_type}）...")
         if not self.embeddings:
             self.setup_embeddings()
-
         assert self.embeddings is not None
-        vectorstore = FAISS.from_documents(
-            documents=chunks, embedding=self.embeddings)
+
+        if isinstance(chunks, Sequence):
+            batches: Iterable[CHUNKS] = (
+                list(chunks[start:start + self.batch_size]) for start in range(0, len(chunks), self.batch_size)
+            )
+        else:
+            batches = chunks
+        checkpoint_dir = self.checkpoint_path or Path(tempfile.mkdtemp(prefix="faiss-build-"))
+        checkpoint = VectorCheckpoint(checkpoint_dir, self.embedding_id)
+        docstore_dir = self.index_save_path / "faiss_index" / "docstore"
+        try:
+            with DocumentStoreWriter(docstore_dir) as docstore_writer:
+                n_chunks = self._embed_to_checkpoint(batches, checkpoint, docstore_writer, on_progress)
+            if not n_chunks:
+                raise ValueError("没有可用于构建向量索引的文档块。")
+            vectors = checkpoint.vectors()
+            index = self._create_index(vectors)
+            for start in range(0, n_chunks, self.batch_size):
+                index.add(np.ascontiguousarray(vectors[start:start + self.batch_size]))
+            # 以 chunk_id 作为 docstore ID，便于增量更新时按文档块删除
+            vectorstore = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=DiskDocstore(DocumentStore(docstore_dir)),
+                index_to_docstore_id=dict(enumerate(checkpoint.ids)),
+            )
+            self._apply_search_params(index)
+            is_exact = isinstance(index, faiss.IndexFlat)
+            self.recall_report = None if is_exact else self.evaluate_recall(index, vectors)
+        finally:
+            self.flush_embedding_cache()
+            if self.checkpoint_dir is None:
+                checkpoint.clear()
         self.vectorstore = vectorstore
         return vectorstore
 
+    def _embed_to_checkpoint(
+            self,
+            batches: Iterable[CHUNKS],
+            checkpoint: VectorCheckpoint,
+            docstore_writer: DocumentStoreWriter,
+            on_progress: ON_PROGRESS | None,
+        ) -> int:
+        '''逐批嵌入并追加到检查点，与检查点已有前缀一致的文档块跳过嵌入；文档块写入 docstore_writer，返回文档块总数'''
+        assert self.embeddings is not None
+        resumable = list(checkpoint.ids)
+        total = 0
+        embedded = 0
+        uncommitted = 0
+        start = last_log = time.perf_counter()
+        for batch in _prefetch(_rebatch(batches, self.batch_size)):
+            position = total
+            ids = [chunk.metadata["chunk_id"] for chunk in batch]
+            reused = 0
+            if len(checkpoint) > position:
+                while reused < len(batch) and position + reused < len(resumable) \
+                        and resumable[position + reused] == ids[reused]:
+                    reused += 1
+                if reused < len(batch) and len(checkpoint) > position + reused:
+                    # 文档块顺序或内容发生变化，丢弃检查点中不一致的部分
+                    checkpoint.truncate(position + reused)
+            docstore_writer.extend(batch)
+            total += len(batch)
+            rest = batch[reused:]
+            if rest:
+                vectors = self.embeddings.embed_documents([chunk.page_content for chunk in rest])
+                checkpoint.append(ids[reused:], np.asarray(vectors, dtype=np.float32))
+                embedded += len(rest)
+                uncommitted += len(rest)
+            if uncommitted >= self.checkpoint_interval:
+                checkpoint.commit()
+                uncommitted = 0
+
+            now = time.perf_counter()
+            rate = embedded / (now - start) if now > start else 0.0
+            if on_progress is not None:
+                on_progress(total, rate)
+            if now - last_log >= 5:
+                logger.info(f"已处理 {total} 个文档块（新嵌入 {embedded} 个），{rate:.1f} chunks/s")
+                last_log = now
+        if len(checkpoint) > total:
+            checkpoint.truncate(total)
+        checkpoint.commit()
+
+        elapsed = time.perf_counter() - start
+        self.build_stats = {
+            "chunks": total,
+            "embedded": embedded,
+            "resumed": total - embedded,
+            "seconds": elapsed,
+            "chunks_per_second": embedded / elapsed if elapsed else 0.0,
+        }
+        logger.info(
+            f"嵌入完成: {total} 个文档块（复用检查点 {self.build_stats['resumed']} 个），"
+            f"耗时 {elapsed:.1f}s，{self.build_stats['chunks_per_second']:.1f} chunks/s"
+        )
+        return total
+
+    def discard_checkpoint(self) -> None:
+        '''索引保存成功后删除构建检查点'''
+        if self.checkpoint_path is not None:
+            VectorCheckpoint(self.checkpoint_path, self.embedding_id).clear()
+
+    def flush_embedding_cache(self) -> None:
+        '''将嵌入缓存中尚未落盘的写入保存到磁盘'''
+        if isinstance(self.embeddings, CachedEmbeddings):
+            self.embeddings.flush()
+
+    def close(self) -> None:
+        '''保存嵌入缓存并关闭向量索引的磁盘 docstore，可重复调用'''
+        self.flush_embedding_cache()
+        if self.vectorstore is not None and isinstance(self.vectorstore.docstore, DiskDocstore):
+            self.vectorstore.docstore.close()
+
+    def _create_index(self, vectors: np.ndarray) -> faiss.Index:
+        '''按配置创建并训练 FAISS 索引；训练样本不足时回退为精确索引'''
+        n, dim = vectors.shape
+        params = self.index_params
+        nlist = params["ivf_nlist"] or max(1, int(4 * np.sqrt(n)))
+        factories = {
+            "flat": "Flat",
+            "hnsw": f"HNSW{params['hnsw_m']},Flat",
+            "ivf": f"IVF{nlist},Flat",
+            "ivfpq": f"IVF{nlist},PQ{params['pq_m']}x{params['pq_nbits']}",
+            "sq8": "SQ8",
+        }
+        index_type = self.index_type
+        if index_type not in factories:
+            raise ValueError(f"不受支持的索引类型: {index_type}")
+        min_train = {"ivf": nlist, "ivfpq": max(nlist, 2 ** params["pq_nbits"])}.get(index_type, 0)
+        if n < min_train or (index_type == "ivfpq" and dim % params["pq_m"]):
+            logger.warning(f"文档块数量或维度不满足 {index_type} 索引的训练要求，回退为 flat 索引。")
+            index_type = "flat"
+        index = faiss.index_factory(dim, factories[index_type], faiss.METRIC_L2)
+        if not index.is_trained:
+            # 每个聚类中心/码字约 256 个样本即可，超出部分随机抽样，避免把全部向量读入内存
+            train_size = min(n, 256 * max(min_train, 256))
+            rows = np.sort(np.random.default_rng(0).choice(n, size=train_size, replace=False))
+            logger.info(f"正在使用 {train_size} 个向量训练 {index_type} 索引...")
+            index.train(np.ascontiguousarray(vectors[rows]))
+        return index
+
+    def _apply_search_params(self, index: faiss.Index) -> None:
+        '''设置查询时参数；IVF 索引同时建立直接映射以支持向量重建'''
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.index_params["ivf_nprobe"], ivf.nlist)
+            ivf.make_direct_map()
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.index_params["hnsw_ef_search"]
+
+    @staticmethod
+    def evaluate_recall(
+            index: faiss.Index,
+            vectors: np.ndarray,
+            k: int = 10,
+            n_queries: int = 200,
+            seed: int = 0,
+        ) -> Dict[str, Any]:
+        '''以精确检索为基准，评估近似索引的 recall@k 与单次查询延迟'''
+        n = len(vectors)
+        k = min(k, n)
+        rng = np.random.default_rng(seed)
+        queries = np.ascontiguousarray(vectors[np.sort(rng.choice(n, size=min(n_queries, n), replace=False))])
+
+        # 分块计算精确结果并合并，向量可以是磁盘上的内存映射数组
+        start = time.perf_counter()
+        heap = faiss.ResultHeap(len(queries), k)
+        block = 65536
+        for offset in range(0, n, block):
+            distances, ids = faiss.knn(queries, np.ascontiguousarray(vectors[offset:offset + block]), k)
+            heap.add_result(distances, np.where(ids >= 0, ids + offset, -1))
+        heap.finalize()
+        truth = heap.I
+        flat_latency = (time.perf_counter() - start) / len(queries)
+        start = time.perf_counter()
+        _, approx = index.search(queries, k)
+        ann_latency = (time.perf_counter() - start) / len(queries)
+
+        hits = sum(len(set(t) & set(a)) for t, a in zip(truth.tolist(), approx.tolist()))
+        report = {
+            "n_vectors": n,
+            "k": k,
+            "n_queries": len(queries),
+            "recall_at_k": hits / (len(queries) * k) if k else 0.0,
+            "ann_latency_ms": ann_latency * 1000,
+            "flat_latency_ms": flat_latency * 1000,
+        }
+        logger.info(
+            f"近似索引 recall@{k} = {report['recall_at_k']:.4f}，"
+            f"单次查询 {report['ann_latency_ms']:.3f}ms（精确检索 {report['flat_latency_ms']:.3f}ms）"
+        )
+        return report
+
     def add_chunks(self, new_chunks: CHUNKS):
         logger.info(f"正在向向量索引中添加 {len(new_chunks)} 个新文档块...")
+        if not new_chunks:
+            return
         if not self.vectorstore:
             self.build_vector_index(new_chunks)
             return
-        self.vectorstore.add_documents(new_chunks)
+        self.vectorstore.add_documents(
+            new_chunks, ids=[chunk.metadata["chunk_id"] for chunk in new_chunks])
+        self.flush_embedding_cache()
         logger.info("新文档块添加完成。")
 
+    def delete_chunks(self, chunk_ids: List[str]) -> None:
+        if not self.vectorstore or not chunk_ids:
+            return
+        existing = set(self.vectorstore.index_to_docstore_id.values())
+        ids = [chunk_id for chunk_id in chunk_ids if chunk_id in existing]
+        logger.info(f"正在从向量索引中删除 {len(ids)} 个文档块...")
+        if ids:
+            self.vectorstore.delete(ids)
+        logger.info("文档块删除完成。")
+
         
     def save_vector_index(self, vectorstore: FAISS) -> None:
         save_path: str
         if isinstance(vectorstore, FAISS):
             save_path = str(Path(self.index_save_path / "faiss_index").resolve())
+            docstore_dir = Path(save_path) / "docstore"
+            docstore = vectorstore.docstore
+            if not (isinstance(docstore, DiskDocstore) and docstore.is_saved_at(docstore_dir)):
+                # 增量更新后的 docstore（或旧版本 index.pkl 中的内存 docstore）按向量顺序写入磁盘
+                ids = [doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+                vectorstore.docstore = DiskDocstore.write(docstore_dir, ids, docstore)
             vectorstore.save_local(str(save_path))
+            if self.recall_report is not None:
+                report = {"index_type": self.index_type, **self.recall_report}
+                with open(Path(save_path) / "recall_report.json", "w", encoding="utf-8") as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
         else:
             raise ValueError(f"不受支持的向量存储类型: {vectorstore.__class__.__name__}")
         logger.info(f"向量索引已保存到: {save_path}")
 
-    def load_vector_index(self, db_type: str = "FAISS") -> FAISS | None:
+    def load_vector_index(self, db_type: str = "FAISS", source_dir: str | Path | None = None) -> FAISS | None:
+        '''加载向量索引；source_dir 指定从其他索引目录（如上一个快照）读取，默认为 index_save_path'''
         if not self.embeddings:
             self.setup_embeddings()
         assert self.embeddings is not None
 
         if db_type.upper() == "FAISS":
             try:
-                load_path = str(Path(self.index_save_path / "faiss_index").resolve())
+                load_path = str((Path(source_dir or self.index_save_path) / "faiss_index").resolve())
                 self.vectorstore = FAISS.load_local(
                     load_path, 
                     embeddings=self.embeddings,
                     allow_dangerous_deserialization=True
                 )
+                if isinstance(self.vectorstore.docstore, DiskDocstore):
+                    self.vectorstore.docstore.open(Path(load_path) / "docstore")
+                self._apply_search_params(self.vectorstore.index)
                 logger.info(f"已从 {load_path} 加载 FAISS 向量索引。")
             finally:
                 return self.vectorstore
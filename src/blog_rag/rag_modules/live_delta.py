@@ -0,0 +1,71 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Collection, Dict, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .metadata_index import MetadataIndex
+
+
+def _empty_positions() -> np.ndarray:
+    return np.empty(0, dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class LiveDelta:
+    """
+    在线增量段 - 文件变更直接应用到在线索引时，快照中的向量、BM25 与元数据索引保持不变：
+    - deleted: 快照中已被删除（所在文件被修改或删除）的文档块位置，升序
+    - chunks: 新增的文档块，位置接在快照文档块之后编号
+    - vectors / term_counts / doc_lens / metadata_index: 新增文档块的向量、词频、长度与元数据索引
+    每次变更生成新的实例，代价只与变更文件和增量段的大小相关；增量段由下一次重建合并进快照。
+    """
+    deleted: np.ndarray = field(default_factory=_empty_positions)
+    chunks: Tuple[Document, ...] = ()
+    vectors: np.ndarray | None = None
+    term_counts: Tuple[Dict[str, int], ...] = ()
+    doc_lens: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float32))
+    metadata_index: MetadataIndex = field(default_factory=lambda: MetadataIndex({}, 0))
+
+    @property
+    def size(self) -> int:
+        '''增量段累计的文档块数（删除 + 新增），用于判断是否需要重建快照'''
+        return len(self.deleted) + len(self.chunks)
+
+    def replace(
+            self,
+            paths: Collection[str],
+            removed: np.ndarray,
+            chunks: List[Document],
+            vectors: np.ndarray,
+            tokenize: Callable[[str], List[str]],
+        ) -> "LiveDelta":
+        '''
+        返回替换 paths 中文件内容后的新增量段，当前实例保持不变。
+        Args:
+            paths: 变更文件的相对路径，其在增量段中的旧文档块一并移除
+            removed: 这些文件在快照中的文档块位置
+            chunks: 这些文件的新文档块
+            vectors: 新文档块的向量，形状为 (len(chunks), 维度)
+            tokenize: BM25 分词器
+        '''
+        keep = [i for i, chunk in enumerate(self.chunks) if chunk.metadata.get("path") not in paths]
+        kept_vectors = self.vectors[keep] if self.vectors is not None else None
+        all_chunks = tuple(self.chunks[i] for i in keep) + tuple(chunks)
+        if kept_vectors is None or len(kept_vectors) == 0:
+            all_vectors = np.asarray(vectors, dtype=np.float32) if len(chunks) else None
+        else:
+            all_vectors = np.concatenate([kept_vectors, np.asarray(vectors, dtype=np.float32).reshape(
+                len(chunks), kept_vectors.shape[1])])
+        tokens = [tokenize(chunk.page_content) for chunk in chunks]
+        return LiveDelta(
+            deleted=np.union1d(self.deleted, np.asarray(removed, dtype=np.int64)),
+            chunks=all_chunks,
+            vectors=all_vectors,
+            term_counts=tuple(self.term_counts[i] for i in keep) + tuple(dict(Counter(t)) for t in tokens),
+            doc_lens=np.concatenate([
+                self.doc_lens[keep], np.asarray([len(t) for t in tokens], dtype=np.float32)
+            ]).astype(np.float32),
+            metadata_index=MetadataIndex.build(all_chunks),
+        )
@@ -0,0 +1,62 @@
+import logging
+from typing import Any, Dict, Iterable, List, Literal, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .doc_store import metadata_column
+
+logger = logging.getLogger(__name__)
+
+MATCH = Literal["any", "all"]
+
+
+class MetadataIndex:
+    """元数据倒排索引 - 为每个分类/标签取值维护有序的文档块位置数组，用于在检索打分前确定候选集"""
+    FIELDS = ("categories", "tags")
+
+    def __init__(self, postings: Dict[str, Dict[Any, np.ndarray]], n_docs: int) -> None:
+        self.postings = postings
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, chunks: Sequence[Document], fields: Iterable[str] = FIELDS) -> "MetadataIndex":
+        postings: Dict[str, Dict[Any, np.ndarray]] = {}
+        for field in fields:
+            rows: Dict[Any, List[int]] = {}
+            for row, values in enumerate(metadata_column(chunks, field)):
+                if not isinstance(values, list):
+                    continue
+                for value in set(values):
+                    rows.setdefault(value, []).append(row)
+            postings[field] = {value: np.asarray(ids, dtype=np.int64) for value, ids in rows.items()}
+        logger.info(
+            "元数据索引构建完成: " + ", ".join(f"{field} {len(p)} 个取值" for field, p in postings.items())
+        )
+        return cls(postings, len(chunks))
+
+    def values(self, field: str) -> List[Any]:
+        return list(self.postings.get(field, {}))
+
+    def candidates(self, filters: Dict[str, List[Any]], match: MATCH = "any") -> Optional[np.ndarray]:
+        '''
+        计算满足过滤条件的文档块位置（升序）。
+        同一字段内的多个取值按 match 取并集(any)或交集(all)，不同字段之间取交集。
+        Returns:
+            满足条件的位置数组；filters 中没有有效条件时返回 None 表示不过滤
+        '''
+        result: Optional[np.ndarray] = None
+        empty = np.empty(0, dtype=np.int64)
+        for field, values in filters.items():
+            if not values:
+                continue
+            field_postings = self.postings.get(field, {})
+            lists = [field_postings.get(value, empty) for value in dict.fromkeys(values)]
+            if match == "all":
+                matched = lists[0]
+                for ids in lists[1:]:
+                    matched = np.intersect1d(matched, ids, assume_unique=True)
+            else:
+                matched = np.unique(np.concatenate(lists))
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+        return result
@@ -0,0 +1,203 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# 单个样本：(指标名后缀, 标签, 值)
+SAMPLE = Tuple[str, Dict[str, str], float]
+# 指标族：(名称, 类型, 说明, 样本)
+FAMILY = Tuple[str, str, str, List[SAMPLE]]
+
+# 覆盖 0.5ms ~ 10s 的延迟分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(families: Iterable[FAMILY]) -> str:
+    '''按 Prometheus 文本格式（0.0.4）输出指标族'''
+    lines: List[str] = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _Metric(ABC):
+    """指标基类：无标签时自身即为样本；有标签时按标签取值创建同类型的子指标（_new_child），采集时逐个输出"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        '''返回指定标签取值的子指标；热路径上应预先取得子指标并复用'''
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> "_Metric":
+        '''创建一个不带标签名、参数相同的子指标'''
+
+    def _items(self) -> List[Tuple[Dict[str, str], "_Metric"]]:
+        if not self.labelnames:
+            return [({}, self)]
+        return [(dict(zip(self.labelnames, key)), child) for key, child in list(self._children.items())]
+
+    @abstractmethod
+    def collect(self) -> FAMILY:
+        '''输出该指标（含全部子指标）的指标族'''
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.help)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def collect(self) -> FAMILY:
+        # 与 prometheus_client 一致，HELP/TYPE 与样本都使用 <name>_total
+        return (f"{self.name}_total", self.kind, self.help,
+                [("", labels, child.value) for labels, child in self._items()])  # type: ignore[attr-defined]
+
+
+class Histogram(_Metric):
+    """固定分桶直方图，observe 只做一次二分查找与两次累加"""
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            help_text: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = LATENCY_BUCKETS,
+        ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def collect(self) -> FAMILY:
+        samples: List[SAMPLE] = []
+        for labels, child in self._items():
+            assert isinstance(child, Histogram)
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip((*child.buckets, float("inf")), counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return self.name, self.kind, self.help, samples
+
+
+class Registry:
+    """指标注册表；进程内状态（缓存命中率、索引规模等）由调用方在采集时以指标族形式附加"""
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self, extra: Iterable[FAMILY] = ()) -> str:
+        return render([*(m.collect() for m in list(self._metrics.values())), *extra])
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))  # type: ignore[return-value]
+
+
+def histogram(
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))  # type: ignore[return-value]
+
+
+def gauge_family(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> FAMILY:
+    return name, "gauge", help_text, [("", labels, value) for labels, value in samples]
+
+
+def counter_family(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> FAMILY:
+    return f"{name}_total", "counter", help_text, [("", labels, value) for labels, value in samples]
+
+
+HTTP_REQUESTS = counter("blog_rag_http_requests", "HTTP 请求数", ("method", "route", "status"))
+HTTP_LATENCY = histogram("blog_rag_http_request_duration_seconds", "HTTP 请求耗时", ("method", "route"))
+SEARCH_STAGE_LATENCY = histogram("blog_rag_search_stage_duration_seconds", "检索各阶段耗时", ("stage",))
+SEARCH_LATENCY = histogram("blog_rag_search_duration_seconds", "检索总耗时（按是否命中结果缓存）", ("cache",))
+REINDEX_DURATION = histogram(
+    "blog_rag_reindex_duration_seconds", "索引重建耗时", ("mode", "result"),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+ANSWER_TTFT = histogram("blog_rag_answer_ttft_seconds", "流式回答的首字延迟", ())
+
+# 热路径上复用的子指标，避免每次观测时查找标签
+STAGE_EMBEDDING = SEARCH_STAGE_LATENCY.labels("embedding")
+STAGE_FAISS = SEARCH_STAGE_LATENCY.labels("faiss")
+STAGE_BM25 = SEARCH_STAGE_LATENCY.labels("bm25")
+STAGE_FUSION = SEARCH_STAGE_LATENCY.labels("fusion")
+STAGE_RERANK = SEARCH_STAGE_LATENCY.labels("rerank")
+STAGE_SERIALIZATION = SEARCH_STAGE_LATENCY.labels("serialization")
+SEARCH_CACHE_HIT = SEARCH_LATENCY.labels("hit")
+SEARCH_CACHE_MISS = SEARCH_LATENCY.labels("miss")
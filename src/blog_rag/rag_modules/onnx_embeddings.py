@@ -0,0 +1,259 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 导出后与 PyTorch 嵌入比对的样例文本：中英文混排、长短不一（含超过最大长度需截断的文本）
+PARITY_TEXTS = [
+    "注意力机制",
+    "什么是 dropout 正则化？",
+    "Transformer 的自注意力层通过 query、key、value 计算加权和。",
+    "向量检索使用 FAISS 构建索引，BM25 负责关键词召回，两路结果经 RRF 融合。",
+    "The optimizer updates parameters with the gradient of the loss function.",
+    "卷积网络在图像任务上表现良好；embedding 模型将文本映射到稠密向量空间。" * 3,
+    "学习率调度、梯度裁剪与混合精度训练是大模型训练中的常用技巧。" * 40,
+    "cache latency throughput batch kernel pipeline",
+]
+
+
+@dataclass(frozen=True)
+class OnnxOptions:
+    """
+    ONNX Runtime 嵌入后端参数：
+    - quantize: 是否使用 int8 动态量化的模型（权重量化，激活在运行时量化）
+    - threads: 单次推理的算子内线程数，0 表示使用当前进程可用的全部 CPU
+    - batch_size: 每次推理的文本数，文本按长度排序后分批以减少填充
+    - max_length: 最大 token 数，None 表示沿用模型配置（与 PyTorch 后端的截断一致）
+    - parity_threshold: 与 PyTorch 嵌入的最小余弦相似度，低于该值时不启用 ONNX 后端
+    """
+    quantize: bool = True
+    threads: int = 0
+    batch_size: int = 32
+    max_length: int | None = None
+    parity_threshold: float = 0.99
+
+    @property
+    def variant(self) -> str:
+        return "int8" if self.quantize else "fp32"
+
+
+def available_cpus() -> int:
+    '''当前进程可用的 CPU 数（考虑容器的 CPU 亲和性限制）'''
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def model_revision(model_dir: str | Path) -> str:
+    '''
+    模型版本标识，用于区分 ONNX 导出目录：Hugging Face 缓存中的快照目录名即模型仓库的提交哈希；
+    其他本地目录按权重文件的内容计算哈希，权重被替换后不会误用旧的导出结果
+    '''
+    model_dir = Path(model_dir)
+    if model_dir.parent.name == "snapshots":
+        return model_dir.name[:12]
+    digest = hashlib.sha1()
+    for weights in sorted([*model_dir.glob("*.safetensors"), *model_dir.glob("*.bin")]):
+        digest.update(weights.name.encode("utf-8"))
+        with open(weights, "rb") as f:
+            while block := f.read(1 << 20):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _pooling_mode(model_dir: Path) -> str:
+    '''读取 sentence-transformers 的池化配置（如 bge 系列使用 CLS 池化），缺省为平均池化'''
+    pooling_dir = "1_Pooling"
+    modules_path = model_dir / "modules.json"
+    if modules_path.exists():
+        for module in json.loads(modules_path.read_text(encoding="utf-8")):
+            if module.get("type", "").endswith("Pooling"):
+                pooling_dir = module.get("path", pooling_dir)
+    config_path = model_dir / pooling_dir / "config.json"
+    if config_path.exists():
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+        # 旧版配置以布尔字段区分池化方式，新版使用 pooling_mode 字段
+        if config.get("pooling_mode_cls_token") or config.get("pooling_mode") == "cls":
+            return "cls"
+    return "mean"
+
+
+def _max_seq_length(model_dir: Path) -> int | None:
+    config_path = model_dir / "sentence_bert_config.json"
+    if config_path.exists():
+        return json.loads(config_path.read_text(encoding="utf-8")).get("max_seq_length")
+    return None
+
+
+def export_onnx(model_dir: str | Path, output_dir: str | Path, quantize: bool = True) -> Path:
+    '''
+    将 HuggingFace 编码器导出为 ONNX（输出 last_hidden_state，批大小与序列长度均为动态维度），
+    quantize 时再做 int8 动态量化。返回模型文件路径；文件先写入临时路径再原子替换。
+    '''
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    model_dir, output_dir = Path(model_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / "model_fp32.onnx"
+    if not fp32_path.exists():
+        logger.info(f"正在导出 ONNX 模型: {model_dir} ...")
+        model = AutoModel.from_pretrained(model_dir).eval()
+        sample = AutoTokenizer.from_pretrained(model_dir)(["样例文本 sample text"], return_tensors="pt")
+        names = list(sample.keys())
+
+        class _Encoder(torch.nn.Module):
+            # 按位置传入输入，避免导出时关键字参数与模型 forward 的其他参数冲突
+            def __init__(self) -> None:
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+                return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+        dynamic = {0: "batch", 1: "sequence"}
+        tmp_path = output_dir / "model_fp32.tmp.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder().eval(),
+                tuple(sample[name] for name in names),
+                str(tmp_path),
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={**{name: dynamic for name in names}, "last_hidden_state": dynamic},
+                opset_version=17,
+                dynamo=False,
+            )
+        os.replace(tmp_path, fp32_path)
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = output_dir / "model_int8.onnx"
+    if not int8_path.exists():
+        logger.info("正在对 ONNX 模型做 int8 动态量化...")
+        tmp_path = output_dir / "model_int8.tmp.onnx"
+        quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX Runtime 嵌入模型 - 在 CPU 上运行导出（可选 int8 量化）的编码器：
+    - 池化方式与最大长度沿用模型目录中的 sentence-transformers 配置，结果与 PyTorch 后端可比
+    - 文本按长度排序后分批推理，减少填充带来的无效计算
+    - 会话只使用算子内并行（inter_op 固定为 1），InferenceSession.run 可被多个线程并发调用
+    """
+    def __init__(
+            self,
+            model_dir: str | Path,
+            onnx_path: str | Path,
+            normalize: bool = True,
+            options: OnnxOptions = OnnxOptions(),
+        ) -> None:
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_dir = Path(model_dir)
+        self.normalize = normalize
+        self.options = options
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self.pooling = _pooling_mode(self.model_dir)
+        self.max_length = options.max_length or _max_seq_length(self.model_dir) or self.tokenizer.model_max_length
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        session_options.intra_op_num_threads = options.threads or available_cpus()
+        session_options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(onnx_path), session_options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        weights = mask[..., None].astype(hidden.dtype)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors: np.ndarray | None = None
+        for start in range(0, len(texts), self.options.batch_size):
+            batch = order[start:start + self.options.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            pooled = self._pool(hidden, encoded["attention_mask"])
+            if vectors is None:
+                vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[batch] = pooled
+        if vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.normalize:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def cosine_parity(reference: Embeddings, candidate: Embeddings, texts: Sequence[str]) -> Dict[str, float]:
+    '''逐条比较两个嵌入模型对同一文本的余弦相似度，返回最小值与平均值'''
+    a = np.asarray(reference.embed_documents(list(texts)), dtype=np.float64)
+    b = np.asarray(candidate.embed_documents(list(texts)), dtype=np.float64)
+    cosine = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    return {"texts": len(texts), "min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+def load_onnx_embeddings(
+        model_dir: str | Path,
+        export_dir: str | Path,
+        reference: Callable[[], Embeddings],
+        normalize: bool = True,
+        options: OnnxOptions = OnnxOptions(),
+    ) -> OnnxEmbeddings:
+    '''
+    加载 ONNX 嵌入模型，尚未导出时先导出并与 reference()（PyTorch 嵌入模型，仅在首次导出时加载）比对，
+    比对结果保存在导出目录中，之后的启动无需再加载 PyTorch 模型。
+    余弦相似度低于 options.parity_threshold 时抛出 ValueError。
+    '''
+    export_dir = Path(export_dir)
+    onnx_path = export_onnx(model_dir, export_dir, options.quantize)
+    embeddings = OnnxEmbeddings(model_dir, onnx_path, normalize, options)
+
+    report_path = export_dir / f"parity_{options.variant}.json"
+    if report_path.exists():
+        report = json.loads(report_path.read_text(encoding="utf-8"))
+    else:
+        logger.info("正在比对 ONNX 与 PyTorch 嵌入...")
+        report = cosine_parity(reference(), embeddings, PARITY_TEXTS)
+        report_path.write_text(json.dumps(report), encoding="utf-8")
+    logger.info(
+        f"ONNX 嵌入（{options.variant}）与 PyTorch 嵌入的余弦相似度: "
+        f"最小 {report['min_cosine']:.4f}，平均 {report['mean_cosine']:.4f}"
+    )
+    if report["min_cosine"] < options.parity_threshold:
+        raise ValueError(
+            f"ONNX 嵌入与 PyTorch 嵌入的最小余弦相似度 {report['min_cosine']:.4f} "
+            f"低于阈值 {options.parity_threshold}"
+        )
+    return embeddings
@@ -0,0 +1,121 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from .embedding_cache import CachedEmbeddings
+
+logger = logging.getLogger(__name__)
+
+EMBED_FN = Callable[[List[str]], List[List[float]]]
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    '''
+    一次前向计算批量编码多个查询。
+    查询不写入文档嵌入缓存，因此绕过 CachedEmbeddings 直接调用底层模型；
+    当前模型的查询与文档编码参数一致，embed_documents 与逐条 embed_query 结果相同。
+    '''
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.underlying
+    return embeddings.embed_documents(texts)
+
+
+class QueryEmbeddingBatcher:
+    """
+    查询向量微批处理器 - 收集短时间窗口内到达的查询，合并为一次模型调用。
+    关闭后（或后台线程意外退出时）embed() 直接在调用线程中编码；等待批次结果最多 timeout 秒，超时抛出 TimeoutError。
+    """
+    def __init__(
+            self,
+            embed_fn: EMBED_FN,
+            window: float = 0.002,
+            max_batch: int = 32,
+            timeout: float = 10.0,
+        ) -> None:
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.batches = 0
+        self.queries = 0
+        self._closed = False
+        # 保证关闭信号之后不会再有请求入队，入队的请求都会被后台线程处理
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[Tuple[str, Future] | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def embed(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self._lock:
+            queued = not self._closed and self._thread.is_alive()
+            if queued:
+                self._queue.put((text, future))
+        if not queued:
+            return self.embed_fn([text])[0]
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            logger.error(f"等待查询向量微批超时（{self.timeout}s）: {text!r}")
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=1)
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        '''从第一个请求开始，在时间窗口内凑满一批；返回 (批次, 是否收到关闭信号)'''
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        closed = False
+        while not closed:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, closed = self._collect(item)
+
+            # 同一批次内的重复查询只编码一次
+            positions: Dict[str, int] = {}
+            for text, _ in batch:
+                positions.setdefault(text, len(positions))
+            try:
+                vectors = self.embed_fn(list(positions))
+            except Exception as e:
+                for _, future in batch:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+                continue
+            for text, future in batch:
+                # 调用方等待超时后已取消的请求不再回填结果
+                if future.set_running_or_notify_cancel():
+                    future.set_result(vectors[positions[text]])
+
+            self.batches += 1
+            self.queries += len(batch)
+            logger.debug(f"查询微批: {len(batch)} 个请求, {len(positions)} 个不同查询。")
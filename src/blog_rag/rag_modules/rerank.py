@@ -0,0 +1,130 @@
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 打分函数：(查询, 文档块文本列表) -> 相关性分数，分数越大越相关
+SCORER = Callable[[str, List[str]], Sequence[float]]
+
+
+class CrossEncoderScorer:
+    """本地交叉编码器打分器 - 首次打分（通常是后台初始化中的 Reranker.warmup）时在 CPU 上加载模型，模型文件缓存在 cache_dir 下"""
+    def __init__(self, model_name: str, cache_dir: str | Path, max_length: int = 512) -> None:
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir)
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        from huggingface_hub import snapshot_download
+        from sentence_transformers import CrossEncoder
+
+        model_path = self.model_name
+        if not Path(model_path).is_dir():
+            model_path = snapshot_download(
+                self.model_name,
+                cache_dir=self.cache_dir,
+                endpoint="https://hf-mirror.com"  # 国内用户使用镜像加速下载
+            )
+        logger.info(f"正在加载重排模型: {self.model_name}")
+        return CrossEncoder(model_path, device="cpu", max_length=self.max_length)
+
+    def __call__(self, query: str, texts: List[str]) -> Sequence[float]:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model.predict([(query, text) for text in texts], batch_size=len(texts),
+                                   show_progress_bar=False)
+
+
+class Reranker:
+    """
+    重排阶段 - 对融合后的前 top_n 个文档块逐批打分并按分数重排：
+    - (查询, chunk_id) 分数缓存，命中的文档块无需再次打分
+    - 时间预算：按此前观测到的单个文档块打分耗时（warmup 时即测得）估计每一批的耗时，包括第一批；
+      剩余预算不足以打分一整批时缩小该批，一个也不够时停止打分，只重排已打分的前缀，其余保持融合顺序
+    """
+    # 单个文档块打分耗时估计值的指数滑动平均系数
+    COST_SMOOTHING = 0.3
+
+    def __init__(
+            self,
+            scorer: SCORER,
+            top_n: int = 20,
+            batch_size: int = 16,
+            budget: float | None = 0.2,
+            cache: LRUCache[float] | None = None,
+        ) -> None:
+        self.scorer = scorer
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.budget = budget
+        self.cache = cache if cache is not None else LRUCache(max_entries=10_000)
+        # 单个文档块的打分耗时估计（秒），尚未观测时为 None
+        self.doc_cost: float | None = None
+
+    def _observe(self, seconds: float, n_docs: int) -> None:
+        cost = seconds / n_docs
+        self.doc_cost = cost if self.doc_cost is None \
+            else (1 - self.COST_SMOOTHING) * self.doc_cost + self.COST_SMOOTHING * cost
+
+    def warmup(self, text_length: int = 256) -> None:
+        '''加载打分模型并以一整批合成文本试打分，测得单个文档块的打分耗时，使第一次查询也受时间预算约束'''
+        texts = ["重排模型预热。" * (text_length // 7)] * self.batch_size
+        self.scorer("预热", texts[:1])  # 首次调用包含模型加载，不计入耗时
+        start = time.perf_counter()
+        self.scorer("预热", texts)
+        self.doc_cost = None
+        self._observe(time.perf_counter() - start, len(texts))
+        logger.info(f"重排模型预热完成，单个文档块打分约 {self.doc_cost * 1000:.1f}ms。")
+
+    def rerank(self, query: str, docs: List[Document]) -> Tuple[List[Document], int]:
+        '''
+        返回重排后的文档块与实际参与重排的个数（受 top_n 与时间预算限制）。
+        参与重排的文档块元数据中写入 rerank_score。
+        '''
+        start = time.perf_counter()
+        key = " ".join(query.split())
+        head = docs[:self.top_n]
+        scores: List[float | None] = [
+            self.cache.get((key, doc.metadata.get("chunk_id"))) for doc in head
+        ]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        offset = 0
+        while offset < len(pending):
+            size = self.batch_size
+            if self.budget is not None and self.doc_cost is not None:
+                remaining = self.budget - (time.perf_counter() - start)
+                size = min(size, int(remaining / self.doc_cost) if self.doc_cost > 0 else size)
+                if size <= 0:
+                    break
+            batch = pending[offset:offset + size]
+            batch_start = time.perf_counter()
+            for i, score in zip(batch, self.scorer(query, [head[i].page_content for i in batch])):
+                scores[i] = float(score)
+                self.cache.put((key, head[i].metadata.get("chunk_id")), float(score))
+            self._observe(time.perf_counter() - batch_start, len(batch))
+            offset += len(batch)
+
+        # 只重排连续已打分的前缀，保证未打分的文档块不会排到融合分数更高的文档块之前
+        n = next((i for i, score in enumerate(scores) if score is None), len(head))
+        if n < len(head):
+            logger.info(f"重排超出时间预算，仅重排前 {n} 个文档块。")
+        prefix = np.asarray(scores[:n], dtype=np.float64)
+        order = np.argsort(-prefix, kind="stable")
+        reranked = [
+            Document(page_content=head[i].page_content,
+                     metadata={**head[i].metadata, "rerank_score": float(prefix[i])})
+            for i in order
+        ]
+        return reranked + docs[n:], n
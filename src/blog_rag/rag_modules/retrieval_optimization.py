@@ -1,138 +1,380 @@
+import copy
+import time
 import logging
-from typing import List, Dict, Any
+import unicodedata
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Collection, Dict, Iterator, List, Tuple
 
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
 
+from .cache import LRUCache
+from .bm25_index import BM25Index
+from .doc_store import ConcatDocuments, iter_texts, metadata_column
+from .fusion import LEG, FusionOptions, empty_leg, fuse, merge_legs
+from .live_delta import LiveDelta
+from .metadata_index import MATCH, MetadataIndex
+from .metrics import STAGE_BM25, STAGE_EMBEDDING, STAGE_FAISS, STAGE_FUSION, STAGE_RERANK
+from .query_batcher import QueryEmbeddingBatcher
+from .rerank import Reranker
+
 CHUNKS = List[Document]
 
 logger = logging.getLogger(__name__)
 
+
+class StaleVectorIndexError(ValueError):
+    """向量索引中的文档块与当前文档块无法一一对应，需要全量重建向量索引"""
+
+
 class RetrievalOptimizationModule:
     """检索优化模块 - 负责混合检索和过滤"""
     vectorstore: FAISS
-    def __init__(self, vectorstore: Any, chunks: CHUNKS) -> None:
+    def __init__(
+            self,
+            vectorstore: Any,
+            chunks: CHUNKS,
+            query_cache: LRUCache[List[float]] | None = None,
+            executor: Executor | None = None,
+            leg_timeout: float | None = None,
+            query_batcher: QueryEmbeddingBatcher | None = None,
+            bm25_index: BM25Index | None = None,
+            bm25_tokenizer: str = "cjk_bigram",
+            fusion: FusionOptions | None = None,
+            reranker: Reranker | None = None,
+        ) -> None:
         self.chunks = chunks
         if isinstance(vectorstore, FAISS):
             self.vectorstore = vectorstore
         else:
             raise ValueError("目前仅支持 FAISS 向量存储。")
+        # 查询向量缓存，可由调用方注入以便在索引重建后继续复用
+        self.query_cache = query_cache if query_cache is not None else LRUCache(max_entries=1024, ttl=3600)
+        # 向量检索与BM25检索并行执行的线程池，及单路检索的超时时间（秒）；
+        # 未注入时创建私有线程池，由 close() 关闭
+        self._owns_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="retrieval")
+        self.leg_timeout = leg_timeout
+        # 查询向量微批处理器，未提供时逐条调用嵌入模型
+        self.query_batcher = query_batcher
+        self.bm25_index = bm25_index
+        self.bm25_tokenizer = bm25_tokenizer
+        # 默认融合参数，可在单次检索时覆盖
+        self.fusion = fusion or FusionOptions()
+        # 可选的重排阶段，对融合后的前 top_n 个文档块重新打分
+        self.reranker = reranker
+        # 快照文档块及其数量；文件变更产生的文档块位于在线增量段，位置从 _n_base 开始编号
+        self._base_chunks = chunks
+        self._n_base = len(chunks)
+        self.delta = LiveDelta()
         self.setup_retrievers()
 
     def setup_retrievers(self):
-        """设置向量检索器和BM25检索器"""
+        """设置BM25倒排索引与元数据索引（向量检索经由查询向量缓存直接调用向量存储）"""
         logger.info("正在设置检索器...")
 
-        # 向量检索器
-        self.vector_retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
+        # 分类/标签倒排索引，以及文档块位置到 FAISS 内部ID的映射，用于在打分前限定候选集
+        self.metadata_index = MetadataIndex.build(self.chunks)
+        # 文件路径 -> 快照中的文档块位置，文件变更时据此标记删除
+        paths: Dict[str, List[int]] = {}
+        for row, path in enumerate(metadata_column(self.chunks, "path")):
+            paths.setdefault(path, []).append(row)
+        self._base_paths = {path: np.asarray(rows, dtype=np.int64) for path, rows in paths.items()}
+        chunk_ids = metadata_column(self.chunks, "chunk_id")
+        docstore_to_faiss = {doc_id: i for i, doc_id in self.vectorstore.index_to_docstore_id.items()}
+        self._faiss_ids = np.array([docstore_to_faiss.get(chunk_id, -1) for chunk_id in chunk_ids], dtype=np.int64)
+        if (self._faiss_ids < 0).any():
+            self._faiss_ids = self._map_legacy_ids(chunk_ids, docstore_to_faiss)
+        # FAISS 内部ID到文档块位置的反向映射，向量检索结果直接转换为文档块位置
+        valid = np.flatnonzero(self._faiss_ids >= 0)
+        self._faiss_to_pos = np.full(max(self.vectorstore.index.ntotal, int(self._faiss_ids.max(initial=-1)) + 1),
+                                     -1, dtype=np.int64)
+        self._faiss_to_pos[self._faiss_ids[valid]] = valid
 
-        # BM25检索器
-        self.bm25_retriever = BM25Retriever.from_documents(
-            self.chunks,
-            k=5
-        )
+        # BM25倒排索引，未注入或与文档块数量不符时在内存中重建
+        if self.bm25_index is None or self.bm25_index.n_docs != len(self.chunks):
+            self.bm25_index = BM25Index.build(
+                iter_texts(self.chunks),
+                tokenizer=self.bm25_tokenizer,
+            )
         logger.info("检索器设置完成")
-    
-    def hybrid_search(self, query: str, top_k: int = 3) -> List[Document]:
+
+    def _map_legacy_ids(self, chunk_ids: List[str], docstore_to_faiss: Dict[str, int]) -> np.ndarray:
+        '''
+        旧版本以 FAISS.from_documents 构建的索引使用随机 UUID 作为 docstore ID，
+        此时改为读取 docstore 中文档的 metadata["chunk_id"] 建立映射；仍有文档块找不到向量时抛出 StaleVectorIndexError
+        '''
+        known = set(chunk_ids)
+        remapped = 0
+        for doc_id, i in list(docstore_to_faiss.items()):
+            if doc_id in known:
+                continue
+            doc = self.vectorstore.docstore.search(doc_id)
+            chunk_id = doc.metadata.get("chunk_id") if isinstance(doc, Document) else None
+            if chunk_id is not None:
+                docstore_to_faiss[chunk_id] = i
+                remapped += 1
+        faiss_ids = np.array([docstore_to_faiss.get(chunk_id, -1) for chunk_id in chunk_ids], dtype=np.int64)
+        missing = int((faiss_ids < 0).sum())
+        if missing:
+            raise StaleVectorIndexError(f"向量索引与文档块不一致：{missing}/{len(chunk_ids)} 个文档块没有对应的向量")
+        logger.warning(f"向量索引使用旧版本的 docstore ID，已按文档元数据映射 {remapped} 个文档块，重建索引后可消除此映射。")
+        return faiss_ids
+
+    @property
+    def n_chunks(self) -> int:
+        '''可被检索到的文档块数（不含已删除的快照文档块）'''
+        return len(self.chunks) - len(self.delta.deleted)
+
+    def live_chunks(self) -> Iterator[Document]:
+        '''按位置遍历可被检索到的文档块'''
+        deleted = set(self.delta.deleted.tolist())
+        return (chunk for i, chunk in enumerate(self.chunks) if i not in deleted)
+
+    def apply_file_changes(self, paths: Collection[str], chunks: CHUNKS) -> "RetrievalOptimizationModule":
+        '''
+        返回应用了文件变更的新检索模块，当前模块保持不变，可继续服务进行中的查询：
+        快照中属于 paths 的文档块标记为删除，新文档块嵌入后放入在线增量段。
+        快照的向量、BM25 与元数据索引由新旧模块共享，代价只与变更文件和增量段的大小相关。
+        Args:
+            paths: 新增、修改或删除的文件的相对路径
+            chunks: 这些文件当前的全部文档块（已删除的文件没有文档块）
+        '''
+        assert self.bm25_index is not None
+        removed = [self._base_paths[path] for path in paths if path in self._base_paths]
+        vectors = np.asarray(
+            self.vectorstore.embeddings.embed_documents([c.page_content for c in chunks]),  # type: ignore[union-attr]
+            dtype=np.float32,
+        ) if chunks else np.empty((0, self.vectorstore.index.d), dtype=np.float32)
+        if self.vectorstore._normalize_L2 and len(vectors):
+            faiss.normalize_L2(vectors)
+        delta = self.delta.replace(
+            set(paths),
+            np.concatenate(removed) if removed else np.empty(0, dtype=np.int64),
+            chunks,
+            vectors,
+            self.bm25_index.tokenize,
+        )
+        module = copy.copy(self)
+        module.delta = delta
+        module.chunks = ConcatDocuments(self._base_chunks, delta.chunks)
+        # 私有线程池随新模块转移，旧模块被替换时关闭不影响新模块
+        self._owns_executor = False
+        return module
+
+    def hybrid_search(
+            self,
+            query: str,
+            top_k: int = 3,
+            candidates: np.ndarray | None = None,
+            fusion: FusionOptions | None = None,
+        ) -> List[Document]:
         """
-        混合检索 - 结合向量检索和BM25检索，使用RRF重排
+        混合检索 - 结合向量检索和BM25检索，按融合参数（RRF 或线性加权）重排，配置了重排阶段时再由交叉编码器重排
 
         Args:
             query: 查询文本
             top_k: 返回结果数量
+            candidates: 候选文档块位置，为 None 时不限定
+            fusion: 本次检索的融合参数，为 None 时使用模块默认值
 
         Returns:
-            检索到的文档列表
+            检索到的文档列表，融合分数写入副本的元数据（rrf_score 或 linear_score）
         """
-        # 分别获取向量检索和BM25检索结果
-        vector_docs = self.vector_retriever.invoke(query)
-        bm25_docs = self.bm25_retriever.invoke(query)
+        fusion = fusion or self.fusion
+        # 重排阶段需要融合结果的前 top_n 个作为输入
+        fused_k = max(top_k, self.reranker.top_n) if self.reranker is not None else top_k
+        depth = fusion.leg_depth(fused_k)
+        # 并行执行向量检索和BM25检索，任一路超时或失败时降级为单路结果
+        deadline = time.monotonic() + self.leg_timeout if self.leg_timeout is not None else None
+        vector_future = self._submit(self._vector_search, query, depth, candidates)
+        bm25_future = self._submit(self._bm25_search, query, depth, candidates)
+        vector_leg = self._leg_result("向量检索", vector_future, deadline)
+        bm25_leg = self._leg_result("BM25检索", bm25_future, deadline)
 
-        # 使用RRF重排
-        reranked_docs = self._rrf_rerank(vector_docs, bm25_docs)
-        return reranked_docs[:top_k]
+        with STAGE_FUSION.time():
+            ids, scores = fuse([vector_leg, bm25_leg], [fusion.vector_weight, fusion.bm25_weight], fused_k, fusion)
+        logger.info(
+            f"{fusion.method.upper()}融合完成: 向量检索{len(vector_leg[0])}个, "
+            f"BM25检索{len(bm25_leg[0])}个, 返回{len(ids)}个文档块"
+        )
+        # 返回副本，避免并发检索写入共享文档块的元数据
+        score_key = f"{fusion.method}_score"
+        docs = [
+            Document(page_content=self.chunks[i].page_content,
+                     metadata={**self.chunks[i].metadata, score_key: float(score)})
+            for i, score in zip(ids, scores)
+        ]
+        if self.reranker is not None and docs:
+            try:
+                with STAGE_RERANK.time():
+                    docs, _ = self.reranker.rerank(query, docs)
+            except Exception as e:
+                logger.warning(f"重排失败，使用融合排序结果: {e}")
+        return docs[:top_k]
     
     def metadata_filtered_search(
             self, 
             query: str, 
-            filters: Dict[str, Any], 
-            top_k: int = 5
+            filters: Dict[str, List[Any]], 
+            top_k: int = 5,
+            match: MATCH = "any",
+            fusion: FusionOptions | None = None,
         ) -> List[Document]:
         """
-        带元数据过滤的检索
+        带元数据过滤的检索，先由元数据索引确定候选集，再在候选集内进行混合检索
         
         Args:
             query: 查询文本
-            filters: 元数据过滤条件
+            filters: 元数据过滤条件，如 {"categories": [...], "tags": [...]}
             top_k: 返回结果数量
+            match: 同一字段的多个取值满足任一(any)或全部(all)
+            fusion: 本次检索的融合参数，为 None 时使用模块默认值
             
         Returns:
             过滤后的文档列表
         """
-        # 先进行混合检索，获取更多候选
-        return self.vectorstore.similarity_search(
-            query, k=top_k, filters=filters
-        )
-
-    def _rrf_rerank(
-            self, 
-            vector_docs: List[Document], 
-            bm25_docs: List[Document], 
-            k: int = 60
-        ) -> List[Document]:
-        """
-        使用RRF (Reciprocal Rank Fusion) 算法重排文档
+        candidates = self.metadata_index.candidates(filters, match)
+        if candidates is not None and self.delta.chunks:
+            delta_candidates = self.delta.metadata_index.candidates(filters, match)
+            assert delta_candidates is not None
+            candidates = np.concatenate([candidates, delta_candidates + self._n_base])
+        if candidates is not None and len(candidates) == 0:
+            return []
+        return self.hybrid_search(query, top_k, candidates, fusion)
 
-        Args:
-            vector_docs: 向量检索结果
-            bm25_docs: BM25检索结果
-            k: RRF参数，用于平滑排名
-
-        Returns:
-            重排后的文档列表
-        """
-        doc_scores: Dict[int, float] = {}
-        doc_objects: Dict[int, Document] = {}
+    def _split_candidates(self, candidates: np.ndarray | None) -> Tuple[np.ndarray | None, np.ndarray | None]:
+        '''把候选位置拆分为快照部分（去除已删除的文档块）与在线增量段部分（段内序号）'''
+        if candidates is None:
+            return None, None
+        base = candidates[candidates < self._n_base]
+        if len(self.delta.deleted):
+            base = base[~np.isin(base, self.delta.deleted)]
+        return base, candidates[candidates >= self._n_base] - self._n_base
 
-        # 计算向量检索结果的RRF分数
-        for rank, doc in enumerate(vector_docs):
-            # 使用文档内容的哈希作为唯一标识
-            doc_id = hash(doc.page_content)
-            doc_objects[doc_id] = doc
+    def _vector_search(self, query: str, k: int, candidates: np.ndarray | None = None) -> LEG:
+        """向量检索，返回文档块位置与相似度分数（内积或负的 L2 距离，越大越相似）"""
+        with STAGE_EMBEDDING.time():
+            query_vector = np.asarray([self.embed_query(query)], dtype=np.float32)
+        with STAGE_FAISS.time():
+            if self.vectorstore._normalize_L2:
+                faiss.normalize_L2(query_vector)
+            base_candidates, delta_candidates = self._split_candidates(candidates)
+            deleted = self.delta.deleted
+            if base_candidates is None and len(deleted):
+                # 多取被删除的数量，过滤后仍有 k 个
+                ids, scores = self._faiss_search(query_vector, k + len(deleted), None)
+                keep = ~np.isin(ids, deleted)
+                base_leg = ids[keep][:k], scores[keep][:k]
+            else:
+                base_leg = self._faiss_search(query_vector, k, base_candidates)
+            if not self.delta.chunks:
+                return base_leg
+            return merge_legs([base_leg, self._delta_vector_search(query_vector[0], k, delta_candidates)], k)
 
-            # RRF公式: 1 / (k + rank)
-            rrf_score = 1.0 / (k + rank + 1)
-            doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
-
-            logger.debug(f"向量检索 - 文档{rank+1}: RRF分数 = {rrf_score:.4f}")
+    def _delta_vector_search(self, query_vector: np.ndarray, k: int, candidates: np.ndarray | None) -> LEG:
+        '''在线增量段的向量数量很少，直接精确计算，分数与快照索引的一致'''
+        assert self.delta.vectors is not None
+        local = np.arange(len(self.delta.chunks)) if candidates is None else candidates
+        vectors = self.delta.vectors[local]
+        if self.vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            scores = vectors @ query_vector
+        else:
+            scores = -((vectors - query_vector) ** 2).sum(axis=1)
+        return local.astype(np.int64) + self._n_base, scores.astype(np.float32)
 
-        # 计算BM25检索结果的RRF分数
-        for rank, doc in enumerate(bm25_docs):
-            doc_id = hash(doc.page_content)
-            doc_objects[doc_id] = doc
+    def _faiss_search(self, query_vector: np.ndarray, k: int, candidates: np.ndarray | None) -> LEG:
+        index = self.vectorstore.index
+        if candidates is None:
+            if index.ntotal == 0:
+                return empty_leg()
+            distances, indices = index.search(query_vector, min(k, index.ntotal))
+            distances, top = distances[0], indices[0]
+        else:
+            faiss_ids = self._faiss_ids[candidates]
+            faiss_ids = faiss_ids[faiss_ids >= 0]
+            if len(faiss_ids) == 0:
+                return empty_leg()
+            k = min(k, len(faiss_ids))
+            ivf = faiss.try_extract_index_ivf(index)
+            if isinstance(index, faiss.IndexHNSW):
+                # HNSW 图遍历在选择性过滤下会漏召回，直接对候选向量精确计算距离
+                all_distances = ((index.reconstruct_batch(faiss_ids) - query_vector) ** 2).sum(axis=1)
+                order = np.argsort(all_distances, kind="stable")[:k]
+                distances, top = all_distances[order], faiss_ids[order]
+            else:
+                # 通过 ID 选择器让 FAISS 只计算候选向量的距离；IVF 需遍历全部聚类以保证候选不被漏掉
+                selector = faiss.IDSelectorBatch(faiss_ids)
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist) if ivf is not None \
+                    else faiss.SearchParameters(sel=selector)
+                distances, indices = index.search(query_vector, k, params=params)
+                distances, top = distances[0], indices[0]
+        valid = top >= 0
+        positions = self._faiss_to_pos[top[valid]]
+        scores = distances[valid] if index.metric_type == faiss.METRIC_INNER_PRODUCT else -distances[valid]
+        known = positions >= 0
+        return positions[known], scores[known].astype(np.float32)
 
-            rrf_score = 1.0 / (k + rank + 1)
-            doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
+    def _bm25_search(self, query: str, k: int, candidates: np.ndarray | None = None) -> LEG:
+        assert self.bm25_index is not None
+        with STAGE_BM25.time():
+            base_candidates, delta_candidates = self._split_candidates(candidates)
+            base_leg = self.bm25_index.top_k(
+                query, k, base_candidates, exclude=self.delta.deleted if base_candidates is None else None)
+            if not self.delta.chunks:
+                return base_leg
+            scores = self.bm25_index.score_documents(query, self.delta.term_counts, self.delta.doc_lens)
+            local = np.arange(len(scores)) if delta_candidates is None else delta_candidates
+            local = local[scores[local] > 0]
+            return merge_legs([base_leg, (local + self._n_base, scores[local])], k)
 
-            logger.debug(f"BM25检索 - 文档{rank+1}: RRF分数 = {rrf_score:.4f}")
+    def _submit(self, fn: Callable[..., LEG], *args: Any) -> Future:
+        """提交单路检索；私有线程池已随模块替换关闭时（进行中的查询仍持有旧模块）在当前线程执行"""
+        try:
+            return self.executor.submit(fn, *args)
+        except RuntimeError:
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
 
-        # 按最终RRF分数排序
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
+    def close(self) -> None:
+        """关闭私有线程池；注入的共享线程池由调用方管理"""
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
 
-        # 构建最终结果
-        reranked_docs = []
-        for doc_id, final_score in sorted_docs:
-            if doc_id in doc_objects:
-                doc = doc_objects[doc_id]
-                # 将RRF分数添加到文档元数据中
-                doc.metadata['rrf_score'] = final_score
-                reranked_docs.append(doc)
-                logger.debug(f"最终排序 - 文档: {doc.page_content[:20]}... 最终RRF分数: {final_score:.4f}")
+    @staticmethod
+    def _leg_result(name: str, future: Future, deadline: float | None) -> LEG:
+        """等待单路检索结果，超时或异常时返回空结果"""
+        timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # 尚未开始的检索直接取消；已在运行的无法中断，会占用线程池中的一个线程直到完成
+            future.cancel()
+            logger.warning(f"{name}超时，降级为单路检索结果。")
+        except Exception as e:
+            logger.warning(f"{name}失败，降级为单路检索结果: {e}")
+        return empty_leg()
 
-        logger.info(f"RRF重排完成: 向量检索{len(vector_docs)}个文档, BM25检索{len(bm25_docs)}个文档, 合并后{len(reranked_docs)}个文档")
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """查询归一化：全角转半角、合并空白、转小写"""
+        return " ".join(unicodedata.normalize("NFKC", query).split()).lower()
 
-        return reranked_docs
+    def embed_query(self, query: str) -> List[float]:
+        """获取查询向量，优先从查询向量缓存中读取；归一化结果只用作缓存键，编码的仍是原始查询"""
+        key = self.normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            if self.query_batcher is not None:
+                embedding = self.query_batcher.embed(query)
+            else:
+                embedding = self.vectorstore.embeddings.embed_query(query)  # type: ignore[union-attr]
+            self.query_cache.put(key, embedding)
+        return embedding
@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api.app import app
+from blog_rag import BlogRAGSystem
+from blog_rag.config import BlogRAGConfig
+from blog_rag.rag_modules import IndexConstructionModule
+
+
+@pytest.fixture
+def fake_rag(tmp_path: Path) -> Iterator[BlogRAGSystem]:
+    """基于临时 Markdown 目录与假嵌入模型构建好快照的 RAG 系统（不加载真实模型）"""
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    for i in range(12):
+        (md_dir / f"post{i}.md").write_text(
+            f"---\ntags: [llm]\ncategories: [tech]\n---\n# 文章{i}\n\n第{i}篇文章介绍 dropout 正则化与注意力机制。",
+            encoding="utf-8",
+        )
+    config = BlogRAGConfig(
+        index_dir=tmp_path / "index",
+        cache_dir=tmp_path / "cache",
+        markdown_dir=md_dir,
+        query_batch_window_ms=0,
+        embedding_cache_size=0,
+        search_rank_depth=4,
+    )
+    index = IndexConstructionModule(model_name="fake", index_save_path=config.index_dir)
+    index.embeddings = DeterministicFakeEmbedding(size=16)  # type: ignore[assignment]
+    rag = BlogRAGSystem(config=config, index_module=index, auto_start=False)
+    rag.reindex()
+    try:
+        yield rag
+    finally:
+        rag.close()
+
+
+@pytest.fixture
+def rag_client(fake_rag: BlogRAGSystem) -> Iterator[TestClient]:
+    """不启用 lifespan、直接使用 fake_rag 的 TestClient"""
+    app.state.rag = fake_rag
+    try:
+        yield TestClient(app)
+    finally:
+        for name in ("rag", "rag_startup_task", "rag_build_task"):
+            if hasattr(app.state, name):
+                delattr(app.state, name)
@@ -1,5 +1,12 @@
+import json
+
+import pytest
 from fastapi.testclient import TestClient
 
+from api.app import app
+from blog_rag import BlogRAGSystem, ServiceNotReadyError
+from blog_rag.config import BlogRAGConfig
+
 
 def test_meta_tags(client: TestClient):
     resp = client.get("/meta/tags")
@@ -15,20 +22,20 @@ def test_meta_categories(client: TestClient):
     assert isinstance(data.get("items", []), list)
 
 
-def test_search(client: TestClient):
+def test_search(rag_client: TestClient):
     payload = {"query": "dropout", "topK": 5, "page": 1, "size": 5}
-    resp = client.post("/search", json=payload)
+    resp = rag_client.post("/search", json=payload)
     assert resp.status_code == 200
     data = resp.json().get("data", {})
     items = data.get("items", [])
     assert isinstance(items, list)
-    assert len(items) <= 5
+    assert 0 < len(items) <= 5
 
 
-def test_get_doc(client: TestClient):
+def test_get_doc(rag_client: TestClient):
     # Perform a search to obtain a doc id
     payload = {"query": "dropout", "topK": 1, "page": 1, "size": 1}
-    search_resp = client.post("/search", json=payload)
+    search_resp = rag_client.post("/search", json=payload)
     assert search_resp.status_code == 200
     search_data = search_resp.json().get("data", {})
     items = search_data.get("items", [])
@@ -37,9 +44,120 @@ def test_get_doc(client: TestClient):
     meta = items[0].get("metadata", {})
     doc_id = meta.get("doc_id") or meta.get("parent_id") or meta.get("file_id")
 
-    doc_resp = client.get(f"/docs/{doc_id}")
+    doc_resp = rag_client.get(f"/docs/{doc_id}")
     assert doc_resp.status_code == 200
     doc_data = doc_resp.json().get("data", {})
     assert "content" in doc_data
     assert "metadata" in doc_data
     assert "path" in doc_data
+
+
+def test_search_etag_not_modified(rag_client: TestClient, fake_rag):
+    payload = {"query": "dropout", "page": 1, "size": 3}
+    first = rag_client.post("/search", json=payload)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    # 逗号分隔的多个实体标签，弱比较忽略 W/ 前缀
+    resp = rag_client.post("/search", json=payload, headers={"If-None-Match": f'"other", {etag.removeprefix("W/")}'})
+    assert resp.status_code == 304 and resp.content == b""
+    assert rag_client.post("/search", json=payload, headers={"If-None-Match": "*"}).status_code == 304
+    # 只包含该 ETag 的子串时不匹配
+    digest = etag.removeprefix("W/").strip('"')
+    assert rag_client.post("/search", json=payload, headers={"If-None-Match": f'"x{digest}"'}).status_code == 200
+
+    # 检索模块切换后语料版本变化，旧 ETag 失效
+    fake_rag.retrieval_module = fake_rag.retrieval_module
+    resp = rag_client.post("/search", json=payload, headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.headers["ETag"] != etag
+
+
+def test_search_page_out_of_range_is_not_cacheable(rag_client: TestClient, fake_rag):
+    page = fake_rag.config.search_max_depth // 3 + 1
+    payload = {"query": "dropout", "page": page, "size": 3}
+    resp = rag_client.post("/search", json=payload)
+    assert resp.json()["code"] == 40002
+    assert "ETag" not in resp.headers and "Cache-Control" not in resp.headers
+    # 条件请求也先校验分页范围，不会得到 304
+    resp = rag_client.post("/search", json=payload, headers={"If-None-Match": "*"})
+    assert resp.status_code != 304 and resp.json()["code"] == 40002
+
+
+def test_search_paging_with_cursor(rag_client: TestClient, fake_rag):
+    # search_rank_depth=4：深翻时排序深度按 4 -> 8 -> 16 成倍增长
+    assert [fake_rag._rank_depth(page, 3, None) for page in (1, 2, 3, 4)] == [4, 8, 16, 16]
+    seen, cursor, page = [], None, 1
+    while True:
+        resp = rag_client.post("/search", json={"query": "dropout", "page": page, "size": 3, "cursor": cursor})
+        assert resp.status_code == 200
+        data = resp.json()["data"]
+        assert len(data["items"]) <= 3
+        seen.extend(item["metadata"]["chunk_id"] for item in data["items"])
+        cursor = data["cursor"]
+        if not data["hasMore"]:
+            break
+        page += 1
+    assert page == 4 and data["total"] == 12
+    assert len(seen) == len(set(seen)) == 12
+
+    # 页码超出最大深度时返回错误
+    fake_rag.config.search_max_depth = 6
+    resp = rag_client.post("/search", json={"query": "dropout", "page": 3, "size": 3})
+    assert resp.json()["success"] is False and resp.json()["code"] == 40002
+
+
+def test_answer_streams_sse_events(rag_client: TestClient, fake_rag):
+    resp = rag_client.post("/answer", json={"query": "dropout", "topK": 2})
+    assert resp.status_code == 503 and resp.json()["code"] == 50302
+
+    class FakeGeneration:
+        async def astream_basic_answer(self, question, context, max_length=1000):
+            for piece in ["答", "案"]:
+                yield piece
+
+    fake_rag.generation_module = FakeGeneration()
+    with rag_client.stream("POST", "/answer", json={"query": "dropout", "topK": 2}) as resp:
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in body.strip().split("\n\n")
+    ]
+    assert [event for event, _ in events] == ["sources", "token", "token", "done"]
+    assert len(events[0][1]["items"]) == 2
+    assert "".join(data["text"] for event, data in events if event == "token") == "答案"
+
+
+def test_search_and_answer_return_503_until_ready(tmp_path):
+    config = BlogRAGConfig(index_dir=tmp_path / "index", cache_dir=tmp_path / "cache", markdown_dir=tmp_path)
+    rag = BlogRAGSystem(config=config, auto_start=False)
+    app.state.rag = rag
+    try:
+        client = TestClient(app)
+        for path in ("/search", "/answer"):
+            resp = client.post(path, json={"query": "dropout"})
+            assert resp.status_code == 503
+            assert resp.json()["code"] == 50301 and resp.headers["Retry-After"]
+        # 检索模块缺失时直接调用检索也返回未就绪错误，而不是断言失败
+        with pytest.raises(ServiceNotReadyError):
+            rag.query_chunks("dropout", None, 3)
+    finally:
+        del app.state.rag
+        rag.close()
+
+
+def test_generation_failure_only_disables_answer(tmp_path, monkeypatch, fake_rag):
+    rag = BlogRAGSystem(config=fake_rag.config, index_module=fake_rag.index_module, auto_start=False)
+
+    def broken_generation():
+        raise ValueError("missing api key")
+
+    monkeypatch.setattr(rag, "_make_generation_module", broken_generation)
+    rag.initialize_modules()
+    try:
+        assert rag.ready and rag.generation_module is None
+        assert rag.readiness()["generation_error"] == "missing api key"
+        assert rag.query_chunks("dropout", None, 2)
+    finally:
+        rag.close()
@@ -0,0 +1,25 @@
+import json
+from pathlib import Path
+
+from benchmarks.bench_pipeline import compare, main
+
+SMALL = ["--docs", "6", "--sections", "2", "--dim", "16", "--queries", "3", "--warmup", "2",
+         "--fusion-depth", "20", "--repeat", "1"]
+
+
+def test_bench_pipeline_smoke(tmp_path: Path):
+    output = tmp_path / "bench.json"
+    assert main([*SMALL, "--output", str(output)]) == 0
+
+    result = json.loads(output.read_text(encoding="utf-8"))
+    assert result["meta"]["warmup"] == 2 and result["meta"]["chunks"] > 0
+    assert {"embedding", "faiss_build", "bm25_build", "hybrid_search", "fusion"} <= set(result["stages"])
+    # 预热查询不计入统计
+    assert result["stages"]["hybrid_search"]["n"] == 3
+    assert all(stats["median_ms"] >= 0 for stats in result["stages"].values())
+
+    # 与自身比较没有回退；基线快得多时报告回退并以非零状态退出
+    assert main([*SMALL, "--baseline", str(output), "--tolerance", "1000", "--output", str(tmp_path / "b.json")]) == 0
+    fast = {"stages": {name: {**stats, "median_ms": stats["median_ms"] / 1e6}
+                       for name, stats in result["stages"].items()}}
+    assert compare(result, fast, tolerance=0.25)
@@ -0,0 +1,372 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from blog_rag import BlogRAGSystem, SearchOverloadedError
+from blog_rag.config import BlogRAGConfig
+
+
+def _slow_rag(workers: int, queue_size: int) -> BlogRAGSystem:
+    config = BlogRAGConfig(search_workers=workers, search_queue_size=queue_size)
+    retrieval = SimpleNamespace(hybrid_search=lambda query, top_k: time.sleep(0.2) or [])
+    return BlogRAGSystem(config=config, retrieval_module=retrieval, auto_start=False)
+
+
+@pytest.mark.asyncio
+async def test_aquery_chunks_rejects_when_queue_is_full():
+    rag = _slow_rag(workers=1, queue_size=1)
+    try:
+        results = await asyncio.gather(
+            *(rag.aquery_chunks("dropout", None, 3) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert [r for r in results if isinstance(r, SearchOverloadedError)]
+        assert [r for r in results if r == []]
+        # 名额释放后可以继续接受请求
+        assert await rag.aquery_chunks("dropout", None, 3) == []
+    finally:
+        rag.close()
+
+
+def _snapshot_rag(tmp_path, md_dir) -> BlogRAGSystem:
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from blog_rag.rag_modules import IndexConstructionModule
+
+    config = BlogRAGConfig(
+        index_dir=tmp_path / "index",
+        cache_dir=tmp_path / "cache",
+        markdown_dir=md_dir,
+        keep_snapshots=2,
+        query_batch_window_ms=0,
+        embedding_cache_size=0,
+    )
+    index = IndexConstructionModule(model_name="fake", index_save_path=config.index_dir)
+    index.embeddings = DeterministicFakeEmbedding(size=16)  # type: ignore[assignment]
+    return BlogRAGSystem(config=config, index_module=index, auto_start=False)
+
+
+def test_reindex_swaps_snapshot_while_old_one_keeps_serving(tmp_path):
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("---\ntags: [llm]\n---\n# A\n\ndropout 正则化", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    try:
+        first = rag.reindex()
+        old_retrieval = rag.retrieval_module
+        assert (rag.config.index_dir / "CURRENT").read_text(encoding="utf-8") == first
+        assert rag.reindex_status.state == "succeeded"
+
+        (md_dir / "b.md").write_text("---\ntags: [cv]\n---\n# B\n\n卷积网络", encoding="utf-8")
+        second = rag.reindex(incremental=True)
+        assert rag.retrieval_module is not old_retrieval
+        assert rag.index_version == second
+        assert {c.metadata["path"] for c in rag.retrieval_module.chunks} == {"a.md", "b.md"}
+        # 旧快照的引用仍可继续检索
+        assert old_retrieval.hybrid_search("dropout", 1)
+
+        third = rag.reindex()
+        snapshots = sorted(p.name for p in rag.snapshots_dir.iterdir())
+        assert snapshots == [second, third]
+
+        # 重启后从 CURRENT 指向的快照加载
+        restarted = _snapshot_rag(tmp_path, md_dir)
+        restarted.data_module = restarted._make_data_module(restarted.snapshots_dir / third)
+        restarted.index_module.index_save_path = restarted.snapshots_dir / third
+        assert restarted._current_snapshot() == third
+        assert restarted.load_knowledge_index()
+        assert restarted.query_chunks("卷积", None, 1)
+        restarted.close()
+    finally:
+        rag.close()
+
+
+def test_unmappable_vector_index_is_rebuilt_on_load(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("# A\n\ndropout 正则化", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    first = rag.reindex()
+    rag.close()
+    # 以没有 chunk_id 元数据的向量索引覆盖快照，模拟无法映射的旧索引
+    stale = FAISS.from_texts(["无关内容"], DeterministicFakeEmbedding(size=16))
+    stale.save_local(str(rag.snapshots_dir / first / "faiss_index"))
+
+    restarted = _snapshot_rag(tmp_path, md_dir)
+    try:
+        restarted.data_module = restarted._make_data_module(restarted.snapshots_dir / first)
+        restarted.index_module.index_save_path = restarted.snapshots_dir / first
+        assert restarted.load_knowledge_index()
+        assert restarted.index_version not in (None, first)
+        assert (restarted.retrieval_module._faiss_ids >= 0).all()
+    finally:
+        restarted.close()
+
+
+def test_failed_reindex_keeps_current_snapshot(tmp_path):
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("# A\n\ndropout", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    try:
+        version = rag.reindex()
+        retrieval = rag.retrieval_module
+        (md_dir / "a.md").unlink()
+        with pytest.raises(ValueError):
+            rag.reindex()
+        assert rag.reindex_status.state == "failed"
+        assert rag.retrieval_module is retrieval
+        assert [p.name for p in rag.snapshots_dir.iterdir()] == [version]
+    finally:
+        rag.close()
+
+
+@pytest.mark.asyncio
+async def test_start_reindex_leaves_status_untouched_when_lock_is_busy(tmp_path):
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("# A\n\ndropout", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    try:
+        with rag._reindex_lock:
+            with pytest.raises(RuntimeError):
+                rag.start_reindex()
+            assert rag.reindex_status.state == "idle"
+            assert not rag.reindex_running
+
+        version = await rag.start_reindex()
+        assert version == rag.index_version
+        assert rag.reindex_status.state == "succeeded"
+        assert not rag._reindex_lock.locked()
+    finally:
+        rag.close()
+
+
+def test_apply_file_changes_updates_live_index(tmp_path):
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("---\ntags: [llm]\n---\n# A\n\ndropout 正则化", encoding="utf-8")
+    (md_dir / "b.md").write_text("---\ntags: [cv]\n---\n# B\n\n卷积网络", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    try:
+        rag.reindex()
+        old_retrieval = rag.retrieval_module
+
+        (md_dir / "a.md").write_text("---\ntags: [rl]\n---\n# A\n\n策略梯度", encoding="utf-8")
+        (md_dir / "b.md").unlink()
+        (md_dir / "c.md").write_text("# C\n\n注意力机制", encoding="utf-8")
+        assert rag.apply_file_changes([md_dir / "a.md", md_dir / "b.md", md_dir / "c.md"])
+
+        retrieval = rag.retrieval_module
+        assert retrieval is not old_retrieval
+        assert {c.metadata["path"] for c in retrieval.live_chunks()} == {"a.md", "c.md"}
+        assert retrieval.n_chunks == 2
+        # 快照索引在新旧模块间共享，未被复制或修改
+        assert retrieval.vectorstore is old_retrieval.vectorstore
+        assert retrieval.bm25_index is old_retrieval.bm25_index
+        assert rag.query_chunks("策略梯度", None, 1)[0].metadata["path"] == "a.md"
+        assert rag.query_chunks("注意力", None, 1)[0].metadata["path"] == "c.md"
+        assert all(c.metadata["path"] != "b.md" for c in rag.query_chunks("卷积网络", None, 5))
+        assert [c.metadata["path"] for c in rag.query_chunks("策略", {"tags": ["rl"]}, 5)] == ["a.md"]
+        assert rag.query_chunks("dropout", {"tags": ["llm"]}, 5) == []
+        assert rag.data_module.tags == {"rl"}
+        assert rag.data_module.get_markdown(rag.data_module.documents[1].metadata["file_id"]) is None
+        # 旧检索模块不受影响
+        assert {c.metadata["path"] for c in old_retrieval.live_chunks()} == {"a.md", "b.md"}
+        assert old_retrieval.hybrid_search("卷积网络", 1)[0].metadata["path"] == "b.md"
+
+        # 再次修改同一文件时替换增量段中的旧文档块
+        (md_dir / "a.md").write_text("# A\n\n强化学习", encoding="utf-8")
+        assert rag.apply_file_changes([md_dir / "a.md"])
+        live = {c.metadata["path"]: c.page_content for c in rag.retrieval_module.live_chunks()}
+        assert live.keys() == {"a.md", "c.md"} and "强化学习" in live["a.md"]
+        assert rag.data_module.tags == set()
+    finally:
+        rag.close()
+
+
+def test_file_changes_during_reindex_are_applied_afterwards(tmp_path):
+    md_dir = tmp_path / "markdown"
+    md_dir.mkdir()
+    (md_dir / "a.md").write_text("# A\n\ndropout 正则化", encoding="utf-8")
+    rag = _snapshot_rag(tmp_path, md_dir)
+    try:
+        rag.reindex()
+        (md_dir / "b.md").write_text("# B\n\n卷积网络", encoding="utf-8")
+        # 模拟正在运行的重建：变更先排队，释放重建锁后应用
+        rag._reindex_lock.acquire()
+        rag._on_markdown_change([md_dir / "b.md"])
+        assert rag.retrieval_module.n_chunks == 1
+        rag._release_reindex_lock()
+        assert rag.retrieval_module.n_chunks == 2
+        assert rag.query_chunks("卷积", None, 1)[0].metadata["path"] == "b.md"
+        assert not rag._pending_paths
+
+        # 在线增量段超过上限时重建快照将其合并
+        version = rag.index_version
+        rag.config.live_delta_max_chunks = 0
+        (md_dir / "a.md").unlink()
+        rag._on_markdown_change([md_dir / "a.md"])
+        assert rag.index_version != version
+        assert rag.retrieval_module.delta.size == 0
+        assert [c.metadata["path"] for c in rag.retrieval_module.chunks] == ["b.md"]
+    finally:
+        rag.close()
+
+
+def test_result_cache_hits_and_invalidates_on_swap():
+    calls = []
+
+    def search(query, top_k):
+        calls.append(query)
+        return [SimpleNamespace(page_content=query, metadata={})]
+
+    config = BlogRAGConfig(query_batch_window_ms=0)
+    rag = BlogRAGSystem(config=config, retrieval_module=SimpleNamespace(hybrid_search=search), auto_start=False)
+    try:
+        assert rag.query_chunks("dropout 正则化", None, 3) == rag.query_chunks("  dropout   正则化 ", None, 3)
+        assert len(calls) == 1
+        # 过滤条件与 top_k 属于缓存键
+        rag.query_chunks("dropout 正则化", None, 5)
+        assert len(calls) == 2
+
+        version = rag.corpus_version
+        rag.retrieval_module = SimpleNamespace(hybrid_search=search)
+        assert rag.corpus_version != version
+        assert rag.cached_query_chunks("dropout 正则化", None, 3) is None
+        rag.query_chunks("dropout 正则化", None, 3)
+        assert len(calls) == 3
+    finally:
+        rag.close()
+
+
+def test_search_page_slices_cached_ranking():
+    calls = []
+
+    def search(query, top_k):
+        calls.append(top_k)
+        return [SimpleNamespace(page_content=f"{query}-{i}", metadata={}) for i in range(min(top_k, 25))]
+
+    config = BlogRAGConfig(query_batch_window_ms=0, search_rank_depth=20, search_max_depth=100)
+    rag = BlogRAGSystem(config=config, retrieval_module=SimpleNamespace(hybrid_search=search), auto_start=False)
+    try:
+        first = rag.search_page("q", None, page=1, size=5)
+        assert [c.content for c in first.items] == [f"q-{i}" for i in range(5)]
+        assert first.total == 20 and first.has_more
+        assert calls == [20]
+
+        second = rag.search_page("q", None, page=2, size=5, cursor=first.cursor)
+        assert [c.content for c in second.items] == [f"q-{i}" for i in range(5, 10)]
+        assert calls == [20]
+
+        # 超出已计算深度时深度成倍增长后重新检索（20 -> 40 覆盖第 6 页所需的 30 条）
+        deep = rag.search_page("q", None, page=6, size=5, cursor=first.cursor)
+        assert calls == [20, 40]
+        assert [c.content for c in deep.items] == []
+        assert deep.total == 25 and not deep.has_more
+
+        # 游标属于其他查询时忽略
+        other = rag.search_page("other", None, page=2, size=5, cursor=first.cursor)
+        assert other.cursor != first.cursor
+        assert [c.content for c in other.items][0] == "other-5"
+
+        limited = rag.search_page("q", None, page=2, size=5, top_k=8)
+        assert [c.content for c in limited.items] == ["q-5", "q-6", "q-7"]
+        assert limited.total == 8 and not limited.has_more
+    finally:
+        rag.close()
+
+
+@pytest.mark.asyncio
+async def test_astream_answer_emits_sources_tokens_and_ttft():
+    seen = {}
+
+    async def astream_basic_answer(question, context, max_length=1000):
+        seen["context"] = [d.page_content for d in context]
+        for piece in ["答", "案"]:
+            yield piece
+
+    retrieval = SimpleNamespace(
+        hybrid_search=lambda query, top_k: [SimpleNamespace(page_content="dropout", metadata={"path": "a.md"})]
+    )
+    config = BlogRAGConfig(query_batch_window_ms=0)
+    rag = BlogRAGSystem(config=config, retrieval_module=retrieval, auto_start=False,
+                        generation_module=SimpleNamespace(astream_basic_answer=astream_basic_answer))
+    try:
+        events = [e async for e in rag.astream_answer("dropout")]
+    finally:
+        rag.close()
+
+    assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+    assert events[0][1]["items"] == [{"path": "a.md"}]
+    assert "".join(data["text"] for name, data in events if name == "token") == "答案"
+    done = events[-1][1]
+    assert done["tokens"] == 2 and 0 <= done["ttftMs"] <= done["totalMs"]
+    assert seen["context"] == ["dropout"]
+
+
+def test_collect_metrics_reports_result_cache_once_per_lookup():
+    from blog_rag.rag_modules import metrics
+
+    search = lambda query, top_k: [SimpleNamespace(page_content=query, metadata={})]
+    config = BlogRAGConfig(query_batch_window_ms=0)
+    rag = BlogRAGSystem(config=config, retrieval_module=SimpleNamespace(hybrid_search=search), auto_start=False)
+    try:
+        asyncio.run(rag.aquery_chunks("dropout", None, 3))
+        asyncio.run(rag.aquery_chunks("dropout", None, 3))
+        families = {name: samples for name, _, _, samples in rag.collect_metrics()}
+        assert ("", {"cache": "result"}, 1) in families["blog_rag_cache_hits_total"]
+        assert ("", {"cache": "result"}, 1) in families["blog_rag_cache_misses_total"]
+        assert ("", {"cache": "result"}, 0.5) in families["blog_rag_cache_hit_ratio"]
+        assert "# TYPE blog_rag_cache_hits_total counter" in metrics.REGISTRY.render(rag.collect_metrics())
+    finally:
+        rag.close()
+
+
+@pytest.mark.asyncio
+async def test_start_initialize_loads_in_background_and_reports_readiness():
+    rag = BlogRAGSystem(config=BlogRAGConfig(query_batch_window_ms=0), auto_start=False)
+
+    def initialize_modules():
+        time.sleep(0.05)
+        rag.retrieval_module = SimpleNamespace(hybrid_search=lambda query, top_k: [])
+
+    def failing_initialize():
+        raise RuntimeError("模型下载失败")
+
+    try:
+        rag.initialize_modules = initialize_modules  # type: ignore[method-assign]
+        task = rag.start_initialize()
+        assert not rag.readiness()["ready"]
+        assert await task
+        assert rag.readiness()["ready"]
+
+        rag.retrieval_module = None
+        rag.initialize_modules = failing_initialize  # type: ignore[method-assign]
+        assert not await rag.start_initialize()
+        status = rag.readiness()
+        assert not status["ready"] and status["error"] == "模型下载失败"
+    finally:
+        rag.close()
+
+
+def test_import_does_not_load_model_libraries():
+    import os
+    import sys
+    import subprocess
+    from pathlib import Path
+
+    import blog_rag
+
+    code = (
+        "import sys, blog_rag; "
+        "print(','.join(m for m in ('faiss', 'torch', 'langchain_huggingface', 'langchain_deepseek') "
+        "if m in sys.modules))"
+    )
+    env = {**os.environ, "PYTHONPATH": str(Path(blog_rag.__file__).resolve().parents[1])}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
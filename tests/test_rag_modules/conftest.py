@@ -0,0 +1,44 @@
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from blog_rag.rag_modules import DataPreparationModule, IndexConstructionModule
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """记录调用次数的确定性假嵌入模型"""
+    document_calls: List[List[str]] = []
+    query_calls: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.document_calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.query_calls.append(text)
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def fake_embeddings() -> CountingEmbedding:
+    embeddings = CountingEmbedding(size=16)
+    embeddings.document_calls = []
+    embeddings.query_calls = []
+    return embeddings
+
+
+@pytest.fixture
+def rag_modules(
+    tmp_path: Path, sample_md_dir: Path, fake_embeddings: CountingEmbedding
+) -> Tuple[DataPreparationModule, IndexConstructionModule]:
+    """基于样例 Markdown 与假嵌入模型构建好的数据与索引模块"""
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    data = DataPreparationModule(markdown_dir=sample_md_dir / "markdown", cache_dir=cache_dir)
+    data.renew_data()
+    index = IndexConstructionModule(model_name="fake", index_save_path=tmp_path / "index")
+    index.embeddings = fake_embeddings
+    index.build_vector_index(data.chunks)
+    return data, index
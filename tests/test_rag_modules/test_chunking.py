@@ -0,0 +1,91 @@
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules.chunking import (
+    ChunkingOptions,
+    estimate_tokens,
+    merge_small_sections,
+    split_section,
+)
+from blog_rag.rag_modules.data_preparation import split_markdown
+
+
+def test_long_section_split_with_overlap():
+    options = ChunkingOptions(max_tokens=60, overlap_tokens=20, min_tokens=0)
+    sentences = [f"第{i}句话讲述向量检索的一个细节。" for i in range(20)]
+    windows = split_section("".join(sentences), options)
+
+    assert len(windows) > 1
+    assert all(estimate_tokens(w) <= options.max_tokens for w in windows)
+    # 相邻窗口以完整句子重叠
+    for prev, nxt in zip(windows, windows[1:]):
+        first = nxt.split("\n\n")[0]
+        assert first in prev
+    assert all(s in "".join(windows) for s in sentences)
+
+
+def test_code_fence_kept_whole():
+    options = ChunkingOptions(max_tokens=80, overlap_tokens=0, min_tokens=0)
+    code = "```python\n" + "\n".join(f"x{i} = {i}" for i in range(10)) + "\n```"
+    text = "介绍" * 50 + "\n\n" + code + "\n\n" + "总结" * 20
+    windows = split_section(text, options)
+
+    assert any(code in w for w in windows)
+    assert all(w.count("```") % 2 == 0 for w in windows)
+
+
+def test_long_table_repeats_header():
+    options = ChunkingOptions(max_tokens=40, overlap_tokens=0, min_tokens=0)
+    header = "| 名称 | 数值 |\n| --- | --- |"
+    rows = "\n".join(f"| 项目{i} | {i} |" for i in range(30))
+    windows = split_section(f"{header}\n{rows}", options)
+
+    assert len(windows) > 1
+    assert all(w.startswith(header) for w in windows)
+
+
+def test_long_math_block_split_into_closed_blocks():
+    options = ChunkingOptions(max_tokens=40, overlap_tokens=0, min_tokens=0)
+    lines = [f"a_{{{i}}} &= \\sum_{{k=1}}^{{{i}}} k^2 \\\\" for i in range(30)]
+    windows = split_section("$$\n\\begin{aligned}\n" + "\n".join(lines) + "\n\\end{aligned}\n$$", options)
+
+    assert len(windows) > 1
+    assert all(w.startswith("$$\n") and w.endswith("\n$$") and w.count("$$") == 2 for w in windows)
+    assert all(estimate_tokens(w) <= options.max_tokens for w in windows)
+    assert all(line in "".join(windows) for line in lines)
+
+
+def test_small_sections_merged():
+    options = ChunkingOptions(max_tokens=200, overlap_tokens=0, min_tokens=10)
+    sections = [
+        Document(page_content="短", metadata={"H1": "a"}),
+        Document(page_content="这一节的正文足够长，不需要与相邻的节合并。", metadata={"H1": "b"}),
+        Document(page_content="尾", metadata={"H1": "c"}),
+    ]
+    merged = merge_small_sections(sections, options)
+
+    assert len(merged) == 1
+    assert merged[0].page_content.startswith("短") and merged[0].page_content.endswith("尾")
+    assert merged[0].metadata == {"H1": "a"}
+
+
+def test_overlong_sentence_truncated_within_budget():
+    options = ChunkingOptions(max_tokens=30, overlap_tokens=0, min_tokens=0)
+    # 中英混排且没有句末标点的长句，按字符比例截断会超出预算
+    sentence = "向量检索" * 20 + " transformer attention" * 30 + " " + "x" * 300 + "数值" * 40
+    windows = split_section(sentence, options)
+
+    assert len(windows) > 1
+    assert all(estimate_tokens(w) <= options.max_tokens for w in windows)
+    assert "".join(w.replace("\n\n", "") for w in windows).replace(" ", "") == sentence.replace(" ", "")
+
+
+def test_split_markdown_records_token_counts():
+    body = "".join(f"第{i}句话。" for i in range(200))
+    doc = Document(page_content=f"# 标题\n\n{body}", metadata={"file_id": "f", "path": "p.md"})
+    chunks = split_markdown(doc, ChunkingOptions(max_tokens=100, overlap_tokens=10, min_tokens=0))
+
+    assert len(chunks) > 1
+    assert [c.metadata["chunk_index"] for c in chunks] == list(range(len(chunks)))
+    assert len({c.metadata["chunk_id"] for c in chunks}) == len(chunks)
+    assert all(c.metadata["chunk_tokens"] <= 100 for c in chunks)
+    assert all(c.metadata["h1"] == "标题" for c in chunks)
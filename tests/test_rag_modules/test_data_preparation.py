@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from blog_rag.rag_modules import DataPreparationModule
+from blog_rag.rag_modules.doc_store import DocumentStore
+
+
+def _write_corpus(md_dir: Path, n: int) -> None:
+    for i in range(n):
+        path = md_dir / f"dir{i % 3}" / f"post{i}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            f"---\ntitle: post{i}\ncategories: [c{i % 2}]\ntags: [t{i % 4}]\n---\n"
+            f"# 标题{i}\n\n正文{i}\n\n## 小节\n\n内容{i}",
+            encoding="utf-8",
+        )
+
+
+def test_parallel_stream_matches_serial(tmp_path: Path):
+    md_dir = tmp_path / "markdown"
+    _write_corpus(md_dir, 12)
+
+    serial = DataPreparationModule(md_dir, tmp_path / "serial", workers=1)
+    serial_chunks = [c for batch in serial.stream_chunks(batch_size=5) for c in batch]
+
+    parallel = DataPreparationModule(md_dir, tmp_path / "parallel", workers=2)
+    parallel.parallel_min_files = 0
+    batches = list(parallel.stream_chunks(batch_size=5))
+
+    assert all(len(batch) == 5 for batch in batches[:-1])
+    parallel_chunks = [c for batch in batches for c in batch]
+    assert [c.metadata for c in parallel_chunks] == [c.metadata for c in serial_chunks]
+    assert [c.page_content for c in parallel_chunks] == [c.page_content for c in serial_chunks]
+    # 已产出的文档块写入文档存储，迭代结束后以内存映射方式打开
+    assert list(parallel.chunks) == parallel_chunks
+    assert len(parallel.documents) == 12
+    assert all(parallel.get_markdown(doc.metadata["file_id"]) for doc in parallel.documents)
+    assert set(parallel.load_manifest()) == {doc.metadata["path"] for doc in parallel.documents}
+    assert parallel.categories == {"c0", "c1"}
+    assert parallel.tags == {"t0", "t1", "t2", "t3"}
+
+
+def test_load_metadata_serves_saved_documents(tmp_path: Path):
+    md_dir = tmp_path / "markdown"
+    _write_corpus(md_dir, 6)
+    built = DataPreparationModule(md_dir, tmp_path / "cache")
+    built.renew_data()
+
+    loaded = DataPreparationModule(md_dir, tmp_path / "cache")
+    assert loaded.load_metadata()
+    assert loaded.categories == built.categories and loaded.tags == built.tags
+    assert not loaded.id2markdown
+    for file_id, (path, doc) in built.id2markdown.items():
+        assert loaded.get_markdown(file_id) == (path, doc)
+    assert loaded.get_markdown("missing") is None
+
+    # 刷新部分文件后，未变化的文档仍可查询，已删除的文档不再返回
+    deleted = built.documents[0].metadata
+    (md_dir / deleted["path"]).unlink()
+    changes = loaded.stage_files([deleted["path"]])
+    assert changes.documents == {deleted["path"]: None} and changes.chunks == []
+    assert loaded.get_markdown(deleted["file_id"]) is not None
+    loaded.commit_files(changes)
+    # 文档存储不会被读入内存
+    assert len(loaded.documents) == 6 and not loaded.id2markdown
+    assert loaded.get_markdown(deleted["file_id"]) is None
+    for file_id, (path, doc) in built.id2markdown.items():
+        if file_id != deleted["file_id"]:
+            assert loaded.get_markdown(file_id) == (path, doc)
+
+
+def test_abandoned_stream_does_not_publish_store(tmp_path: Path):
+    md_dir = tmp_path / "markdown"
+    _write_corpus(md_dir, 6)
+    data = DataPreparationModule(md_dir, tmp_path / "cache")
+    stream = data.stream_chunks(batch_size=2)
+    next(stream)
+    stream.close()
+    assert DocumentStore.load(tmp_path / "cache" / "chunks") is None
+    assert not data.load_manifest()
@@ -0,0 +1,53 @@
+import pickle
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules import DataPreparationModule
+from blog_rag.rag_modules.doc_store import DocumentStore, iter_texts, metadata_column
+
+
+def test_document_store_roundtrip(tmp_path: Path):
+    docs = [
+        Document(page_content="# 注意力\n\n段落A", metadata={"chunk_id": "a", "tags": ["llm"], "h1": "注意力"}),
+        Document(page_content="", metadata={"chunk_id": "b"}),
+        Document(page_content="dropout", metadata={"chunk_id": "c", "h2": None}),
+    ]
+    DocumentStore.save(tmp_path, docs)
+
+    store = DocumentStore.load(tmp_path)
+    assert store is not None
+    assert len(store) == 3
+    assert list(store) == docs
+    assert store[-1] == docs[2]
+    assert metadata_column(store, "tags") == [["llm"], None, None]
+    assert list(iter_texts(store)) == [doc.page_content for doc in docs]
+    store.close()
+
+
+def test_load_chunks_reads_store_written_by_renew(tmp_path: Path, rag_modules):
+    data, _ = rag_modules
+    chunks = list(data.chunks)
+
+    loaded = data.load_chunks()
+    assert isinstance(loaded, DocumentStore)
+    assert list(loaded) == chunks
+
+
+def test_legacy_pickle_cache_is_migrated_once(tmp_path: Path):
+    docs = [Document(page_content="dropout", metadata={"chunk_id": "a", "path": "a.md"})]
+    with open(tmp_path / "chunks.pkl", "wb") as f:
+        pickle.dump(docs, f)
+    data = DataPreparationModule(markdown_dir=tmp_path, cache_dir=tmp_path)
+
+    loaded = data.load_chunks()
+    assert isinstance(loaded, DocumentStore)
+    assert list(loaded) == docs
+    assert not (tmp_path / "chunks.pkl").exists()
+    assert (tmp_path / "chunks.pkl.migrated").exists()
+
+    data.close()
+    assert loaded.closed
+    with DocumentStore(tmp_path / "chunks") as store:
+        assert list(store) == docs
+    assert store.closed
@@ -0,0 +1,63 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from blog_rag.rag_modules.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: List[List[str]] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def _cached(tmp_path: Path, max_entries: int = 100) -> CachedEmbeddings:
+    underlying = CountingEmbedding(size=8)
+    underlying.calls = []
+    cache = EmbeddingCache(tmp_path, CachedEmbeddings.namespace("BAAI/bge-small-zh-v1.5", True), max_entries)
+    return CachedEmbeddings(underlying, cache)
+
+
+def test_cache_skips_model_for_known_texts(tmp_path: Path):
+    embeddings = _cached(tmp_path)
+    first = embeddings.embed_documents(["注意力", "dropout"])
+    embeddings.flush()
+
+    reloaded = _cached(tmp_path)
+    second = reloaded.embed_documents(["dropout", "注意力", "新文本"])
+
+    assert reloaded.underlying.calls == [["新文本"]]  # type: ignore[attr-defined]
+    assert np.allclose(second[0], first[1]) and np.allclose(second[1], first[0])
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    embeddings = _cached(tmp_path, max_entries=2)
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["c"])
+
+    assert len(embeddings.cache) == 2
+    assert embeddings.cache.get_many([EmbeddingCache.key("b")]) == [None]
+    assert embeddings.cache.get_many([EmbeddingCache.key("a")])[0] is not None
+
+
+def test_index_is_flushed_on_threshold_not_every_batch(tmp_path: Path):
+    embeddings = _cached(tmp_path)
+    embeddings.cache.flush_every = 3
+    index_path = embeddings.cache.root / "index.json"
+
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["b"])
+    assert not index_path.exists()
+
+    embeddings.embed_documents(["c"])
+    assert index_path.exists()
+    mtime = index_path.stat().st_mtime_ns
+
+    embeddings.embed_documents(["a", "b"])  # 全部命中缓存，没有新的写入
+    embeddings.flush()
+    assert index_path.stat().st_mtime_ns == mtime
@@ -0,0 +1,32 @@
+import time
+import threading
+from pathlib import Path
+from typing import List, Set
+
+from blog_rag.rag_modules.file_watcher import MarkdownWatcher
+
+
+def test_polling_watcher_debounces_changes(tmp_path: Path):
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    (tmp_path / "b.md").write_text("# B", encoding="utf-8")
+    batches: List[Set[Path]] = []
+    received = threading.Event()
+
+    def on_change(paths: Set[Path]) -> None:
+        batches.append(paths)
+        received.set()
+
+    watcher = MarkdownWatcher(tmp_path, on_change, debounce=0.2, poll_interval=0.05, force_polling=True)
+    watcher.start()
+    try:
+        time.sleep(0.1)
+        (tmp_path / "a.md").write_text("# A 已修改", encoding="utf-8")
+        (tmp_path / "b.md").unlink()
+        (tmp_path / "c.md").write_text("# C", encoding="utf-8")
+        (tmp_path / "notes.txt").write_text("ignored", encoding="utf-8")
+        assert received.wait(timeout=5)
+    finally:
+        watcher.stop()
+
+    assert len(batches) == 1
+    assert {p.name for p in batches[0]} == {"a.md", "b.md", "c.md"}
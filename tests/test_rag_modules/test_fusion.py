@@ -0,0 +1,58 @@
+from typing import Tuple
+
+import numpy as np
+
+from blog_rag.rag_modules import DataPreparationModule, IndexConstructionModule, RetrievalOptimizationModule
+from blog_rag.rag_modules.fusion import FusionOptions, fuse
+
+
+def _leg(ids, scores):
+    return np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float32)
+
+
+def test_weighted_rrf_matches_reference():
+    vector = _leg([3, 1, 2], [0.9, 0.8, 0.1])
+    bm25 = _leg([2, 4], [7.0, 1.0])
+    options = FusionOptions(method="rrf", rrf_k=60)
+    ids, scores = fuse([vector, bm25], [1.0, 2.0], top_k=10, options=options)
+
+    expected = {3: 1 / 61, 1: 1 / 62, 2: 1 / 63 + 2 / 61, 4: 2 / 62}
+    ranking = sorted(expected, key=lambda i: (-expected[i], i))
+    assert ids.tolist() == ranking
+    assert np.allclose(scores, [expected[i] for i in ranking])
+
+
+def test_linear_fusion_normalizes_each_leg():
+    # 两路分数量纲不同，归一化后 BM25 的 4 号与向量的 3 号各得满分
+    vector = _leg([3, 1], [-0.2, -1.0])
+    bm25 = _leg([4, 1], [12.0, 6.0])
+    ids, scores = fuse([vector, bm25], [1.0, 1.0], top_k=2, options=FusionOptions(method="linear"))
+
+    assert ids.tolist() == [3, 4]
+    assert np.allclose(scores, [1.0, 1.0])
+
+
+def test_fuse_honours_top_k_at_depth():
+    rng = np.random.default_rng(0)
+    legs = [_leg(rng.permutation(5000)[:1000], np.sort(rng.random(1000))[::-1]) for _ in range(2)]
+    ids, scores = fuse(legs, [1.0, 1.0], top_k=200, options=FusionOptions())
+
+    assert len(ids) == 200 and len(set(ids.tolist())) == 200
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_hybrid_search_returns_top_k_beyond_default_depth(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule]
+):
+    data, index = rag_modules
+    retrieval = RetrievalOptimizationModule(vectorstore=index.vectorstore, chunks=data.chunks)
+    top_k = len(data.chunks)
+
+    docs = retrieval.hybrid_search("dropout", top_k=top_k, fusion=FusionOptions(depth=1))
+    assert len(docs) == top_k
+    assert all("rrf_score" in d.metadata for d in docs)
+    # 分数写入副本，共享的文档块元数据不受影响
+    assert all("rrf_score" not in c.metadata for c in data.chunks)
+
+    linear = retrieval.hybrid_search("dropout", top_k=3, fusion=FusionOptions(method="linear"))
+    assert [d.metadata["linear_score"] for d in linear] == sorted((d.metadata["linear_score"] for d in linear), reverse=True)
@@ -0,0 +1,40 @@
+import json
+from typing import List
+
+import httpx
+import pytest
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules import GenerationIntegrationModule
+
+
+def _stub_chat_server(pieces: List[str], requests: List[dict]) -> httpx.AsyncClient:
+    """兼容 OpenAI 协议的本地桩服务：以 SSE 逐段返回 pieces"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        events = [
+            {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "deepseek-chat",
+             "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]}
+            for piece in pieces
+        ]
+        body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_astream_basic_answer_streams_tokens_from_stub_server():
+    requests: List[dict] = []
+    generation = GenerationIntegrationModule(
+        api_key="x",
+        base_url="http://stub.local/v1",
+        http_async_client=_stub_chat_server(["Dropout ", "随机", "丢弃神经元"], requests),
+    )
+    context = [Document(page_content="dropout 是一种正则化方法", metadata={"h1": "正则化"})]
+
+    tokens = [t async for t in generation.astream_basic_answer("什么是 dropout", context)]
+
+    assert tokens == ["Dropout ", "随机", "丢弃神经元"]
+    assert requests[0]["stream"] is True
+    prompt = requests[0]["messages"][0]["content"]
+    assert "dropout 是一种正则化方法" in prompt and "什么是 dropout" in prompt
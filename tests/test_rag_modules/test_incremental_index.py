@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from blog_rag.rag_modules import DataPreparationModule, IndexConstructionModule
+
+
+def _write(path: Path, body: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"---\ntitle: {path.stem}\ntags: [llm]\n---\n{body}", encoding="utf-8")
+
+
+def _index_module(tmp_path: Path) -> IndexConstructionModule:
+    module = IndexConstructionModule(model_name="fake", index_save_path=tmp_path / "index")
+    module.embeddings = DeterministicFakeEmbedding(size=16)  # type: ignore[assignment]
+    return module
+
+
+def test_incremental_renew_only_touches_changed_files(tmp_path: Path):
+    md_dir, cache_dir = tmp_path / "markdown", tmp_path / "cache"
+    cache_dir.mkdir()
+    _write(md_dir / "a.md", "# A\n\n段落A\n\n## A2\n\n段落A2")
+    _write(md_dir / "b.md", "# B\n\n段落B")
+    _write(md_dir / "c.md", "# C\n\n段落C")
+
+    data = DataPreparationModule(markdown_dir=md_dir, cache_dir=cache_dir)
+    _, chunks = data.renew_data()
+    index = _index_module(tmp_path)
+    index.build_vector_index(chunks)
+    manifest = data.load_manifest()
+    assert set(manifest) == {"a.md", "b.md", "c.md"}
+
+    _write(md_dir / "a.md", "# A\n\n段落A 已修改")
+    (md_dir / "b.md").unlink()
+    _write(md_dir / "d.md", "# D\n\n段落D")
+
+    data = DataPreparationModule(markdown_dir=md_dir, cache_dir=cache_dir)
+    new_chunks, stale_ids = data.renew_data_incremental(manifest, data.load_chunks())
+
+    assert {c.metadata["path"] for c in new_chunks} == {"a.md", "d.md"}
+    assert set(stale_ids) == set(manifest["a.md"]["chunk_ids"] + manifest["b.md"]["chunk_ids"])
+    assert set(manifest["c.md"]["chunk_ids"]) <= {c.metadata["chunk_id"] for c in data.chunks}
+
+    index.delete_chunks(stale_ids)
+    index.add_chunks(new_chunks)
+    assert index.vectorstore is not None
+    assert set(index.vectorstore.index_to_docstore_id.values()) == {
+        c.metadata["chunk_id"] for c in data.chunks
+    }
+    assert set(data.load_manifest()) == {"a.md", "c.md", "d.md"}
+
+
+def test_chunk_ids_are_stable_across_rebuilds(tmp_path: Path):
+    md_dir, cache_dir = tmp_path / "markdown", tmp_path / "cache"
+    cache_dir.mkdir()
+    _write(md_dir / "a.md", "# A\n\n段落\n\n## A2\n\n段落\n\n## A2\n\n段落")
+
+    first = DataPreparationModule(markdown_dir=md_dir, cache_dir=cache_dir).renew_data()[1]
+    second = DataPreparationModule(markdown_dir=md_dir, cache_dir=cache_dir).renew_data()[1]
+
+    first_ids = [c.metadata["chunk_id"] for c in first]
+    assert first_ids == [c.metadata["chunk_id"] for c in second]
+    assert len(set(first_ids)) == len(first_ids)
+
+    index = _index_module(tmp_path)
+    index.build_vector_index(first)
+    assert index.vectorstore is not None
+    assert list(index.vectorstore.index_to_docstore_id.values()) == first_ids
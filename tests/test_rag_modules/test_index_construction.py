@@ -0,0 +1,156 @@
+import json
+from pathlib import Path
+
+import faiss
+import pytest
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules import IndexConstructionModule, RetrievalOptimizationModule
+from blog_rag.rag_modules.disk_docstore import DiskDocstore
+
+
+def _chunks(n: int):
+    return [
+        Document(
+            page_content=f"段落 {i} dropout attention {i % 13}",
+            metadata={"chunk_id": f"c{i}", "tags": ["rare"] if i % 50 == 0 else ["llm"]},
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf", "ivfpq", "sq8"])
+def test_ann_index_types_build_and_report_recall(tmp_path: Path, fake_embeddings, index_type: str):
+    chunks = _chunks(600)
+    module = IndexConstructionModule(
+        model_name="fake", index_save_path=tmp_path, index_type=index_type,
+        index_params={"pq_m": 4, "pq_nbits": 4, "ivf_nlist": 8},
+    )
+    module.embeddings = fake_embeddings
+    vectorstore = module.build_vector_index(chunks)
+
+    assert not isinstance(vectorstore.index, faiss.IndexFlat)
+    assert module.recall_report is not None and 0 < module.recall_report["recall_at_k"] <= 1
+    assert module.supports_incremental == (index_type == "sq8")
+
+    module.save_vector_index(vectorstore)
+    report = json.loads((tmp_path / "faiss_index" / "recall_report.json").read_text(encoding="utf-8"))
+    assert report["index_type"] == index_type
+
+    retrieval = RetrievalOptimizationModule(vectorstore=module.load_vector_index(), chunks=chunks)
+    rare = retrieval.metadata_filtered_search("dropout", {"tags": ["rare"]}, top_k=5)
+    assert len(rare) == 5 and all(doc.metadata["tags"] == ["rare"] for doc in rare)
+
+
+def test_ivfpq_falls_back_to_flat_for_tiny_corpus(tmp_path: Path, fake_embeddings):
+    module = IndexConstructionModule(model_name="fake", index_save_path=tmp_path, index_type="ivfpq")
+    module.embeddings = fake_embeddings
+    vectorstore = module.build_vector_index(_chunks(20))
+    assert isinstance(vectorstore.index, faiss.IndexFlat)
+    assert module.recall_report is None
+
+
+def test_streaming_build_resumes_from_checkpoint(tmp_path: Path, fake_embeddings):
+    chunks = _chunks(100)
+    checkpoint_dir = tmp_path / "checkpoint"
+
+    class FailingEmbedding(type(fake_embeddings)):
+        def embed_documents(self, texts):
+            if len(self.document_calls) == 4:
+                raise RuntimeError("interrupted")
+            return super().embed_documents(texts)
+
+    failing = FailingEmbedding(size=16)
+    failing.document_calls = []
+    module = IndexConstructionModule(
+        model_name="fake", index_save_path=tmp_path, batch_size=10,
+        checkpoint_dir=checkpoint_dir, checkpoint_interval=20,
+    )
+    module.embeddings = failing
+    with pytest.raises(RuntimeError):
+        module.build_vector_index(iter([chunks[:35], chunks[35:]]))
+
+    # 已确认的 40 个向量被复用，其余重新嵌入
+    module.embeddings = fake_embeddings
+    progress = []
+    vectorstore = module.build_vector_index(
+        iter([chunks[:35], chunks[35:]]), on_progress=lambda n, rate: progress.append(n)
+    )
+    assert sum(len(call) for call in fake_embeddings.document_calls) == 60
+    assert module.build_stats is not None and module.build_stats["resumed"] == 40
+    assert progress[-1] == 100
+    assert list(vectorstore.index_to_docstore_id.values()) == [c.metadata["chunk_id"] for c in chunks]
+    expected = fake_embeddings.embed_query(chunks[7].page_content)
+    assert vectorstore.index.reconstruct(7) == pytest.approx(expected, rel=1e-5)
+
+    assert module.checkpoint_path is not None and module.checkpoint_path.parent == checkpoint_dir
+    module.discard_checkpoint()
+    assert not module.checkpoint_path.exists()
+
+
+def test_checkpoint_is_keyed_by_build_config(tmp_path: Path, fake_embeddings):
+    checkpoint_dir = tmp_path / "checkpoint"
+    first = IndexConstructionModule(
+        model_name="fake", index_save_path=tmp_path / "a", checkpoint_dir=checkpoint_dir, checkpoint_key="a|400",
+    )
+    first.embeddings = fake_embeddings
+    first.build_vector_index(_chunks(30))
+
+    # 切分配置不同的构建使用独立的检查点，不会截断或复用前一个构建的检查点
+    second = IndexConstructionModule(
+        model_name="fake", index_save_path=tmp_path / "b", checkpoint_dir=checkpoint_dir, checkpoint_key="b|400",
+    )
+    second.embeddings = fake_embeddings
+    second.build_vector_index(_chunks(10))
+    assert second.build_stats is not None and second.build_stats["resumed"] == 0
+    assert first.checkpoint_path != second.checkpoint_path
+    assert first.checkpoint_path is not None and first.checkpoint_path.exists()
+
+
+def test_docstore_is_streamed_to_disk(tmp_path: Path, fake_embeddings):
+    chunks = _chunks(50)
+    module = IndexConstructionModule(model_name="fake", index_save_path=tmp_path, batch_size=8)
+    module.embeddings = fake_embeddings
+    vectorstore = module.build_vector_index(iter([chunks[:20], chunks[20:]]))
+    assert isinstance(vectorstore.docstore, DiskDocstore)
+    assert vectorstore.docstore.search("c3") == chunks[3]
+    module.save_vector_index(vectorstore)
+    # index.pkl 只保存 ID 映射，不含正文
+    assert b"dropout" not in (tmp_path / "faiss_index" / "index.pkl").read_bytes()
+
+    # 增量更新后保存到新目录：删除与新增的文档块合并写入新目录的 docstore
+    updated = IndexConstructionModule(model_name="fake", index_save_path=tmp_path / "next")
+    updated.embeddings = fake_embeddings
+    updated.load_vector_index(source_dir=tmp_path)
+    updated.delete_chunks(["c0", "c1"])
+    extra = Document(page_content="新段落 dropout", metadata={"chunk_id": "x0"})
+    updated.add_chunks([extra])
+    assert updated.vectorstore is not None
+    updated.save_vector_index(updated.vectorstore)
+    module.close()
+    updated.close()
+
+    reloaded = IndexConstructionModule(model_name="fake", index_save_path=tmp_path / "next")
+    reloaded.embeddings = fake_embeddings
+    store = reloaded.load_vector_index()
+    assert store is not None and len(store.index_to_docstore_id) == 49
+    assert store.docstore.search("x0") == extra
+    assert isinstance(store.docstore.search("c0"), str)
+    assert reloaded.similarity_search("新段落 dropout", k=1)[0].metadata["chunk_id"] == "x0"
+    reloaded.close()
+
+
+def test_onnx_export_dir_tracks_model_revision(tmp_path: Path):
+    module = IndexConstructionModule(model_name="BAAI/bge-small-zh-v1.5", index_save_path=tmp_path / "index")
+    snapshot = tmp_path / "hub" / "snapshots" / "0123456789abcdef0123"
+    snapshot.mkdir(parents=True)
+    assert module.onnx_export_dir(snapshot).name == "BAAI--bge-small-zh-v1.5@0123456789ab"
+
+    # 本地模型目录按权重内容区分
+    local = tmp_path / "local-model"
+    local.mkdir()
+    (local / "model.safetensors").write_bytes(b"weights-v1")
+    first = module.onnx_export_dir(local)
+    assert module.onnx_export_dir(local) == first
+    (local / "model.safetensors").write_bytes(b"weights-v2")
+    assert module.onnx_export_dir(local) != first
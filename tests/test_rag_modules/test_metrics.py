@@ -0,0 +1,44 @@
+import pytest
+
+from blog_rag.rag_modules.metrics import Counter, Histogram, Registry, _Metric, gauge_family
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.register(Histogram("stage_seconds", "阶段耗时", ("stage",), buckets=(0.01, 0.1)))
+    child = latency.labels("faiss")
+    for value in (0.005, 0.01, 0.05, 3.0):
+        child.observe(value)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP stage_seconds 阶段耗时", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="faiss",le="0.01"} 2' in lines
+    assert 'stage_seconds_bucket{stage="faiss",le="0.1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="faiss",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="faiss"} 4' in lines
+    assert 'stage_seconds_sum{stage="faiss"} 3.065' in lines
+
+
+def test_counter_labels_and_extra_families():
+    registry = Registry()
+    requests = registry.register(Counter("http_requests", "请求数", ("route", "status")))
+    requests.labels("/search", 200).inc()
+    requests.labels("/search", 200).inc()
+    requests.labels('/a"b', 404).inc()
+
+    text = registry.render([gauge_family("cache_entries", "条目数", [({"cache": "result"}, 3)])])
+    assert "# HELP http_requests_total 请求数\n# TYPE http_requests_total counter\n" in text
+    assert 'http_requests_total{route="/search",status="200"} 2' in text
+    assert 'http_requests_total{route="/a\\"b",status="404"} 1' in text
+    assert "# TYPE cache_entries gauge\ncache_entries{cache=\"result\"} 3\n" in text
+
+
+def test_metric_subclass_must_implement_collect():
+    class Incomplete(_Metric):
+        kind = "gauge"
+
+        def _new_child(self) -> "Incomplete":
+            return Incomplete(self.name, self.help)
+
+    with pytest.raises(TypeError):
+        Incomplete("x", "未实现 collect")  # type: ignore[abstract]
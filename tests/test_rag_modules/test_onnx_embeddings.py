@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+from blog_rag.rag_modules.onnx_embeddings import PARITY_TEXTS, OnnxOptions, cosine_parity, load_onnx_embeddings
+
+
+@pytest.fixture(scope="module")
+def tiny_model_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    '''随机初始化的小型 BERT，按 sentence-transformers 格式保存（CLS 池化），结构与 bge 系列一致'''
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    root = tmp_path_factory.mktemp("tiny-bert")
+    chars = sorted({c for text in PARITY_TEXTS + ["dropout 正则化"] for c in text.lower() if not c.isspace()})
+    vocab = root / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *chars]), encoding="utf-8")
+    hf_dir = root / "hf"
+    BertTokenizerFast(vocab_file=str(vocab)).save_pretrained(hf_dir)
+    config = BertConfig(vocab_size=5 + len(chars), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, max_position_embeddings=64)
+    BertModel(config).save_pretrained(hf_dir)
+
+    word = models.Transformer(str(hf_dir), max_seq_length=48)
+    pooling = models.Pooling(word.get_word_embedding_dimension(), pooling_mode="cls")
+    model_dir = root / "model"
+    SentenceTransformer(modules=[word, pooling], device="cpu").save(str(model_dir))
+    return model_dir
+
+
+def _reference(model_dir: Path):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=str(model_dir), model_kwargs={"device": "cpu"},
+                                 encode_kwargs={"normalize_embeddings": True})
+
+
+def test_fp32_export_matches_pytorch(tiny_model_dir: Path, tmp_path: Path):
+    reference = _reference(tiny_model_dir)
+    onnx = load_onnx_embeddings(tiny_model_dir, tmp_path, lambda: reference,
+                                options=OnnxOptions(quantize=False, batch_size=3))
+
+    texts = PARITY_TEXTS + ["dropout 正则化"]
+    assert cosine_parity(reference, onnx, texts)["min_cosine"] > 0.9999
+    vectors = np.asarray(onnx.embed_documents(texts))
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    assert np.allclose(onnx.embed_query(texts[-1]), vectors[-1], atol=1e-5)
+
+
+def test_parity_report_is_reused_and_enforced(tiny_model_dir: Path, tmp_path: Path):
+    reference = _reference(tiny_model_dir)
+    load_onnx_embeddings(tiny_model_dir, tmp_path, lambda: reference, options=OnnxOptions(parity_threshold=0.5))
+    assert (tmp_path / "model_int8.onnx").exists() and (tmp_path / "parity_int8.json").exists()
+
+    def unexpected_reference():
+        raise AssertionError("比对结果已保存，不应再加载 PyTorch 模型")
+
+    with pytest.raises(ValueError):
+        load_onnx_embeddings(tiny_model_dir, tmp_path, unexpected_reference, options=OnnxOptions(parity_threshold=1.0 + 1e-9))
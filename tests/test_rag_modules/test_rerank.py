@@ -0,0 +1,83 @@
+import time
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules import DataPreparationModule, IndexConstructionModule, RetrievalOptimizationModule
+from blog_rag.rag_modules.rerank import Reranker
+
+
+class StubScorer:
+    """按文本长度打分的桩打分器，记录每批打分的文本"""
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.batches: List[List[str]] = []
+
+    def __call__(self, query: str, texts: List[str]) -> List[float]:
+        time.sleep(self.delay)
+        self.batches.append(list(texts))
+        return [float(len(t)) for t in texts]
+
+
+def _docs(texts: List[str]) -> List[Document]:
+    return [Document(page_content=t, metadata={"chunk_id": f"c{i}"}) for i, t in enumerate(texts)]
+
+
+def test_rerank_scores_top_n_in_batches_and_caches():
+    scorer = StubScorer()
+    reranker = Reranker(scorer, top_n=4, batch_size=2, budget=None)
+    docs = _docs(["a", "ccc", "bb", "dddd", "eeeee"])
+
+    reranked, n = reranker.rerank("q", docs)
+    assert n == 4
+    assert [d.page_content for d in reranked] == ["dddd", "ccc", "bb", "a", "eeeee"]
+    assert reranked[0].metadata["rerank_score"] == 4.0
+    assert "rerank_score" not in docs[3].metadata
+    assert [len(b) for b in scorer.batches] == [2, 2]
+
+    reranker.rerank(" q ", docs)
+    assert len(scorer.batches) == 2
+
+
+def test_rerank_budget_truncates_to_scored_prefix():
+    scorer = StubScorer(delay=0.05)
+    reranker = Reranker(scorer, top_n=6, batch_size=2, budget=0.06)
+    docs = _docs(["a", "bb", "ccc", "dddd", "eeeee", "ffffff"])
+
+    reranked, n = reranker.rerank("q", docs)
+    assert n == 2
+    assert [d.page_content for d in reranked] == ["bb", "a", "ccc", "dddd", "eeeee", "ffffff"]
+
+
+def test_rerank_budget_applies_to_first_batch_after_warmup():
+    scorer = StubScorer(delay=0.05)
+    reranker = Reranker(scorer, top_n=6, batch_size=2, budget=0.03)
+    reranker.warmup()
+    assert reranker.doc_cost is not None and reranker.doc_cost >= 0.025
+    warmup_calls = len(scorer.batches)
+    docs = _docs(["a", "bb", "ccc", "dddd", "eeeee", "ffffff"])
+
+    # 预计一整批（约 50ms）超出 30ms 的预算：第一批缩小为 1 个文档块
+    reranked, n = reranker.rerank("q", docs)
+    assert n == 1 and [len(b) for b in scorer.batches[warmup_calls:]] == [1]
+
+    # 一个文档块也放不下时不打分，保持融合顺序
+    reranker.budget = 0.01
+    reranked, n = reranker.rerank("other", docs)
+    assert n == 0 and [d.page_content for d in reranked] == [d.page_content for d in docs]
+
+
+def test_hybrid_search_applies_reranker(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule]
+):
+    data, index = rag_modules
+    retrieval = RetrievalOptimizationModule(
+        vectorstore=index.vectorstore,
+        chunks=data.chunks,
+        reranker=Reranker(StubScorer(), top_n=len(data.chunks), budget=None),
+    )
+
+    docs = retrieval.hybrid_search("dropout", top_k=3)
+    scores = [d.metadata["rerank_score"] for d in docs]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == max(len(c.page_content) for c in data.chunks)
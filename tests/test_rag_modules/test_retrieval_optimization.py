@@ -0,0 +1,246 @@
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from blog_rag.rag_modules import (
+    DataPreparationModule,
+    IndexConstructionModule,
+    RetrievalOptimizationModule,
+)
+from blog_rag.rag_modules.cache import LRUCache
+from blog_rag.rag_modules.retrieval_optimization import StaleVectorIndexError
+from blog_rag.rag_modules.bm25_index import BM25Index, resolve_tokenizer
+from blog_rag.rag_modules.query_batcher import QueryEmbeddingBatcher, embed_queries
+
+
+def test_query_embedding_cache_shared_by_searches(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule], fake_embeddings
+):
+    data, index = rag_modules
+    retrieval = RetrievalOptimizationModule(vectorstore=index.vectorstore, chunks=data.chunks)
+
+    assert retrieval.hybrid_search("Dropout", top_k=3)
+    retrieval.hybrid_search("  dropout ", top_k=3)
+    retrieval.metadata_filtered_search("ｄｒｏｐｏｕｔ", {}, top_k=3)
+
+    assert fake_embeddings.query_calls == ["Dropout"]
+    assert retrieval.query_cache.stats()["hits"] == 2
+
+
+def test_legacy_index_with_uuid_docstore_ids_is_mapped_by_chunk_id(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule], fake_embeddings, tmp_path
+):
+    data, index = rag_modules
+    # 旧版本直接以 FAISS.from_documents 构建，docstore ID 为随机 UUID
+    legacy = FAISS.from_documents(list(data.chunks), fake_embeddings)
+    legacy.save_local(str(tmp_path / "legacy" / "faiss_index"))
+    loaded = index.load_vector_index(source_dir=tmp_path / "legacy")
+    assert loaded is not None
+    assert not set(loaded.index_to_docstore_id.values()) & {c.metadata["chunk_id"] for c in data.chunks}
+
+    retrieval = RetrievalOptimizationModule(vectorstore=loaded, chunks=data.chunks)
+    positions, _ = retrieval._vector_search("dropout", 5)
+
+    expected = [doc.metadata["chunk_id"] for doc in loaded.similarity_search("dropout", k=5)]
+    assert [data.chunks[i].metadata["chunk_id"] for i in positions] == expected
+
+
+def test_unmappable_vector_index_requires_rebuild(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule], fake_embeddings
+):
+    data, _ = rag_modules
+    stale = FAISS.from_texts(["dropout", "attention"], fake_embeddings)
+
+    with pytest.raises(StaleVectorIndexError):
+        RetrievalOptimizationModule(vectorstore=stale, chunks=data.chunks)
+
+
+def test_lru_cache_expires_entries():
+    cache: LRUCache[int] = LRUCache(max_entries=2, ttl=0.01)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_hybrid_search_degrades_when_a_leg_is_slow(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule]
+):
+    data, index = rag_modules
+    retrieval = RetrievalOptimizationModule(
+        vectorstore=index.vectorstore, chunks=data.chunks, leg_timeout=0.2
+    )
+    retrieval._bm25_search = lambda query, k, candidates=None: time.sleep(1) or ([], [])  # type: ignore[method-assign]
+
+    start = time.monotonic()
+    docs = retrieval.hybrid_search("dropout", top_k=3)
+
+    assert time.monotonic() - start < 0.8
+    vector_ids, _ = retrieval._vector_search("dropout", 5)
+    assert [d.page_content for d in docs] == [data.chunks[i].page_content for i in vector_ids[:3]]
+
+
+def test_private_executor_is_closed_with_module(
+    rag_modules: Tuple[DataPreparationModule, IndexConstructionModule]
+):
+    data, index = rag_modules
+    shared = ThreadPoolExecutor(max_workers=2)
+    injected = RetrievalOptimizationModule(vectorstore=index.vectorstore, chunks=data.chunks, executor=shared)
+    private = RetrievalOptimizationModule(vectorstore=index.vectorstore, chunks=data.chunks)
+
+    injected.close()
+    private.close()
+
+    assert shared.submit(lambda: 1).result() == 1
+    expected = [d.page_content for d in injected.hybrid_search("dropout", top_k=3)]
+    shared.shutdown()
+    # 仍持有已关闭模块的查询在当前线程中完成
+    assert [d.page_content for d in private.hybrid_search("dropout", top_k=3)] == expected
+
+
+def test_query_batcher_merges_concurrent_queries(fake_embeddings):
+    batcher = QueryEmbeddingBatcher(
+        lambda texts: embed_queries(fake_embeddings, texts), window=0.05, max_batch=8
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            vectors = list(pool.map(batcher.embed, ["attention", "dropout", "attention", "llm"]))
+    finally:
+        batcher.close()
+
+    assert batcher.batches == 1
+    assert fake_embeddings.document_calls and len(fake_embeddings.document_calls[0]) == 3
+    assert vectors[0] == vectors[2] == fake_embeddings.embed_query("attention")
+
+
+def test_query_batcher_after_close_embeds_directly(fake_embeddings):
+    batcher = QueryEmbeddingBatcher(lambda texts: embed_queries(fake_embeddings, texts))
+    batcher.close()
+
+    assert batcher.closed
+    assert batcher.embed("dropout") == fake_embeddings.embed_query("dropout")
+    assert batcher.batches == 0
+
+
+def test_query_batcher_times_out_instead_of_blocking(fake_embeddings):
+    release = threading.Event()
+
+    def slow_embed(texts):
+        release.wait(5)
+        return embed_queries(fake_embeddings, texts)
+
+    batcher = QueryEmbeddingBatcher(slow_embed, timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.embed("dropout")
+    finally:
+        release.set()
+        batcher.close()
+
+
+def test_bm25_index_matches_chinese_terms_and_reloads(tmp_path):
+    texts = ["使用因果注意力机制来屏蔽后续词", "使用 dropout 遮掩额外的注意力权重", "其它内容"]
+    index = BM25Index.build(texts, fingerprint="v1")
+    index.save(tmp_path)
+
+    loaded = BM25Index.load(tmp_path, fingerprint="v1")
+    assert loaded is not None
+    assert isinstance(loaded.doc_ids, np.memmap)
+    assert [i for i, _ in loaded.search("注意力", k=5)] == [i for i, _ in index.search("注意力", k=5)]
+    assert {i for i, _ in loaded.search("注意力", k=5)} == {0, 1}
+    assert loaded.search("Dropout", k=5)[0][0] == 1
+    assert BM25Index.load(tmp_path, fingerprint="v2") is None
+
+
+def test_bm25_index_records_tokenizer_actually_used(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "jieba", None)
+    resolve_tokenizer.cache_clear()
+    try:
+        index = BM25Index.build(["注意力机制"], tokenizer="jieba")
+        index.save(tmp_path)
+        assert index.tokenizer_name == "cjk_bigram"
+        assert BM25Index.compute_fingerprint(["c0"], "jieba") == BM25Index.compute_fingerprint(["c0"], "cjk_bigram")
+        assert json.loads((tmp_path / "meta.json").read_text(encoding="utf-8"))["tokenizer"] == "cjk_bigram"
+        assert not list(tmp_path.glob("*.tmp*"))
+    finally:
+        resolve_tokenizer.cache_clear()
+
+
+def test_bm25_save_does_not_overwrite_mapped_files(tmp_path):
+    BM25Index.build(["注意力 机制", "dropout"], fingerprint="v1").save(tmp_path)
+    loaded = BM25Index.load(tmp_path, fingerprint="v1")
+    assert loaded is not None
+    before = loaded.search("dropout", k=1)
+
+    BM25Index.build(["dropout 与 注意力", "卷积", "dropout"], fingerprint="v2").save(tmp_path)
+
+    assert loaded.search("dropout", k=1) == before
+    reloaded = BM25Index.load(tmp_path, fingerprint="v2")
+    assert reloaded is not None and reloaded.n_docs == 3
+
+
+def test_metadata_filtered_search_is_exact_for_selective_tags(fake_embeddings):
+    chunks = [
+        Document(
+            page_content=f"注意力 dropout 段落{i}",
+            metadata={"chunk_id": f"c{i}", "categories": ["tech"], "tags": ["llm", "rare"] if i % 7 == 0 else ["llm"]},
+        )
+        for i in range(50)
+    ]
+    vectorstore = FAISS.from_documents(chunks, fake_embeddings, ids=[c.metadata["chunk_id"] for c in chunks])
+    retrieval = RetrievalOptimizationModule(vectorstore=vectorstore, chunks=chunks)
+
+    rare = retrieval.metadata_filtered_search("dropout", {"tags": ["rare"]}, top_k=5)
+    assert len(rare) == 5
+    assert all("rare" in doc.metadata["tags"] for doc in rare)
+
+    both = retrieval.metadata_filtered_search("dropout", {"tags": ["llm", "rare"]}, top_k=5, match="all")
+    assert {doc.metadata["chunk_id"] for doc in both} == {doc.metadata["chunk_id"] for doc in rare}
+    assert retrieval.metadata_filtered_search("dropout", {"categories": ["life"]}, top_k=10) == []
+
+
+def test_bm25_scores_external_documents_like_indexed_ones():
+    texts = ["dropout 正则化", "卷积 神经网络", "注意力机制 transformer", "dropout 与 batch norm"]
+    index = BM25Index.build(texts)
+    tokens = [index.tokenize(text) for text in texts]
+    external = index.score_documents(
+        "dropout 神经网络", [dict(Counter(t)) for t in tokens], np.array([len(t) for t in tokens]))
+    np.testing.assert_allclose(external, index.get_scores("dropout 神经网络"), rtol=1e-6)
+    # 被排除的文档不参与排序
+    assert index.top_k("dropout", 5, exclude=np.array([0]))[0].tolist() == [3]
+
+
+def test_bm25_top_k_scores_only_posting_union():
+    rng = np.random.default_rng(0)
+    words = ["dropout", "attention", "卷积", "梯度", "transformer", "embedding", "loss", "batch"]
+    texts = [" ".join(rng.choice(words, size=6)) for _ in range(200)] + ["unrelated"] * 50
+    index = BM25Index.build(texts)
+    query = "dropout 梯度 梯度 loss"
+
+    docs, scores = index.sparse_scores(query)
+    dense = index.get_scores(query)
+    assert len(docs) < index.n_docs and np.all(np.diff(docs) > 0)
+    assert set(np.flatnonzero(dense)) == set(docs.tolist())
+    np.testing.assert_allclose(scores, dense[docs], rtol=1e-6)
+
+    candidates = np.arange(0, 250, 3)
+    exclude = np.arange(0, 40)
+    for kwargs in ({}, {"candidates": candidates}, {"exclude": exclude}):
+        expected = dense.copy()
+        if "candidates" in kwargs:
+            expected[np.setdiff1d(np.arange(index.n_docs), candidates)] = 0
+        if "exclude" in kwargs:
+            expected[exclude] = 0
+        ids, top_scores = index.top_k(query, 10, **kwargs)
+        np.testing.assert_allclose(top_scores, np.sort(expected)[::-1][:10], rtol=1e-6)
+        np.testing.assert_allclose(expected[ids], top_scores, rtol=1e-6)